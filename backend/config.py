@@ -11,6 +11,67 @@ FERNET_SECRET_KEY=os.getenv("FERNET_SECRET_KEY")
 FRONTEND_ORIGINS=os.getenv("FRONTEND_ORIGINS")
 ANTHROPIC_API_KEY=os.getenv("ANTHROPIC_API_KEY")
 FRONTEND_URL=os.getenv("FRONTEND_URL")
+TOKEN_REFRESH_MARGIN_SECONDS=int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+# Background sync deduplication
+SYNC_FRESHNESS_TTL_SECONDS=int(os.getenv("SYNC_FRESHNESS_TTL_SECONDS", "600"))
+SYNC_FAILURE_COOLDOWN_SECONDS=int(os.getenv("SYNC_FAILURE_COOLDOWN_SECONDS", "60"))
+LIKED_SONGS_RECONCILE_HOURS=int(os.getenv("LIKED_SONGS_RECONCILE_HOURS", "168"))
+
+# Background job queue (python worker.py runs the workers; the API runs them in-process unless disabled)
+JOB_WORKER_IN_PROCESS=os.getenv("JOB_WORKER_IN_PROCESS", "true").lower() == "true"
+JOB_WORKER_CONCURRENCY=int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_LEASE_SECONDS=int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_POLL_INTERVAL_SECONDS=float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_MAX_ATTEMPTS=int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS=float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "30"))
+JOB_WAIT_TIMEOUT_SECONDS=float(os.getenv("JOB_WAIT_TIMEOUT_SECONDS", "60"))
+JOB_RETENTION_HOURS=int(os.getenv("JOB_RETENTION_HOURS", "168"))
+
+# Sync progress stream (SSE)
+SYNC_PROGRESS_POLL_SECONDS=float(os.getenv("SYNC_PROGRESS_POLL_SECONDS", "1"))
+SYNC_PROGRESS_HEARTBEAT_SECONDS=float(os.getenv("SYNC_PROGRESS_HEARTBEAT_SECONDS", "15"))
+
+# Shared Spotify HTTP client (connection pool, keep-alive, timeouts)
+SPOTIFY_HTTP2=os.getenv("SPOTIFY_HTTP2", "false").lower() == "true"
+SPOTIFY_MAX_CONNECTIONS=int(os.getenv("SPOTIFY_MAX_CONNECTIONS", "100"))
+SPOTIFY_MAX_KEEPALIVE_CONNECTIONS=int(os.getenv("SPOTIFY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+SPOTIFY_KEEPALIVE_EXPIRY=float(os.getenv("SPOTIFY_KEEPALIVE_EXPIRY", "30"))
+SPOTIFY_TIMEOUT=float(os.getenv("SPOTIFY_TIMEOUT", "15"))
+SPOTIFY_CONNECT_TIMEOUT=float(os.getenv("SPOTIFY_CONNECT_TIMEOUT", "5"))
+SPOTIFY_USER_CONCURRENCY=int(os.getenv("SPOTIFY_USER_CONCURRENCY", "5"))
+
+# Spotify request scheduler (app-wide rate limit, retries)
+SPOTIFY_RATE_LIMIT_PER_SECOND=float(os.getenv("SPOTIFY_RATE_LIMIT_PER_SECOND", "10"))
+SPOTIFY_RATE_LIMIT_BURST=int(os.getenv("SPOTIFY_RATE_LIMIT_BURST", "20"))
+SPOTIFY_MAX_RETRIES=int(os.getenv("SPOTIFY_MAX_RETRIES", "4"))
+SPOTIFY_BACKOFF_BASE=float(os.getenv("SPOTIFY_BACKOFF_BASE", "0.5"))
+SPOTIFY_BACKOFF_MAX=float(os.getenv("SPOTIFY_BACKOFF_MAX", "30"))
+# Artist genres fetched from /v1/artists are reused for this long before being fetched again
+SPOTIFY_ARTIST_CACHE_DAYS=int(os.getenv("SPOTIFY_ARTIST_CACHE_DAYS", "30"))
+
+# Track enrichment (Anthropic) settings
+ANTHROPIC_MODEL=os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
+ENRICHMENT_CONCURRENCY=int(os.getenv("ENRICHMENT_CONCURRENCY", "10"))
+ENRICHMENT_BATCH_SIZE=int(os.getenv("ENRICHMENT_BATCH_SIZE", "25"))
+LLM_MAX_CONNECTIONS=int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_RETRIES=int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_TIMEOUT=float(os.getenv("LLM_TIMEOUT", "30"))
+# Script-based languages at or above this confidence are stored without asking the model
+LANGUAGE_DETECT_MIN_CONFIDENCE=float(os.getenv("LANGUAGE_DETECT_MIN_CONFIDENCE", "0.9"))
+# A track takes its primary artist's genre without a model call once the artist has this many enriched
+# tracks and this share of them agree
+ARTIST_INDEX_MIN_TRACKS=int(os.getenv("ARTIST_INDEX_MIN_TRACKS", "3"))
+ARTIST_INDEX_MIN_SHARE=float(os.getenv("ARTIST_INDEX_MIN_SHARE", "0.8"))
+ENRICHMENT_CACHE_SIZE=int(os.getenv("ENRICHMENT_CACHE_SIZE", "50000"))
+
+# Public contributor profiles shown next to enriched tracks
+PROFILE_CACHE_TTL_SECONDS=int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+PROFILE_CACHE_SIZE=int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+# Read endpoint ETags and serialized body cache (TTL 0 disables the body cache)
+RESPONSE_CACHE_TTL_SECONDS=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_SIZE=int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
 
 # Configure logging
 logging.getLogger("uvicorn.access").handlers = []  # Remove default handlers
@@ -0,0 +1,164 @@
+"""Artist-level genre propagation.
+
+Tracks by one artist almost always land in the same genre bucket, so every
+model classification that gets committed is also counted against the track's
+artists (database/artist_genres_db.py). Once a track's primary artist has enough
+enriched tracks and a clear majority genre, the track takes that genre (and the
+artist's majority language, unless its script already gave one away) without a
+model call. Propagated values are stored with enrichment_source "artist_index"
+so they can be audited, and they are never counted back into the index.
+
+The index learns from enrichments with source "model" and "spotify" (Spotify's
+artist genres), plus older enrichments stored before sources were recorded.
+rebuild_artist_index() recounts it from every enriched track already stored;
+queue it with `python worker.py --rebuild-artist-index`.
+"""
+from config import ARTIST_INDEX_MIN_TRACKS, ARTIST_INDEX_MIN_SHARE
+from database.artist_genres_db import (
+    artist_key,
+    db_add_artist_observations,
+    db_get_artist_distributions,
+    db_replace_artist_distributions
+)
+from database.database import tracks_collection
+from .language_detect import LANGUAGE_SOURCE_SCRIPT
+from .spotify_artists import ENRICHMENT_SOURCE_SPOTIFY
+
+ENRICHMENT_SOURCE_ARTIST_INDEX = "artist_index"
+ENRICHMENT_SOURCE_MODEL = "model"
+# Sources the index learns from; its own propagations would only reinforce themselves
+INDEXED_SOURCES = (ENRICHMENT_SOURCE_MODEL, ENRICHMENT_SOURCE_SPOTIFY)
+
+_stats = {
+    "lookups": 0,
+    "propagated": 0,
+    "observations": 0
+}
+
+def _majority(counts, total):
+    """(value, share) of the most common value, or (None, 0) when there are no counts."""
+    if not counts or not total:
+        return None, 0
+    value, count = max(counts.items(), key=lambda item: item[1])
+    return value, count / total
+
+def artist_prediction(distribution):
+    """{"genre", "subgenre", "language"} when the artist's tracks agree on a genre, else None.
+
+    subgenre and language are only set when they clear the same share on their own.
+    """
+    total = (distribution or {}).get("tracks", 0)
+    if total < ARTIST_INDEX_MIN_TRACKS:
+        return None
+    genre, share = _majority(distribution.get("genres"), total)
+    if genre is None or share < ARTIST_INDEX_MIN_SHARE:
+        return None
+
+    genre_total = distribution["genres"][genre]
+    in_genre = {
+        key.split("|", 1)[1]: count
+        for key, count in (distribution.get("subgenres") or {}).items()
+        if key.split("|", 1)[0] == genre
+    }
+    subgenre, subgenre_share = _majority(in_genre, genre_total)
+    language, language_share = _majority(distribution.get("languages"), total)
+    return {
+        "genre": genre,
+        "subgenre": subgenre if subgenre_share >= ARTIST_INDEX_MIN_SHARE else "",
+        "language": language if language_share >= ARTIST_INDEX_MIN_SHARE else None
+    }
+
+async def predict_from_artists(tracks):
+    """{track_spotify_id: classification details} for the tracks the artist index can classify on its own.
+
+    A track needs a confident genre from its primary artist and a language, either
+    detected from its script at ingest or the artist's confident majority.
+    """
+    primary_artists = {
+        track["track_spotify_id"]: track["track_artists"][0]
+        for track in tracks
+        if track.get("track_spotify_id") and track.get("track_artists")
+    }
+    if not primary_artists:
+        return {}
+    _stats["lookups"] += len(primary_artists)
+    try:
+        distributions = await db_get_artist_distributions(primary_artists.values())
+    except Exception as e:
+        print(f"Artist index lookup failed: {str(e)}")
+        return {}
+
+    predictions = {}
+    for track in tracks:
+        artist = primary_artists.get(track.get("track_spotify_id"))
+        prediction = artist_prediction(distributions.get(artist_key(artist))) if artist else None
+        if not prediction:
+            continue
+        script_language = track.get("track_language") if track.get("language_source") == LANGUAGE_SOURCE_SCRIPT else None
+        language = script_language or prediction["language"]
+        if not language:
+            continue
+        predictions[track["track_spotify_id"]] = {
+            "language": language,
+            "genre": prediction["genre"],
+            "subgenre": prediction["subgenre"],
+            "source": ENRICHMENT_SOURCE_ARTIST_INDEX,
+            "language_source": LANGUAGE_SOURCE_SCRIPT if script_language else ENRICHMENT_SOURCE_ARTIST_INDEX
+        }
+    _stats["propagated"] += len(predictions)
+    return predictions
+
+def _observations(artists, enrichment):
+    genre, subgenre = ((enrichment.get("track_genre") or []) + ["", ""])[:2]
+    return [(artist, genre, subgenre, enrichment.get("track_language")) for artist in artists or []]
+
+async def record_artist_genres(tracks, enrichments):
+    """Count committed classifications from INDEXED_SOURCES against every artist of each track.
+
+    `enrichments` maps track_spotify_id to the stored enrichment fields; propagated
+    values are skipped. Best effort.
+    """
+    observations = []
+    for track in tracks:
+        enrichment = enrichments.get(track.get("track_spotify_id"))
+        if not enrichment or enrichment.get("enrichment_source") not in INDEXED_SOURCES:
+            continue
+        observations.extend(_observations(track.get("track_artists"), enrichment))
+    if not observations:
+        return
+    try:
+        await db_add_artist_observations(observations)
+        _stats["observations"] += len(observations)
+    except Exception as e:
+        print(f"Failed to update the artist index: {str(e)}")
+
+async def rebuild_artist_index():
+    """Recount the whole index from the enriched tracks in the database (one aggregation, one row per track)."""
+    tracks = tracks_collection.aggregate([
+        # Enrichments stored before sources were recorded have no enrichment_source and came from the model
+        {"$match": {"is_enriched": True, "enrichment_source": {"$in": [*INDEXED_SOURCES, None]}}},
+        # Every copy of a track carries the same enrichment; count each track once
+        {"$group": {
+            "_id": "$track_spotify_id",
+            "track_artists": {"$first": "$track_artists"},
+            "track_genre": {"$first": "$track_genre"},
+            "track_language": {"$first": "$track_language"}
+        }}
+    ], allowDiskUse=True)
+    observations = []
+    track_count = 0
+    async for track in tracks:
+        track_count += 1
+        observations.extend(_observations(track.get("track_artists"), track))
+    artists = await db_replace_artist_distributions(observations)
+    return {
+        "success": True,
+        "message": "Artist index rebuilt",
+        "details": {"tracks": track_count, "artists": artists}
+    }
+
+def artist_index_stats():
+    return {
+        **_stats,
+        "propagation_rate": round(_stats["propagated"] / _stats["lookups"], 4) if _stats["lookups"] else 0.0
+    }
@@ -1,8 +1,8 @@
 from fastapi.responses import RedirectResponse # HTTP response that redirects the user to another URL
 from urllib.parse import urlencode # converts a dictionary into a properly formated url query string
-import httpx
 from config import REDIRECT_URI, CLIENT_ID, CLIENT_SECRET
 
+from .spotify_scheduler import spotify_request
 from .user import spotify_users_workflow
 from .playlist import spotify_playlists_workflow
 from .tracks import spotify_tracks_workflow
@@ -41,8 +41,8 @@ async def spotify_callback_code(code: str):
         }
 
         # Sending all the data to the token_url through a POST request to received the access token
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, data=data, headers=headers)
+        # The authorization code is single-use: never resend it after a 5xx or a lost response
+        response = await spotify_request("POST", token_url, retry=False, data=data, headers=headers)
 
         # Return if faced with any error
         if response.status_code!=200:
@@ -58,7 +58,7 @@ async def spotify_callback_code(code: str):
         access_token = tokens["access_token"]
 
         # Spotify USER details added to database
-        response = await spotify_users_workflow(access_token, refresh_token)
+        response = await spotify_users_workflow(access_token, refresh_token, int(tokens.get("expires_in", 3600)))
 
         if response["success"]:
             return response["details"]
@@ -74,11 +74,10 @@ async def spotify_callback_code(code: str):
     
 async def spotify_fetch_and_store_user_playlists(spotify_user_id: str):
     try:
-        user_cursor = await users_collection.find_one({"spotify_user_id": spotify_user_id})
+        user_cursor = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"_id": 1})
         if not user_cursor:
             raise Exception("User not found")
-        access_token = user_cursor["access_token"]
-        response = await spotify_playlists_workflow(access_token)
+        response = await spotify_playlists_workflow(spotify_user_id)
         if response["success"]:
             return response
         else:
@@ -0,0 +1,416 @@
+import anthropic
+import asyncio
+import httpx
+from collections import Counter
+import json
+import re
+
+from config import (
+    ANTHROPIC_API_KEY,
+    ANTHROPIC_MODEL,
+    ENRICHMENT_BATCH_SIZE,
+    ENRICHMENT_CONCURRENCY,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_RETRIES,
+    LLM_TIMEOUT
+)
+from database.genres import SUBGENRES, GENRES
+from .enrichment_cache import get_cached_classifications, store_classifications
+from .artist_index import predict_from_artists
+from .language_detect import LANGUAGE_SOURCE_SCRIPT
+from .spotify_artists import get_cached_artist_genres, ENRICHMENT_SOURCE_SPOTIFY
+
+# Long-lived async Anthropic client, shared by every classification call
+_llm_client = None
+# Process-wide cap on in-flight model requests (created lazily inside the running loop)
+_llm_semaphore = None
+
+def _build_llm_client():
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=5.0)
+    )
+    return anthropic.AsyncAnthropic(
+        api_key=ANTHROPIC_API_KEY,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=http_client
+    )
+
+def get_llm_client():
+    """Return the shared async Anthropic client, creating it on first use."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = _build_llm_client()
+    return _llm_client
+
+async def close_llm_client():
+    """Close the shared Anthropic client. Called from the FastAPI lifespan."""
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.close()
+    _llm_client = None
+
+def _llm_slot():
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(ENRICHMENT_CONCURRENCY)
+    return _llm_semaphore
+
+async def run_in_pool(items, worker, concurrency=ENRICHMENT_CONCURRENCY):
+    """Run worker(item) for every item with at most `concurrency` running at once.
+
+    Results come back in the same order as items. Exceptions raised by the worker
+    are returned in place of the result so one bad item cannot sink the batch.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        queue.put_nowait((index, item))
+
+    async def consume():
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                results[index] = await worker(item)
+            except Exception as e:
+                results[index] = e
+
+    workers = max(1, min(concurrency, len(items)))
+    await asyncio.gather(*(consume() for _ in range(workers)))
+    return results
+
+def genre_from_spotify_genres(genre_lists):
+    """{"genre", "subgenre"} from artists' Spotify genre strings (primary artist first), or None.
+
+    The first artist with a genre that maps onto GENRES decides, by majority over its
+    genre strings; unmappable strings are ignored rather than defaulted.
+    """
+    for genres in genre_lists:
+        mapped = [(map_to_allowed_genre(genre, strict=True), genre) for genre in genres]
+        mapped = [(allowed, genre) for allowed, genre in mapped if allowed]
+        if not mapped:
+            continue
+        votes = Counter(allowed for allowed, _ in mapped)
+        # Counter keeps first-seen order, so ties go to the genre Spotify lists first
+        allowed_genre = max(votes, key=votes.get)
+        subgenre = next((
+            subgenre for subgenre in (
+                map_to_allowed_subgenre(allowed_genre, genre, strict=True)
+                for allowed, genre in mapped if allowed == allowed_genre
+            ) if subgenre
+        ), "")
+        return {"genre": allowed_genre, "subgenre": subgenre}
+    return None
+
+async def classify_tracks(tracks, batch_size=ENRICHMENT_BATCH_SIZE, use_model=True):
+    """Classify many tracks, consulting free sources before batched model prompts.
+
+    `tracks` is a list of dicts with track_spotify_id, track_name, track_artists,
+    track_album_name and, when known, track_artist_ids. Returns one
+    detect_song_language_genre_subgenre result per track, in order.
+
+    The genre comes from the artists' cached Spotify genres whenever they map onto
+    GENRES; a track whose language its script already gave away then needs nothing
+    else. The rest go through the enrichment cache, the artist index and finally the
+    model (whose genre Spotify's still overrides). With use_model=False the model is
+    skipped and unresolved tracks come back as failures.
+    """
+    # The same track can appear more than once (e.g. repeated in a playlist); classify it once
+    unique_tracks = {}
+    for track in tracks:
+        if track.get("track_spotify_id"):
+            unique_tracks.setdefault(track["track_spotify_id"], track)
+
+    spotify_genres = {}
+    for track_id, genre_lists in (await get_cached_artist_genres(list(unique_tracks.values()))).items():
+        genre = genre_from_spotify_genres(genre_lists)
+        if genre:
+            spotify_genres[track_id] = genre
+
+    classified = {
+        track_id: {
+            "success": True,
+            "message": "Song language, genre, and subgenre served from cache",
+            "details": details
+        }
+        for track_id, details in (await get_cached_classifications(list(unique_tracks.values()))).items()
+    }
+
+    pending = [track for track_id, track in unique_tracks.items() if track_id not in classified]
+    for track in pending:
+        track_id = track["track_spotify_id"]
+        if track_id in spotify_genres and track.get("language_source") == LANGUAGE_SOURCE_SCRIPT and track.get("track_language"):
+            classified[track_id] = {
+                "success": True,
+                "message": "Song genre from Spotify's artist genres, language from its script",
+                "details": {
+                    "language": track["track_language"],
+                    "language_source": LANGUAGE_SOURCE_SCRIPT,
+                    **spotify_genres[track_id],
+                    "source": ENRICHMENT_SOURCE_SPOTIFY
+                }
+            }
+    pending = [track for track in pending if track["track_spotify_id"] not in classified]
+    # Artists whose enriched tracks agree on a genre classify the rest of their tracks without the model
+    for track_id, details in (await predict_from_artists(pending)).items():
+        classified[track_id] = {
+            "success": True,
+            "message": "Song language, genre, and subgenre propagated from the artist index",
+            "details": details
+        }
+    pending = [track for track in pending if track["track_spotify_id"] not in classified]
+    if not use_model:
+        pending = []
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), max(1, batch_size))]
+
+    fresh = {}
+    for batch, batch_result in zip(batches, await run_in_pool(batches, detect_songs_language_genre_subgenre_batch)):
+        if isinstance(batch_result, dict):
+            fresh.update(batch_result)
+        else:
+            for track in batch:
+                fresh[track["track_spotify_id"]] = _classification_failure(batch_result)
+
+    await store_classifications(
+        pending,
+        {track_id: result["details"] for track_id, result in fresh.items() if result["success"]}
+    )
+    classified.update(fresh)
+
+    # Spotify's artist genres win over the cache, the artist index and the model; their language is kept
+    for track_id, genre in spotify_genres.items():
+        result = classified.get(track_id)
+        if result and result["success"] and result["details"].get("source") != ENRICHMENT_SOURCE_SPOTIFY:
+            classified[track_id] = {
+                **result,
+                "details": {**result["details"], **genre, "source": ENRICHMENT_SOURCE_SPOTIFY}
+            }
+
+    return [
+        classified.get(track.get("track_spotify_id")) or _classification_failure(
+            "Not classified without the model" if track.get("track_spotify_id") else "Missing track_spotify_id"
+        )
+        for track in tracks
+    ]
+
+async def detect_song_language_genre_subgenre(track_name, track_artists, track_album_name):
+    try:
+        # Input validation
+        if not track_name or not track_artists or not track_album_name:
+            raise ValueError("track_name, track_artists, and track_album_name must all be provided.")
+
+        artists = ", ".join(track_artists)
+        client = get_llm_client()
+
+        # Step 1: Get initial classification without constraints (shorter prompt)
+        async with _llm_slot():
+            response = await client.messages.create(
+                model=ANTHROPIC_MODEL,
+                max_tokens=80,
+                temperature=0.1,
+                system="You are a music expert. Detect the language, main genre, and specific subgenre of songs.",
+                messages=[
+                    {"role": "user", "content": f"For the song '{track_name}' by {artists} from '{track_album_name}', return JSON with: language (full English name), genre (main category like Pop, Rock, Hip Hop, etc.), subgenre (specific style). Format: {{\"language\": \"...\", \"genre\": \"...\", \"subgenre\": \"...\"}}"}
+                ]
+            )
+
+        # Parse response
+        raw_result = None
+        if hasattr(response, "content") and response.content:
+            for block in response.content:
+                if hasattr(block, "text"):
+                    json_str = block.text.strip()
+                    if json_str.startswith('```'):
+                        match = re.search(r"```json\n(.*?)\n```", json_str, re.DOTALL)
+                        json_str = match.group(1).strip() if match else json_str
+                    
+                    try:
+                        raw_result = json.loads(json_str)
+                        break
+                    except:
+                        continue
+
+        if not raw_result:
+            raise ValueError("Could not parse API response")
+
+        # Step 2: Map to your allowed genres/subgenres
+        return _classification_result(raw_result)
+    except Exception as e:
+        return _classification_failure(e)
+
+def _classification_result(raw_result):
+    detected_genre = str(raw_result.get("genre") or "").strip()
+    detected_subgenre = str(raw_result.get("subgenre") or "").strip()
+
+    # Map to closest allowed genre
+    mapped_genre = map_to_allowed_genre(detected_genre)
+    mapped_subgenre = map_to_allowed_subgenre(mapped_genre, detected_subgenre)
+
+    return {
+        "success": True,
+        "message": "Song language, genre, and subgenre detected successfully",
+        "details": {
+            "language": str(raw_result.get("language") or ""),
+            "genre": mapped_genre,
+            "subgenre": mapped_subgenre
+        }
+    }
+
+def _classification_failure(error):
+    return {
+        "success": False,
+        "message": "Failed to work on song language/genre detection",
+        "details": str(error)
+    }
+
+def _parse_batch_response(response, expected_ids):
+    """Pull the JSON array out of a batch reply and keep only well-formed items we asked for."""
+    parsed = {}
+    if not (hasattr(response, "content") and response.content):
+        return parsed
+    for block in response.content:
+        if not hasattr(block, "text"):
+            continue
+        text = block.text.strip()
+        # The model sometimes wraps the array in a code fence or adds a sentence around it
+        start, end = text.find("["), text.rfind("]")
+        if start == -1 or end <= start:
+            continue
+        try:
+            items = json.loads(text[start:end + 1])
+        except ValueError:
+            continue
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            item_id = str(item.get("id", ""))
+            if item_id not in expected_ids or item_id in parsed:
+                continue
+            if not all(isinstance(item.get(field), str) for field in ("language", "genre", "subgenre")):
+                continue
+            parsed[item_id] = item
+        if parsed:
+            break
+    return parsed
+
+async def detect_songs_language_genre_subgenre_batch(tracks):
+    """Classify several tracks with a single model request.
+
+    `tracks` is a list of dicts with track_spotify_id, track_name, track_artists and
+    track_album_name. Returns {track_spotify_id: result} where each result has the same
+    shape as detect_song_language_genre_subgenre. Items the model leaves out or returns
+    malformed are split off and retried on their own; a single leftover track falls
+    back to the one-track prompt. A request that fails outright (the client has already
+    retried it) fails the whole batch instead of being split into more requests.
+    """
+    tracks = [track for track in tracks if track.get("track_spotify_id")]
+    if not tracks:
+        return {}
+    if len(tracks) == 1:
+        track = tracks[0]
+        return {
+            track["track_spotify_id"]: await detect_song_language_genre_subgenre(
+                track.get("track_name"),
+                track.get("track_artists"),
+                track.get("track_album_name")
+            )
+        }
+
+    lines = []
+    for track in tracks:
+        lines.append(json.dumps({
+            "id": track["track_spotify_id"],
+            "song": track.get("track_name") or "",
+            "artists": ", ".join(track.get("track_artists") or []),
+            "album": track.get("track_album_name") or ""
+        }, ensure_ascii=False))
+
+    results = {}
+    try:
+        client = get_llm_client()
+        async with _llm_slot():
+            response = await client.messages.create(
+                model=ANTHROPIC_MODEL,
+                max_tokens=60 * len(tracks) + 50,
+                temperature=0.1,
+                system="You are a music expert. Detect the language, main genre, and specific subgenre of songs.",
+                messages=[
+                    {"role": "user", "content": "Classify each song below. Reply with only a JSON array containing one object per song: {\"id\": \"<id from the input>\", \"language\": \"<full English name>\", \"genre\": \"<main category>\", \"subgenre\": \"<specific style>\"}.\n" + "\n".join(lines)}
+                ]
+            )
+        parsed = _parse_batch_response(response, {track["track_spotify_id"] for track in tracks})
+    except Exception as e:
+        print(f"Batch classification request failed for {len(tracks)} tracks: {str(e)}")
+        return {track["track_spotify_id"]: _classification_failure(e) for track in tracks}
+
+    for track_id, raw_result in parsed.items():
+        results[track_id] = _classification_result(raw_result)
+
+    # Split whatever failed to parse and retry only those items
+    leftovers = [track for track in tracks if track["track_spotify_id"] not in results]
+    if leftovers:
+        if len(leftovers) == len(tracks):
+            middle = len(leftovers) // 2
+            halves = [leftovers[:middle], leftovers[middle:]]
+        else:
+            halves = [leftovers]
+        for half in halves:
+            results.update(await detect_songs_language_genre_subgenre_batch(half))
+    return results
+
+def map_to_allowed_genre(detected_genre, strict=False):
+    """Closest genre in GENRES. strict=True (for Spotify's free-form genre strings) prefers the most
+    specific keyword, e.g. "k-pop boy group" is K-Pop, and returns None instead of the Pop fallback."""
+    detected_lower = detected_genre.lower()
+    
+    # Direct matches
+    for genre in GENRES:
+        if detected_lower == genre.lower():
+            return genre
+    
+    # Fuzzy matching
+    genre_mappings = {
+        "pop": "Pop", "rock": "Rock", "hip hop": "Hip Hop", "rap": "Hip Hop",
+        "r&b": "R&B", "rnb": "R&B", "country": "Country", "electronic": "Electronic",
+        "edm": "Electronic", "classical": "Classical", "jazz": "Jazz",
+        "reggae": "Reggae", "blues": "Blues", "latin": "Latin", "folk": "Folk",
+        "metal": "Metal", "punk": "Punk", "gospel": "Gospel", "world": "World",
+        "kpop": "K-Pop", "k-pop": "K-Pop", "afrobeat": "Afrobeats", 
+        "indie": "Indie", "alternative": "Alternative", "alt": "Alternative"
+    }
+    
+    keys = sorted(genre_mappings, key=len, reverse=True) if strict else genre_mappings
+    for key in keys:
+        if key in detected_lower:
+            return genre_mappings[key]
+    
+    return None if strict else "Pop"  # Default fallback
+
+def map_to_allowed_subgenre(genre, detected_subgenre, strict=False):
+    if genre not in SUBGENRES:
+        return ""
+    
+    allowed_subgenres = SUBGENRES[genre]
+    detected_lower = detected_subgenre.lower()
+    
+    # Direct match
+    for subgenre in allowed_subgenres:
+        if detected_lower == subgenre.lower():
+            return subgenre
+    
+    # Partial match (strict: every word of the subgenre, so "dance pop" isn't Indie Pop)
+    for subgenre in allowed_subgenres:
+        words = [word in detected_lower for word in subgenre.lower().split()]
+        if all(words) if strict else any(words):
+            return subgenre
+    
+    return ""  # No match found
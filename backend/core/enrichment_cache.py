@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from datetime import datetime
+import re
+
+from pymongo import UpdateOne
+
+from config import ENRICHMENT_CACHE_SIZE
+from database.database import enrichment_cache_collection
+
+# Front tier: in-process LRU of {cache key: {"language", "genre", "subgenre"}}
+_memory_cache = OrderedDict()
+_stats = {
+    "memory_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "writes": 0
+}
+
+def _normalize(value):
+    return re.sub(r"\s+", " ", str(value or "")).strip().casefold()
+
+def track_id_key(track_spotify_id):
+    return f"id:{track_spotify_id}"
+
+def track_metadata_key(track_name, track_artists, track_album_name):
+    """Fallback key for the same recording under another track id (re-releases, regional copies)."""
+    artists = ",".join(sorted(_normalize(artist) for artist in (track_artists or [])))
+    return f"meta:{_normalize(track_name)}|{artists}|{_normalize(track_album_name)}"
+
+def _track_keys(track):
+    keys = []
+    if track.get("track_spotify_id"):
+        keys.append(track_id_key(track["track_spotify_id"]))
+    if track.get("track_name"):
+        keys.append(track_metadata_key(track.get("track_name"), track.get("track_artists"), track.get("track_album_name")))
+    return keys
+
+def _remember(key, classification):
+    _memory_cache[key] = classification
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > ENRICHMENT_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+async def get_cached_classifications(tracks):
+    """Look tracks up in the LRU, then in Mongo for whatever the LRU missed.
+
+    Returns {track_spotify_id: {"language", "genre", "subgenre"}} for every hit.
+    """
+    found = {}
+    missing = []
+    for track in tracks:
+        track_id = track.get("track_spotify_id")
+        if not track_id or track_id in found:
+            continue
+        for key in _track_keys(track):
+            if key in _memory_cache:
+                _memory_cache.move_to_end(key)
+                found[track_id] = _memory_cache[key]
+                _stats["memory_hits"] += 1
+                break
+        else:
+            missing.append(track)
+
+    if missing:
+        keys = {key for track in missing for key in _track_keys(track)}
+        try:
+            documents = await enrichment_cache_collection.find(
+                {"_id": {"$in": list(keys)}},
+                {"language": 1, "genre": 1, "subgenre": 1}
+            ).to_list(length=None)
+        except Exception as e:
+            print(f"Enrichment cache lookup failed: {str(e)}")
+            documents = []
+        stored = {
+            document["_id"]: {
+                "language": document.get("language", ""),
+                "genre": document.get("genre", ""),
+                "subgenre": document.get("subgenre", "")
+            }
+            for document in documents
+        }
+        for track in missing:
+            track_keys = _track_keys(track)
+            hit = next((stored[key] for key in track_keys if key in stored), None)
+            if hit is None:
+                _stats["misses"] += 1
+                continue
+            _stats["db_hits"] += 1
+            found[track["track_spotify_id"]] = hit
+            for key in track_keys:
+                _remember(key, hit)
+
+    return found
+
+async def store_classifications(tracks, classifications):
+    """Save fresh model results in both tiers. `classifications` maps track_spotify_id to details."""
+    operations = []
+    now = datetime.utcnow()
+    for track in tracks:
+        classification = classifications.get(track.get("track_spotify_id"))
+        if not classification:
+            continue
+        value = {
+            "language": classification.get("language", ""),
+            "genre": classification.get("genre", ""),
+            "subgenre": classification.get("subgenre", "")
+        }
+        for key in _track_keys(track):
+            _remember(key, value)
+            operations.append(UpdateOne({"_id": key}, {"$set": {**value, "updated_at": now}}, upsert=True))
+
+    if not operations:
+        return
+    try:
+        await enrichment_cache_collection.bulk_write(operations, ordered=False)
+        _stats["writes"] += len(operations)
+    except Exception as e:
+        print(f"Enrichment cache write failed: {str(e)}")
+
+def enrichment_cache_stats():
+    lookups = _stats["memory_hits"] + _stats["db_hits"] + _stats["misses"]
+    hits = _stats["memory_hits"] + _stats["db_hits"]
+    return {
+        **_stats,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "memory_entries": len(_memory_cache)
+    }
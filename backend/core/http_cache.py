@@ -0,0 +1,94 @@
+"""ETag revalidation for read endpoints.
+
+An endpoint names the data version scopes its payload is built from (see
+database/versions_db.py) plus anything else the payload varies on. The ETag is a
+hash of the request and those versions, so a repeat request costs one version
+lookup: 304 when the client already has it, otherwise the serialized body from a
+short-lived in-process cache when another request just built it. Writers call
+db_bump_data_versions() for the scopes they change.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+
+import orjson
+from fastapi import Response
+
+from config import RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_SIZE
+from database.versions_db import db_get_data_versions
+
+CACHE_CONTROL = "private, no-cache"
+
+_body_cache = OrderedDict()  # etag -> (expires at, serialized body)
+_stats = {
+    "not_modified": 0,
+    "body_hits": 0,
+    "built": 0
+}
+
+def dumps(payload):
+    # Payloads are plain dicts from Mongo reads; orjson handles datetimes itself, ObjectIds fall back to str
+    return orjson.dumps(payload, default=str)
+
+def _etag(request, versions, vary):
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    source = "|".join([
+        request.url.path,
+        query,
+        ",".join(f"{scope}={version}" for scope, version in versions.items()),
+        ",".join(str(value) for value in vary)
+    ])
+    return f'W/"{hashlib.sha1(source.encode()).hexdigest()}"'
+
+def _matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def _cached_body(etag):
+    cached = _body_cache.get(etag)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+def _remember_body(etag, body):
+    if RESPONSE_CACHE_TTL_SECONDS <= 0:
+        return
+    _body_cache[etag] = (time.monotonic() + RESPONSE_CACHE_TTL_SECONDS, body)
+    _body_cache.move_to_end(etag)
+    while len(_body_cache) > RESPONSE_CACHE_SIZE:
+        _body_cache.popitem(last=False)
+
+async def cached_json_response(request, scopes, build, vary=()):
+    """Serve `await build()` with an ETag over `scopes` and `vary`; only successful payloads are validated."""
+    try:
+        versions = await db_get_data_versions(scopes)
+    except Exception as e:
+        # Without versions there is nothing safe to validate against; serve uncached
+        print(f"Failed to read data versions: {str(e)}")
+        return await build()
+    etag = _etag(request, versions, vary)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if _matches(request, etag):
+        _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    body = _cached_body(etag)
+    if body is not None:
+        _stats["body_hits"] += 1
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    payload = await build()
+    _stats["built"] += 1
+    response = Response(content=dumps(payload), media_type="application/json")
+    if isinstance(payload, dict) and payload.get("success"):
+        # Versions read before the build: a write during it only makes this ETag stale, never wrong
+        _remember_body(etag, response.body)
+        response.headers.update(headers)
+    return response
+
+def http_cache_stats():
+    return {**_stats, "cached_bodies": len(_body_cache)}
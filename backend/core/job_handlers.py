@@ -0,0 +1,32 @@
+"""Job types run by the workers; payload keys are the handlers' keyword arguments."""
+from .jobs import job_handler
+from .auth import spotify_fetch_and_store_user_playlists
+from .playlist import fetch_playlist_tracks_background
+from .tracks import fetch_and_store_liked_songs_tracks, repair_playlist_counters
+from .artist_index import rebuild_artist_index
+
+SYNC_PLAYLISTS_JOB = "sync_playlists"
+SYNC_PLAYLIST_TRACKS_JOB = "sync_playlist_tracks"
+SYNC_LIKED_SONGS_JOB = "sync_liked_songs"
+REPAIR_PLAYLIST_COUNTERS_JOB = "repair_playlist_counters"
+REBUILD_ARTIST_INDEX_JOB = "rebuild_artist_index"
+
+@job_handler(SYNC_PLAYLISTS_JOB)
+async def sync_playlists(spotify_user_id: str):
+    return await spotify_fetch_and_store_user_playlists(spotify_user_id)
+
+@job_handler(SYNC_PLAYLIST_TRACKS_JOB)
+async def sync_playlist_tracks(spotify_user_id: str, playlist_id: str):
+    return await fetch_playlist_tracks_background(spotify_user_id, playlist_id)
+
+@job_handler(SYNC_LIKED_SONGS_JOB)
+async def sync_liked_songs(spotify_user_id: str):
+    return await fetch_and_store_liked_songs_tracks(spotify_user_id)
+
+@job_handler(REPAIR_PLAYLIST_COUNTERS_JOB)
+async def repair_counters(spotify_user_id: str = None):
+    return await repair_playlist_counters(spotify_user_id)
+
+@job_handler(REBUILD_ARTIST_INDEX_JOB)
+async def rebuild_artists():
+    return await rebuild_artist_index()
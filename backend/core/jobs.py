@@ -0,0 +1,146 @@
+"""Mongo-backed background jobs.
+
+Jobs are documents in the jobs collection (see database/jobs_db.py). A worker
+leases the most urgent due job, keeps the lease alive while the handler runs and
+records the outcome; failures are retried with backoff until max_attempts. A job
+whose worker died is picked up again once its lease expires.
+
+Handlers are registered by job type with @job_handler and receive the job's
+payload as keyword arguments. They return the usual {"success", ...} dict and
+can call report_job_progress() to publish progress on the job document.
+"""
+import asyncio
+import os
+import random
+import socket
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+from config import (
+    JOB_WORKER_CONCURRENCY,
+    JOB_LEASE_SECONDS,
+    JOB_POLL_INTERVAL_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF_SECONDS,
+    JOB_WAIT_TIMEOUT_SECONDS
+)
+from database.jobs_db import (
+    JOB_SUCCEEDED,
+    JOB_FAILED,
+    db_enqueue_job,
+    db_get_job,
+    db_claim_job,
+    db_extend_job_lease,
+    db_update_job_progress,
+    db_finish_job,
+    db_retry_job
+)
+
+JOB_HANDLERS = {}
+
+_current_job_id = ContextVar("current_job_id", default=None)
+
+def job_handler(job_type):
+    def register(handler):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return register
+
+async def enqueue_job(job_type, payload, dedup_key=None, priority=0, max_attempts=JOB_MAX_ATTEMPTS):
+    return await db_enqueue_job(job_type, payload, dedup_key, priority, max_attempts)
+
+async def report_job_progress(**progress):
+    """Merge progress fields into the running job's document; a no-op outside a job."""
+    job_id = _current_job_id.get()
+    if job_id is None:
+        return
+    try:
+        await db_update_job_progress(job_id, progress)
+    except Exception as e:
+        print(f"Failed to report job progress: {str(e)}")
+
+async def wait_for_job(job_id, timeout=JOB_WAIT_TIMEOUT_SECONDS):
+    """Poll until the job finishes; returns the job document, or None on timeout."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await db_get_job(job_id)
+        if job is None or job["status"] in (JOB_SUCCEEDED, JOB_FAILED):
+            return job
+        if asyncio.get_running_loop().time() >= deadline:
+            return None
+        await asyncio.sleep(min(JOB_POLL_INTERVAL_SECONDS, 0.5))
+
+def _job_result(result):
+    """Scalar fields of a handler's result (and of its details dict); error lists can be arbitrarily large."""
+    if not isinstance(result, dict):
+        return None
+    scalars = lambda d: {key: value for key, value in d.items() if value is None or isinstance(value, (str, int, float, bool))}
+    summary = scalars(result)
+    if isinstance(result.get("details"), dict):
+        summary["details"] = scalars(result["details"])
+    return summary
+
+async def _keep_lease(job_id, worker_id):
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        if not await db_extend_job_lease(job_id, worker_id, JOB_LEASE_SECONDS):
+            print(f"Lost the lease on job {job_id}")
+            return
+
+async def _run_job(job, worker_id):
+    job_id = job["_id"]
+    if job["attempts"] > job.get("max_attempts", JOB_MAX_ATTEMPTS):
+        # Reclaimed after its last attempt's worker died
+        await db_finish_job(job_id, worker_id, False, error="Job lease expired on its final attempt")
+        return
+
+    handler = JOB_HANDLERS[job["job_type"]]
+    heartbeat = asyncio.create_task(_keep_lease(job_id, worker_id))
+    token = _current_job_id.set(job_id)
+    try:
+        result = await handler(**job.get("payload", {}))
+        succeeded = isinstance(result, dict) and result.get("success", False)
+        error = None if succeeded else str((result or {}).get("details") or (result or {}).get("message"))
+    except Exception as e:
+        result, succeeded, error = None, False, str(e)
+    finally:
+        _current_job_id.reset(token)
+        heartbeat.cancel()
+
+    if succeeded or job["attempts"] >= job.get("max_attempts", JOB_MAX_ATTEMPTS):
+        await db_finish_job(job_id, worker_id, succeeded, result=_job_result(result), error=error)
+    else:
+        delay = JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1) * random.uniform(0.5, 1.0)
+        await db_retry_job(job_id, worker_id, error, datetime.utcnow() + timedelta(seconds=delay))
+
+async def _worker_loop(worker_id, stop):
+    while not stop.is_set():
+        try:
+            job = await db_claim_job(worker_id, JOB_HANDLERS.keys(), JOB_LEASE_SECONDS)
+        except Exception as e:
+            print(f"Failed to claim a job: {str(e)}")
+            job = None
+
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _run_job(job, worker_id)
+        except Exception as e:
+            # The lease expires and another worker retries the job
+            print(f"Error running job {job['_id']}: {str(e)}")
+
+async def run_workers(stop, concurrency=JOB_WORKER_CONCURRENCY):
+    """Run `concurrency` job loops until `stop` is set; running jobs are finished first."""
+    # Registers the handlers
+    from . import job_handlers  # noqa: F401
+
+    worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+    await asyncio.gather(*(
+        _worker_loop(f"{worker_prefix}:{index}", stop)
+        for index in range(concurrency)
+    ))
@@ -0,0 +1,167 @@
+"""Offline language detection from the Unicode script of a track's title and album.
+
+Many languages are obvious from their writing system alone: Hangul is Korean,
+kana is Japanese, Gurmukhi is Punjabi. Scripts shared by several languages get a
+lower base confidence, refined by a few letters specific to one language (e.g.
+Ukrainian і/ї/є). Latin text says nothing reliable about the language and is
+left to the model.
+"""
+import unicodedata
+from bisect import bisect_right
+
+from config import LANGUAGE_DETECT_MIN_CONFIDENCE
+
+LANGUAGE_SOURCE_SCRIPT = "script"
+LANGUAGE_SOURCE_MODEL = "model"
+
+# (first code point, last code point, script), sorted by first code point
+_SCRIPT_RANGES = [
+    (0x0370, 0x03FF, "Greek"),
+    (0x0400, 0x052F, "Cyrillic"),
+    (0x0530, 0x058F, "Armenian"),
+    (0x0590, 0x05FF, "Hebrew"),
+    (0x0600, 0x06FF, "Arabic"),
+    (0x0750, 0x077F, "Arabic"),
+    (0x0780, 0x07BF, "Thaana"),
+    (0x08A0, 0x08FF, "Arabic"),
+    (0x0900, 0x097F, "Devanagari"),
+    (0x0980, 0x09FF, "Bengali"),
+    (0x0A00, 0x0A7F, "Gurmukhi"),
+    (0x0A80, 0x0AFF, "Gujarati"),
+    (0x0B00, 0x0B7F, "Oriya"),
+    (0x0B80, 0x0BFF, "Tamil"),
+    (0x0C00, 0x0C7F, "Telugu"),
+    (0x0C80, 0x0CFF, "Kannada"),
+    (0x0D00, 0x0D7F, "Malayalam"),
+    (0x0D80, 0x0DFF, "Sinhala"),
+    (0x0E00, 0x0E7F, "Thai"),
+    (0x0E80, 0x0EFF, "Lao"),
+    (0x0F00, 0x0FFF, "Tibetan"),
+    (0x1000, 0x109F, "Myanmar"),
+    (0x10A0, 0x10FF, "Georgian"),
+    (0x1100, 0x11FF, "Hangul"),
+    (0x1200, 0x139F, "Ethiopic"),
+    (0x1780, 0x17FF, "Khmer"),
+    (0x1C90, 0x1CBF, "Georgian"),
+    (0x3040, 0x309F, "Hiragana"),
+    (0x30A0, 0x30FF, "Katakana"),
+    (0x3130, 0x318F, "Hangul"),
+    (0x31F0, 0x31FF, "Katakana"),
+    (0x3400, 0x4DBF, "Han"),
+    (0x4E00, 0x9FFF, "Han"),
+    (0xA960, 0xA97F, "Hangul"),
+    (0xAC00, 0xD7AF, "Hangul"),
+    (0xF900, 0xFAFF, "Han"),
+    (0xFB1D, 0xFB4F, "Hebrew"),
+    (0xFB50, 0xFDFF, "Arabic"),
+    (0xFE70, 0xFEFF, "Arabic"),
+    (0xFF66, 0xFF9F, "Katakana"),
+    (0x20000, 0x2FA1F, "Han"),
+]
+_RANGE_STARTS = [start for start, _, _ in _SCRIPT_RANGES]
+
+# script -> (most likely language, base confidence)
+SCRIPT_LANGUAGES = {
+    "Hangul": ("Korean", 1.0),
+    "Kana": ("Japanese", 1.0),
+    # Kanji-only Japanese titles are common, so Han alone is never confident
+    "Han": ("Chinese", 0.8),
+    "Devanagari": ("Hindi", 0.9),
+    "Bengali": ("Bengali", 0.95),
+    "Gurmukhi": ("Punjabi", 1.0),
+    "Gujarati": ("Gujarati", 1.0),
+    "Oriya": ("Odia", 1.0),
+    "Tamil": ("Tamil", 1.0),
+    "Telugu": ("Telugu", 1.0),
+    "Kannada": ("Kannada", 1.0),
+    "Malayalam": ("Malayalam", 1.0),
+    "Sinhala": ("Sinhala", 1.0),
+    "Thai": ("Thai", 1.0),
+    "Lao": ("Lao", 1.0),
+    "Khmer": ("Khmer", 1.0),
+    "Myanmar": ("Burmese", 1.0),
+    "Tibetan": ("Tibetan", 0.95),
+    "Georgian": ("Georgian", 1.0),
+    "Armenian": ("Armenian", 1.0),
+    "Greek": ("Greek", 1.0),
+    "Hebrew": ("Hebrew", 0.95),
+    "Thaana": ("Dhivehi", 1.0),
+    "Ethiopic": ("Amharic", 0.9),
+    "Arabic": ("Arabic", 0.9),
+    "Cyrillic": ("Russian", 0.9),
+}
+
+# Letters that single out one language among those sharing a script, checked in order
+_LANGUAGE_MARKERS = {
+    "Arabic": [("Urdu", set("ٹڈڑںے")), ("Persian", set("پچژگ"))],
+    "Cyrillic": [("Kazakh", set("әғқңөұ")), ("Ukrainian", set("іїєґ")), ("Serbian", set("ђјљњћџ"))],
+}
+
+# Names the model uses for the same language
+_LANGUAGE_ALIASES = {
+    "mandarin": "chinese",
+    "cantonese": "chinese",
+    "farsi": "persian",
+    "oriya": "odia",
+    "panjabi": "punjabi",
+    "myanmar": "burmese",
+}
+
+def char_script(char):
+    code_point = ord(char)
+    index = bisect_right(_RANGE_STARTS, code_point) - 1
+    if index >= 0 and code_point <= _SCRIPT_RANGES[index][1]:
+        script = _SCRIPT_RANGES[index][2]
+        return "Kana" if script in ("Hiragana", "Katakana") else script
+    return "Latin" if char.isascii() or unicodedata.name(char, "").startswith("LATIN") else None
+
+def detect_language(*texts):
+    """{"language", "script", "confidence"} from the dominant non-Latin script of the texts, or None."""
+    counts = {}
+    letters = set()
+    for text in texts:
+        for char in text or "":
+            if not unicodedata.category(char).startswith("L"):
+                continue
+            script = char_script(char)
+            if script and script != "Latin":
+                counts[script] = counts.get(script, 0) + 1
+                letters.add(char)
+    if not counts:
+        return None
+
+    # Kanji next to kana is Japanese
+    if "Kana" in counts and "Han" in counts:
+        counts["Kana"] += counts.pop("Han")
+    script, script_count = max(counts.items(), key=lambda item: item[1])
+    if script_count < 2 or script not in SCRIPT_LANGUAGES:
+        return None
+
+    language, confidence = SCRIPT_LANGUAGES[script]
+    for marked_language, markers in _LANGUAGE_MARKERS.get(script, ()):
+        if letters & markers:
+            language, confidence = marked_language, 0.95
+            break
+    # Another non-Latin script in the same title makes the guess shakier
+    confidence *= script_count / sum(counts.values())
+    return {"language": language, "script": script, "confidence": round(confidence, 3)}
+
+def detect_track_language(track, min_confidence=LANGUAGE_DETECT_MIN_CONFIDENCE):
+    """Confident language for a track dict from its name and album, or None when the model should decide."""
+    detected = detect_language(track.get("track_name"), track.get("track_album_name"))
+    if detected and detected["confidence"] >= min_confidence:
+        return detected
+    return None
+
+def apply_detected_language(track_data):
+    """Fill track_language at ingest when the script makes it obvious; returns whether it did."""
+    detected = detect_track_language(track_data)
+    if not detected:
+        return False
+    track_data["track_language"] = detected["language"]
+    track_data["language_source"] = LANGUAGE_SOURCE_SCRIPT
+    return True
+
+def same_language(first, second):
+    normalize = lambda name: _LANGUAGE_ALIASES.get(str(name or "").strip().casefold(), str(name or "").strip().casefold())
+    return normalize(first) == normalize(second)
@@ -1,16 +1,21 @@
-from cryptography.fernet import Fernet
-import httpx
 import asyncio
-from database.database import playlists_collection, users_collection
+from datetime import datetime
+from database.database import playlists_collection
 from pymongo import UpdateOne
 
-from config import FERNET_SECRET_KEY
-from .tokens import spotify_token_access_using_refresh
+from database.models import SpotifyUserPlaylistDetails
+from database.playlist_db import playlist_upsert_update
+from database.user_db import db_set_playlists_synced_at
+from database.versions_db import db_bump_data_versions, playlists_scope
+from .spotify_scheduler import spotify_request
+from .tokens import get_user_access_token, refresh_user_access_token
 from .tracks import check_and_create_liked_songs_playlist, spotify_tracks_workflow
 
-async def fetch_playlist_tracks_background(spotify_user_id: str, playlist_id: str, access_token: str):
+async def fetch_playlist_tracks_background(spotify_user_id: str, playlist_id: str):
     try:
-        await spotify_tracks_workflow(spotify_user_id, playlist_id, access_token)
+        result = await spotify_tracks_workflow(spotify_user_id, playlist_id)
+        if not result["success"]:
+            raise Exception(result["details"])
         return {
             "success": True,
             "message": f"Successfully fetched tracks for playlist {playlist_id}"
@@ -23,17 +28,17 @@ async def fetch_playlist_tracks_background(spotify_user_id: str, playlist_id: st
             "details": str(e)
         }
 
-async def fetch_playlist_batch(client, offset, limit, headers, playlists_endpoint, spotify_user_id, fernet_key):
+async def fetch_playlist_batch(offset, limit, headers, playlists_endpoint, spotify_user_id):
     try:
         params = {"limit": limit, "offset": offset}
-        response = await client.get(playlists_endpoint, headers=headers, params=params)
+        access_token = headers["Authorization"].removeprefix("Bearer ")
+        response = await spotify_request("GET", playlists_endpoint, spotify_user_id, headers=headers, params=params)
         
         if response.status_code == 401:
-            refreshed = await spotify_token_access_using_refresh(spotify_user_id)
+            refreshed = await refresh_user_access_token(spotify_user_id, access_token)
             if refreshed["success"]:
-                decrypted_access_token = fernet_key.decrypt(refreshed["details"]["access_token"]).decode()
-                headers["Authorization"] = f"Bearer {decrypted_access_token}"
-                response = await client.get(playlists_endpoint, headers=headers, params=params)
+                headers["Authorization"] = f"Bearer {refreshed['details']['access_token']}"
+                response = await spotify_request("GET", playlists_endpoint, spotify_user_id, headers=headers, params=params)
             else:
                 raise Exception(f"Token refresh failed: {refreshed.get('details')}")
                 
@@ -46,12 +51,12 @@ async def db_batch_update_playlists(playlists):
     try:
         operations = [
             UpdateOne(
-                {"playlist_spotify_id": playlist["playlist_spotify_id"]},
-                {"$set": playlist},
+                {"owner_spotify_id": playlist["owner_spotify_id"], "playlist_spotify_id": playlist["playlist_spotify_id"]},
+                playlist_upsert_update(SpotifyUserPlaylistDetails(**playlist)),
                 upsert=True
             ) for playlist in playlists
         ]
-        result = await playlists_collection.bulk_write(operations)
+        result = await playlists_collection.bulk_write(operations, ordered=False)
         return {
             "success": True,
             "modified_count": result.modified_count,
@@ -61,17 +66,10 @@ async def db_batch_update_playlists(playlists):
         print(f"Error in batch update: {str(e)}")
         return {"success": False, "error": str(e)}
 
-async def spotify_playlists_workflow(access_token: str):
+async def spotify_playlists_workflow(spotify_user_id: str):
     try:
-        # Get user_id from database using the access token
-        fernet_key = Fernet(FERNET_SECRET_KEY)
-        decrypted_access_token = fernet_key.decrypt(access_token).decode()
-        
-        # Find user by access token
-        user = await users_collection.find_one({"access_token": access_token})
-        if not user:
-            raise Exception("User not found in database")
-        spotify_user_id = user["spotify_user_id"]
+        # Cached (and proactively refreshed) access token for the user
+        decrypted_access_token = await get_user_access_token(spotify_user_id)
 
         # Fetch playlists from Spotify API
         playlists_endpoint = "https://api.spotify.com/v1/me/playlists"
@@ -80,43 +78,41 @@ async def spotify_playlists_workflow(access_token: str):
         }
         
         # First, get total number of playlists
-        async with httpx.AsyncClient() as client:
-            initial_response = await client.get(playlists_endpoint, headers=headers, params={"limit": 1, "offset": 0})
+        initial_response = await spotify_request("GET", playlists_endpoint, spotify_user_id, headers=headers, params={"limit": 1, "offset": 0})
             
-            if initial_response.status_code == 401:
-                refreshed = await spotify_token_access_using_refresh(spotify_user_id)
-                if refreshed["success"]:
-                    decrypted_access_token = fernet_key.decrypt(refreshed["details"]["access_token"]).decode()
-                    headers["Authorization"] = f"Bearer {decrypted_access_token}"
-                    initial_response = await client.get(playlists_endpoint, headers=headers, params={"limit": 1, "offset": 0})
-                else:
-                    raise Exception(f"Token refresh failed: {refreshed.get('details')}")
+        if initial_response.status_code == 401:
+            refreshed = await refresh_user_access_token(spotify_user_id, decrypted_access_token)
+            if refreshed["success"]:
+                decrypted_access_token = refreshed["details"]["access_token"]
+                headers["Authorization"] = f"Bearer {decrypted_access_token}"
+                initial_response = await spotify_request("GET", playlists_endpoint, spotify_user_id, headers=headers, params={"limit": 1, "offset": 0})
+            else:
+                raise Exception(f"Token refresh failed: {refreshed.get('details')}")
 
-            if initial_response.status_code != 200:
-                raise Exception(f"Failed to get initial playlist count: {initial_response.text}")
+        if initial_response.status_code != 200:
+            raise Exception(f"Failed to get initial playlist count: {initial_response.text}")
 
-            total_playlists = initial_response.json().get("total", 0)
+        total_playlists = initial_response.json().get("total", 0)
             
-            # Prepare parallel batch requests
-            batch_size = 50
-            tasks = []
-            for offset in range(0, total_playlists, batch_size):
-                task = fetch_playlist_batch(
-                    client, 
-                    offset, 
-                    batch_size, 
-                    headers, 
-                    playlists_endpoint,
-                    spotify_user_id,
-                    fernet_key
-                )
-                tasks.append(task)
+        # Prepare parallel batch requests
+        batch_size = 50
+        tasks = []
+        for offset in range(0, total_playlists, batch_size):
+            task = fetch_playlist_batch(
+                offset, 
+                batch_size, 
+                headers, 
+                playlists_endpoint,
+                spotify_user_id
+            )
+            tasks.append(task)
 
-            # Execute all requests in parallel
-            responses = await asyncio.gather(*tasks)
+        # Execute all requests in parallel
+        responses = await asyncio.gather(*tasks)
 
         # Process all responses
         all_playlists = []
+        complete = all(response and response.status_code == 200 for response in responses)
         for response in responses:
             if response and response.status_code == 200:
                 items = response.json().get("items", [])
@@ -128,16 +124,19 @@ async def spotify_playlists_workflow(access_token: str):
                     "playlist_spotify_id": playlist.get("id", ""),
                     "external_url_playlist": playlist.get("external_urls", {}).get("spotify", ""),
                     "is_public": playlist.get("public", True),
-                    "playlist_description": playlist.get("description", ""),
+                    "playlist_description": playlist.get("description") or "",
+                    "snapshot_id": playlist.get("snapshot_id"),
                     "is_enriched": False
                 } for playlist in items]
                 all_playlists.extend(transformed_playlists)
 
         # Batch update all playlists at once
+        changed = False
         if all_playlists:
             update_result = await db_batch_update_playlists(all_playlists)
             if not update_result["success"]:
                 print(f"Warning: Some playlists may not have been saved: {update_result}")
+            changed = update_result.get("modified_count", 0) + update_result.get("upserted_count", 0) > 0
 
         # Check and create Liked Songs playlist if user has any
         liked_songs_result = await check_and_create_liked_songs_playlist(spotify_user_id)
@@ -155,6 +154,13 @@ async def spotify_playlists_workflow(access_token: str):
             }
             all_playlists.append(liked_songs_playlist)
 
+        # Cached /me/playlists responses revalidate only when a row actually changed
+        if changed or liked_songs_result.get("changed"):
+            await db_bump_data_versions([playlists_scope(spotify_user_id)])
+        # The listing's age as reported by /me/playlists; a partial fetch doesn't count as a refresh
+        if complete and liked_songs_result["success"]:
+            await db_set_playlists_synced_at(spotify_user_id, datetime.utcnow())
+
         return {
             "success": True,
             "message": "Successfully added playlists to database",
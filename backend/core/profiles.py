@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+
+from config import PROFILE_CACHE_TTL_SECONDS, PROFILE_CACHE_SIZE
+from database.database import users_collection
+
+# Only public fields are read from users; tokens and credits never enter the cache
+PUBLIC_PROFILE_PROJECTION = {
+    "_id": 0,
+    "spotify_user_id": 1,
+    "username": 1,
+    "profile_picture": 1,
+    "user_external_url": 1,
+    "country": 1
+}
+
+# spotify_user_id -> (expires at, profile or None for unknown users)
+_profile_cache = OrderedDict()
+
+def public_profile(user):
+    return {
+        "spotify_user_id": user.get("spotify_user_id"),
+        "username": user.get("username"),
+        "profile_picture": user.get("profile_picture"),
+        "user_external_url": user.get("user_external_url"),
+        # Older clients read the profile link from external_url
+        "external_url": user.get("user_external_url"),
+        "country": user.get("country")
+    }
+
+def _remember(spotify_user_id, profile, now):
+    _profile_cache[spotify_user_id] = (now + PROFILE_CACHE_TTL_SECONDS, profile)
+    _profile_cache.move_to_end(spotify_user_id)
+    while len(_profile_cache) > PROFILE_CACHE_SIZE:
+        _profile_cache.popitem(last=False)
+
+async def get_public_profiles(spotify_user_ids):
+    """{spotify_user_id: public profile} for the known users, resolved with at most one query."""
+    now = time.monotonic()
+    profiles = {}
+    missing = []
+    for spotify_user_id in dict.fromkeys(spotify_user_ids):
+        cached = _profile_cache.get(spotify_user_id)
+        if cached and cached[0] > now:
+            if cached[1] is not None:
+                profiles[spotify_user_id] = cached[1]
+        else:
+            missing.append(spotify_user_id)
+
+    if missing:
+        users = await users_collection.find(
+            {"spotify_user_id": {"$in": missing}},
+            PUBLIC_PROFILE_PROJECTION
+        ).to_list(length=None)
+        found = {user["spotify_user_id"]: public_profile(user) for user in users}
+        for spotify_user_id in missing:
+            # Unknown ids are cached too, so a deleted contributor doesn't cost a query per page
+            _remember(spotify_user_id, found.get(spotify_user_id), now)
+        profiles.update(found)
+
+    return profiles
+
+async def get_public_profile(spotify_user_id):
+    return (await get_public_profiles([spotify_user_id])).get(spotify_user_id)
+
+def forget_public_profile(spotify_user_id):
+    _profile_cache.pop(spotify_user_id, None)
@@ -0,0 +1,83 @@
+"""Per-playlist sync and enrichment progress, streamed to clients over SSE.
+
+Progress rows live in the sync_progress collection, one per (user, playlist),
+so updates made by a separate worker process reach every API process. Writes
+made in this process also wake the user's open streams immediately; otherwise
+streams poll the collection every SYNC_PROGRESS_POLL_SECONDS.
+"""
+import asyncio
+import json
+
+from config import SYNC_PROGRESS_POLL_SECONDS, SYNC_PROGRESS_HEARTBEAT_SECONDS
+from database.progress_db import db_update_sync_progress, db_get_sync_progress_since, progress_summary
+from .jobs import report_job_progress
+
+_listeners = {}  # spotify_user_id -> set of asyncio.Event, one per open stream
+
+def _notify(spotify_user_id):
+    for event in _listeners.get(spotify_user_id, ()):
+        event.set()
+
+async def _update(spotify_user_id, playlist_spotify_id, fields=None, increments=None, reset=False):
+    # Progress is best effort: it must never fail the sync it describes
+    try:
+        progress = await db_update_sync_progress(spotify_user_id, playlist_spotify_id, fields, increments, reset)
+    except Exception as e:
+        print(f"Failed to update sync progress for {playlist_spotify_id}: {str(e)}")
+        return
+    _notify(spotify_user_id)
+    if fields and "stage" in fields:
+        await report_job_progress(**{key: value for key, value in progress_summary(progress).items() if key != "updated_at"})
+
+async def start_sync_progress(spotify_user_id, playlist_spotify_id, stage="fetching", **fields):
+    await _update(spotify_user_id, playlist_spotify_id, {"stage": stage, **fields}, reset=True)
+
+async def set_sync_stage(spotify_user_id, playlist_spotify_id, stage, **fields):
+    await _update(spotify_user_id, playlist_spotify_id, {"stage": stage, **fields})
+
+async def add_sync_progress(spotify_user_id, playlist_spotify_id, last_error=None, **increments):
+    increments = {counter: amount for counter, amount in increments.items() if amount}
+    if not increments and last_error is None:
+        return
+    fields = {"last_error": last_error} if last_error is not None else None
+    await _update(spotify_user_id, playlist_spotify_id, fields, increments)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def sync_progress_events(spotify_user_id, is_disconnected):
+    """SSE stream: every progress row on connect, then each row again whenever it changes."""
+    wake = asyncio.Event()
+    _listeners.setdefault(spotify_user_id, set()).add(wake)
+    loop = asyncio.get_running_loop()
+    sent_versions = {}
+    since = None
+    last_sent = loop.time()
+    try:
+        while not await is_disconnected():
+            wake.clear()
+            rows = await db_get_sync_progress_since(spotify_user_id, since)
+            for row in rows:
+                # updated_at has millisecond precision, so rows at `since` are re-read; skip the ones already sent
+                if sent_versions.get(row["_id"]) == row.get("version"):
+                    continue
+                sent_versions[row["_id"]] = row.get("version")
+                since = row["updated_at"]
+                last_sent = loop.time()
+                yield _sse("progress", progress_summary(row))
+
+            if loop.time() - last_sent >= SYNC_PROGRESS_HEARTBEAT_SECONDS:
+                # Comment line keeps proxies from closing an idle stream
+                last_sent = loop.time()
+                yield ": keep-alive\n\n"
+
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=SYNC_PROGRESS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        listeners = _listeners.get(spotify_user_id)
+        if listeners is not None:
+            listeners.discard(wake)
+            if not listeners:
+                _listeners.pop(spotify_user_id, None)
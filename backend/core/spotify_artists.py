@@ -0,0 +1,85 @@
+"""Spotify artist genres, fetched in batches during track ingestion.
+
+Spotify returns genres for up to 50 artists per /v1/artists call at no model cost.
+Ingestion makes sure every artist on the synced tracks is in the spotify_artists
+cache collection; classification later reads that cache only (it has no user
+token), see classify_tracks in core/enrichment.py.
+"""
+import asyncio
+
+from database.spotify_artists_db import db_get_spotify_artists, db_store_spotify_artists
+from .spotify_scheduler import spotify_get_json
+
+SPOTIFY_ARTISTS_ENDPOINT = "https://api.spotify.com/v1/artists"
+SPOTIFY_ARTISTS_BATCH_SIZE = 50
+# enrichment_source of classifications whose genre came from these artist genres
+ENRICHMENT_SOURCE_SPOTIFY = "spotify"
+
+_stats = {
+    "requests": 0,
+    "artists_fetched": 0,
+    "cache_hits": 0,
+    # Degradation: /v1/artists batches that failed, and cache reads/writes that failed
+    "failed_batches": 0,
+    "cache_errors": 0
+}
+
+async def _fetch_artists(artist_ids, headers, spotify_user_id, refresh_access_token):
+    body = await spotify_get_json(
+        SPOTIFY_ARTISTS_ENDPOINT, {"ids": ",".join(artist_ids)}, headers, spotify_user_id, refresh_access_token
+    )
+    return [artist for artist in body.get("artists") or [] if artist]
+
+async def cache_spotify_artists(artist_ids, headers, spotify_user_id, refresh_access_token):
+    """Fetch the artists that are missing from the cache (or stale), 50 per request. Best effort:
+    a failure only means those tracks fall back to the other genre sources."""
+    artist_ids = list(dict.fromkeys(artist_id for artist_id in artist_ids if artist_id))
+    if not artist_ids:
+        return
+    try:
+        cached = await db_get_spotify_artists(artist_ids, fresh_only=True)
+        missing = [artist_id for artist_id in artist_ids if artist_id not in cached]
+        _stats["cache_hits"] += len(artist_ids) - len(missing)
+        batches = [missing[i:i + SPOTIFY_ARTISTS_BATCH_SIZE] for i in range(0, len(missing), SPOTIFY_ARTISTS_BATCH_SIZE)]
+        results = await asyncio.gather(
+            *(_fetch_artists(batch, headers, spotify_user_id, refresh_access_token) for batch in batches),
+            return_exceptions=True
+        )
+        _stats["requests"] += len(batches)
+
+        artists = []
+        for result in results:
+            if isinstance(result, Exception):
+                _stats["failed_batches"] += 1
+                print(f"Failed to fetch Spotify artists: {str(result)}")
+            else:
+                artists.extend(result)
+        _stats["artists_fetched"] += len(artists)
+        await db_store_spotify_artists(artists)
+    except Exception as e:
+        _stats["cache_errors"] += 1
+        print(f"Failed to cache Spotify artists: {str(e)}")
+
+async def get_cached_artist_genres(tracks):
+    """{track_spotify_id: [Spotify genres of each cached artist, primary artist first]}, from the cache only."""
+    artist_ids = {artist_id for track in tracks for artist_id in track.get("track_artist_ids") or []}
+    if not artist_ids:
+        return {}
+    try:
+        artists = await db_get_spotify_artists(artist_ids)
+    except Exception as e:
+        _stats["cache_errors"] += 1
+        print(f"Spotify artist cache lookup failed: {str(e)}")
+        return {}
+    return {
+        track["track_spotify_id"]: [
+            artists[artist_id].get("genres") or []
+            for artist_id in track.get("track_artist_ids") or []
+            if artist_id in artists
+        ]
+        for track in tracks
+        if track.get("track_spotify_id")
+    }
+
+def spotify_artists_stats():
+    return dict(_stats)
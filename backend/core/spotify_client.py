@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+
+from config import (
+    SPOTIFY_HTTP2,
+    SPOTIFY_MAX_CONNECTIONS,
+    SPOTIFY_MAX_KEEPALIVE_CONNECTIONS,
+    SPOTIFY_KEEPALIVE_EXPIRY,
+    SPOTIFY_TIMEOUT,
+    SPOTIFY_CONNECT_TIMEOUT,
+    SPOTIFY_USER_CONCURRENCY
+)
+
+# One pooled client for every Spotify call made by the app (accounts + web api)
+_spotify_client = None
+# Per-user caps on concurrent Spotify requests (parallel page fetches): user -> [semaphore, holders and waiters].
+# Entries are dropped once nobody holds or waits on them, so the dict only covers users with requests in flight.
+_user_semaphores = {}
+
+def _build_spotify_client():
+    http2 = SPOTIFY_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401 - httpx needs the h2 package to speak HTTP/2
+        except ImportError:
+            print("SPOTIFY_HTTP2 is enabled but the 'h2' package is missing, falling back to HTTP/1.1")
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=SPOTIFY_MAX_CONNECTIONS,
+        max_keepalive_connections=SPOTIFY_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=SPOTIFY_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(SPOTIFY_TIMEOUT, connect=SPOTIFY_CONNECT_TIMEOUT)
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+async def start_spotify_client():
+    """Create the shared Spotify client. Called from the FastAPI lifespan."""
+    global _spotify_client
+    if _spotify_client is None or _spotify_client.is_closed:
+        _spotify_client = _build_spotify_client()
+    return _spotify_client
+
+async def close_spotify_client():
+    """Close the shared Spotify client and release its pooled connections."""
+    global _spotify_client
+    if _spotify_client is not None and not _spotify_client.is_closed:
+        await _spotify_client.aclose()
+    _spotify_client = None
+
+def get_spotify_client():
+    """Return the shared Spotify client, creating it lazily when used outside the app lifespan (scripts)."""
+    global _spotify_client
+    if _spotify_client is None or _spotify_client.is_closed:
+        _spotify_client = _build_spotify_client()
+    return _spotify_client
+
+@asynccontextmanager
+async def user_request_slot(spotify_user_id):
+    """Limit how many Spotify requests one user may have in flight (use with `async with`)."""
+    slot = _user_semaphores.get(spotify_user_id)
+    if slot is None:
+        slot = _user_semaphores[spotify_user_id] = [asyncio.Semaphore(SPOTIFY_USER_CONCURRENCY), 0]
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            yield
+    finally:
+        slot[1] -= 1
+        if not slot[1]:
+            _user_semaphores.pop(spotify_user_id, None)
@@ -0,0 +1,179 @@
+"""Central scheduler for every Spotify request made from core/.
+
+Requests wait for a token from one app-wide token bucket (Spotify rate-limits per
+app, not per user). Waiters are queued per user and served round-robin, so one
+user's 300-playlist sync cannot starve everybody else. A 429 pauses the whole
+bucket for Retry-After seconds; 429s without the header, 5xx responses and
+transport errors are retried with jittered exponential backoff. A 5xx or a lost
+response may mean the request was processed, so those are only retried for
+idempotent methods (e.g. never for the single-use authorization_code exchange).
+"""
+from collections import OrderedDict, deque
+import asyncio
+import random
+import time
+
+import httpx
+
+from config import (
+    SPOTIFY_RATE_LIMIT_PER_SECOND,
+    SPOTIFY_RATE_LIMIT_BURST,
+    SPOTIFY_MAX_RETRIES,
+    SPOTIFY_BACKOFF_BASE,
+    SPOTIFY_BACKOFF_MAX
+)
+from .spotify_client import get_spotify_client, user_request_slot
+
+APP_QUEUE_KEY = "__app__"  # requests made before we know the user (login callback)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+_bucket = {"tokens": float(SPOTIFY_RATE_LIMIT_BURST), "updated_at": time.monotonic()}
+_waiting = OrderedDict()  # user key -> deque of futures, rotated for round-robin
+_dispatcher = None
+_paused_until = 0.0
+_metrics = {
+    "requests": 0,
+    "in_flight": 0,
+    "rate_limited": 0,
+    "server_errors": 0,
+    "transport_errors": 0,
+    "retries": 0,
+    "failures": 0
+}
+
+def _refill():
+    now = time.monotonic()
+    elapsed = now - _bucket["updated_at"]
+    _bucket["tokens"] = min(float(SPOTIFY_RATE_LIMIT_BURST), _bucket["tokens"] + elapsed * SPOTIFY_RATE_LIMIT_PER_SECOND)
+    _bucket["updated_at"] = now
+
+async def _dispatch():
+    global _dispatcher
+    try:
+        while _waiting:
+            pause = _paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            _refill()
+            if _bucket["tokens"] < 1:
+                await asyncio.sleep((1 - _bucket["tokens"]) / SPOTIFY_RATE_LIMIT_PER_SECOND)
+                continue
+
+            # Serve the user at the front, then move them to the back of the line
+            user_key, queue = _waiting.popitem(last=False)
+            future = queue.popleft()
+            if queue:
+                _waiting[user_key] = queue
+            if future.done():
+                continue  # the waiting request was cancelled
+            _bucket["tokens"] -= 1
+            future.set_result(None)
+    finally:
+        _dispatcher = None
+
+async def _acquire(user_key):
+    global _dispatcher
+    future = asyncio.get_running_loop().create_future()
+    _waiting.setdefault(user_key, deque()).append(future)
+    if _dispatcher is None:
+        _dispatcher = asyncio.create_task(_dispatch())
+    await future
+
+def _pause(seconds):
+    global _paused_until
+    _paused_until = max(_paused_until, time.monotonic() + seconds)
+
+def _retry_after(response):
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt):
+    delay = min(SPOTIFY_BACKOFF_MAX, SPOTIFY_BACKOFF_BASE * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.5)
+
+async def spotify_request(method, url, spotify_user_id=None, retry=None, **kwargs):
+    """Send a request through the scheduler and return the final httpx response.
+
+    Non-retryable responses (and the last response once retries run out) are returned
+    as-is so callers keep their own status-code handling. A transport error that
+    survives every retry is raised. retry says whether 5xx responses and transport
+    errors may be retried; it defaults to whether the method is idempotent. 429s are
+    always retried since Spotify did not process the request.
+    """
+    if retry is None:
+        retry = method.upper() in IDEMPOTENT_METHODS
+    client = get_spotify_client()
+    user_key = spotify_user_id or APP_QUEUE_KEY
+    attempt = 0
+    while True:
+        await _acquire(user_key)
+        _metrics["requests"] += 1
+        _metrics["in_flight"] += 1
+        error = None
+        response = None
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            error = e
+            _metrics["transport_errors"] += 1
+        finally:
+            _metrics["in_flight"] -= 1
+
+        if response is not None and response.status_code != 429 and response.status_code < 500:
+            return response
+
+        rate_limited = response is not None and response.status_code == 429
+        if rate_limited:
+            _metrics["rate_limited"] += 1
+            retry_after = _retry_after(response)
+            # The limit is app-wide, so everybody waits
+            _pause(retry_after if retry_after is not None else _backoff(attempt))
+            delay = 0
+        else:
+            if response is not None:
+                _metrics["server_errors"] += 1
+            delay = _backoff(attempt)
+
+        if attempt >= SPOTIFY_MAX_RETRIES or not (retry or rate_limited):
+            _metrics["failures"] += 1
+            if error is not None:
+                raise error
+            return response
+
+        attempt += 1
+        _metrics["retries"] += 1
+        if delay:
+            await asyncio.sleep(delay)
+
+async def spotify_get_json(url, params, headers, spotify_user_id, refresh_access_token):
+    """GET a Spotify Web API resource inside the user's request slot and return its JSON body.
+
+    A 401 calls refresh_access_token(stale Authorization header), which updates
+    `headers`, and the request is retried once; any other non-200 raises.
+    """
+    async with user_request_slot(spotify_user_id):
+        authorization = headers["Authorization"]
+        response = await spotify_request("GET", url, spotify_user_id, headers=headers, params=params)
+
+        # Handle expired token - get new access token once, then retry this request
+        if response.status_code == 401:
+            await refresh_access_token(authorization)
+            response = await spotify_request("GET", url, spotify_user_id, headers=headers, params=params)
+
+    # Return if faced with any error
+    if response.status_code != 200:
+        raise Exception(f"details {response.text}")
+    return response.json()
+
+def spotify_scheduler_stats():
+    return {
+        **_metrics,
+        "queue_depth": sum(len(queue) for queue in _waiting.values()),
+        "queued_users": len(_waiting),
+        "max_user_queue_depth": max((len(queue) for queue in _waiting.values()), default=0),
+        "paused_for_seconds": round(max(0.0, _paused_until - time.monotonic()), 2),
+        "available_tokens": round(_bucket["tokens"], 2)
+    }
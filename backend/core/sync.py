@@ -0,0 +1,73 @@
+"""Deduplicates background sync triggers and hands them to the job queue.
+
+Syncs are keyed by (spotify_user_id, target) where target is a playlist id, the
+liked-songs id or PLAYLISTS_SYNC_TARGET for the playlist listing. A trigger joins
+the job already queued or running for its key, and is dropped when the last job
+for that key succeeded within the freshness TTL (or failed within the failure
+cooldown).
+"""
+from datetime import datetime, timedelta
+
+from config import SYNC_FRESHNESS_TTL_SECONDS, SYNC_FAILURE_COOLDOWN_SECONDS
+from database.jobs_db import JOB_SUCCEEDED, JOB_FAILED, db_get_recent_job
+from .jobs import enqueue_job, wait_for_job
+from .progress import start_sync_progress
+from .job_handlers import SYNC_PLAYLISTS_JOB, SYNC_PLAYLIST_TRACKS_JOB, SYNC_LIKED_SONGS_JOB
+
+PLAYLISTS_SYNC_TARGET = "__playlists__"
+LIKED_SONGS_SYNC_TARGET = "liked_songs"
+
+# Job priorities: a user waiting on the result, a user-visible refresh, bulk work
+SYNC_PRIORITY_INTERACTIVE = 10
+SYNC_PRIORITY_REFRESH = 5
+SYNC_PRIORITY_BULK = 0
+
+def _sync_job(spotify_user_id, target):
+    if target == PLAYLISTS_SYNC_TARGET:
+        return SYNC_PLAYLISTS_JOB, {"spotify_user_id": spotify_user_id}
+    if target == LIKED_SONGS_SYNC_TARGET:
+        return SYNC_LIKED_SONGS_JOB, {"spotify_user_id": spotify_user_id}
+    return SYNC_PLAYLIST_TRACKS_JOB, {"spotify_user_id": spotify_user_id, "playlist_id": target}
+
+async def _recent_job(dedup_key, ttl):
+    now = datetime.utcnow()
+    succeeded = await db_get_recent_job(dedup_key, JOB_SUCCEEDED, now - timedelta(seconds=ttl))
+    if succeeded:
+        return succeeded
+    cooldown = min(ttl, SYNC_FAILURE_COOLDOWN_SECONDS)
+    return await db_get_recent_job(dedup_key, JOB_FAILED, now - timedelta(seconds=cooldown))
+
+async def schedule_sync(spotify_user_id, target, ttl=SYNC_FRESHNESS_TTL_SECONDS, force=False, priority=SYNC_PRIORITY_REFRESH):
+    """Queue a sync job unless a duplicate is queued, running or fresh.
+
+    Returns {"status", "job_id"} where status is "started", "joined" (already
+    queued or running) or "fresh" (dropped; job_id is the recent job). force=True
+    skips the freshness check but still joins an active job.
+    """
+    dedup_key = f"sync:{spotify_user_id}:{target}"
+    if not force:
+        recent = await _recent_job(dedup_key, ttl)
+        if recent:
+            return {"status": "fresh", "job_id": str(recent["_id"])}
+
+    job_type, payload = _sync_job(spotify_user_id, target)
+    queued = await enqueue_job(job_type, payload, dedup_key=dedup_key, priority=priority)
+    if not queued["success"]:
+        raise Exception(queued["details"])
+    if queued["details"]["created"] and target != PLAYLISTS_SYNC_TARGET:
+        # Streams see the new sync right away instead of the previous one's final state
+        await start_sync_progress(spotify_user_id, target, "queued")
+    return {
+        "status": "started" if queued["details"]["created"] else "joined",
+        "job_id": queued["details"]["job_id"]
+    }
+
+async def run_sync(spotify_user_id, target):
+    """Queue (or join) a sync at interactive priority and wait for it.
+
+    Returns {"status", "job_id"} with the job's final status, or "running" when
+    it did not finish within the wait timeout.
+    """
+    scheduled = await schedule_sync(spotify_user_id, target, force=True, priority=SYNC_PRIORITY_INTERACTIVE)
+    job = await wait_for_job(scheduled["job_id"])
+    return {"status": job["status"] if job else "running", "job_id": scheduled["job_id"]}
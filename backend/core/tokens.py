@@ -1,13 +1,91 @@
-from config import CLIENT_SECRET, CLIENT_ID, FERNET_SECRET_KEY
+from config import CLIENT_SECRET, CLIENT_ID, FERNET_SECRET_KEY, TOKEN_REFRESH_MARGIN_SECONDS
 from database.database import users_collection
-import httpx
 from cryptography.fernet import Fernet
+from datetime import datetime, timedelta
+import asyncio
+import time
+from .spotify_scheduler import spotify_request
+
+# Decrypted access tokens per user: {"access_token": str, "expires_at": epoch seconds}
+_token_cache = {}
+# One refresh task per user; concurrent callers await the same one
+_refreshes_in_flight = {}
+_fernet = None
+
+def _get_fernet():
+    global _fernet
+    if _fernet is None:
+        _fernet = Fernet(FERNET_SECRET_KEY)
+    return _fernet
+
+def cache_access_token(spotify_user_id: str, access_token: str, expires_in: int = 3600):
+    _token_cache[spotify_user_id] = {
+        "access_token": access_token,
+        "expires_at": time.time() + expires_in
+    }
+
+def _usable(cached):
+    return cached and cached["expires_at"] - TOKEN_REFRESH_MARGIN_SECONDS > time.time()
+
+async def refresh_user_access_token(spotify_user_id: str, stale_access_token: str = None):
+    """Refresh a user's access token, collapsing concurrent refreshes into one request.
+
+    Pass the token that just got a 401 as stale_access_token: if another caller has
+    already replaced it, the cached token is returned without another refresh.
+    Returns the same result dict as spotify_token_access_using_refresh.
+    """
+    cached = _token_cache.get(spotify_user_id)
+    if stale_access_token and cached and cached["access_token"] != stale_access_token and _usable(cached):
+        return {
+            "success": True,
+            "message": "Token already refreshed",
+            "details": {"access_token": cached["access_token"]}
+        }
+
+    task = _refreshes_in_flight.get(spotify_user_id)
+    if task is None:
+        task = asyncio.create_task(spotify_token_access_using_refresh(spotify_user_id))
+        _refreshes_in_flight[spotify_user_id] = task
+        task.add_done_callback(lambda _: _refreshes_in_flight.pop(spotify_user_id, None))
+    # shield: one caller being cancelled must not cancel the refresh for everybody else
+    return await asyncio.shield(task)
+
+async def get_user_access_token(spotify_user_id: str):
+    """Return a decrypted access token, refreshing it shortly before it expires."""
+    cached = _token_cache.get(spotify_user_id)
+    if _usable(cached):
+        return cached["access_token"]
+
+    if cached is None:
+        user = await users_collection.find_one(
+            {"spotify_user_id": spotify_user_id},
+            {"access_token": 1, "access_token_expires_at": 1}
+        )
+        if not user:
+            raise Exception("User not found")
+        expires_at = user.get("access_token_expires_at")
+        if expires_at:
+            cached = {
+                "access_token": _get_fernet().decrypt(user["access_token"]).decode(),
+                "expires_at": (expires_at - datetime.utcnow()).total_seconds() + time.time()
+            }
+            _token_cache[spotify_user_id] = cached
+            if _usable(cached):
+                return cached["access_token"]
+
+    # Expired, about to expire, or expiry unknown (stored before expiries were tracked)
+    refreshed = await refresh_user_access_token(spotify_user_id)
+    if refreshed["success"]:
+        return refreshed["details"]["access_token"]
+    if cached and cached["expires_at"] > time.time():
+        return cached["access_token"]
+    raise Exception(f"Token refresh failed: {refreshed.get('details')}")
 
 async def spotify_token_access_using_refresh(spotify_user_id: str):
     try:
-        fernet_key = Fernet(FERNET_SECRET_KEY)
+        fernet_key = _get_fernet()
         # Getting the refresh token
-        user = await users_collection.find_one({"spotify_user_id": spotify_user_id})
+        user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"refresh_token": 1})
         if not user:
             error_msg = "User not found in database"
             print(f"Token refresh error: {error_msg}")
@@ -55,8 +133,8 @@ async def spotify_token_access_using_refresh(spotify_user_id: str):
 
         try:
             # Sending all the data to the token_url through a POST request to received the access token
-            async with httpx.AsyncClient() as client:
-                response = await client.post(token_url, data=data, headers=headers)
+            # A refresh token can be exchanged again, so a lost response is safe to retry
+            response = await spotify_request("POST", token_url, spotify_user_id, retry=True, data=data, headers=headers)
             
             # Return if faced with any error
             if response.status_code != 200:
@@ -84,8 +162,13 @@ async def spotify_token_access_using_refresh(spotify_user_id: str):
             new_access_token = tokens["access_token"]
             encrypted_access_token = fernet_key.encrypt(new_access_token.encode())
             
+            expires_in = int(tokens.get("expires_in", 3600))
+
             # Update data for database
-            update_data = {"access_token": encrypted_access_token}
+            update_data = {
+                "access_token": encrypted_access_token,
+                "access_token_expires_at": datetime.utcnow() + timedelta(seconds=expires_in)
+            }
             
             # If we got a new refresh token, encrypt and store it too
             if "refresh_token" in tokens:
@@ -107,6 +190,8 @@ async def spotify_token_access_using_refresh(spotify_user_id: str):
                 "details": error_msg
             }
 
+        cache_access_token(spotify_user_id, new_access_token, expires_in)
+
         return {
             "success": True,
             "message": "Successfully refreshed tokens",
@@ -1,34 +1,122 @@
-import httpx
-from cryptography.fernet import Fernet
-import anthropic
-import json
-import re
-
-from .tokens import spotify_token_access_using_refresh
-from database.tracks_db import db_update_track_details
-from config import FERNET_SECRET_KEY, ANTHROPIC_API_KEY
-from database.genres import SUBGENRES, GENRES
-from database.playlist_db import db_update_playlists_details
-from database.database import tracks_collection, playlists_collection, users_collection
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from config import LIKED_SONGS_RECONCILE_HOURS
+from .spotify_scheduler import spotify_request, spotify_get_json
+from .tokens import get_user_access_token, refresh_user_access_token
+from .progress import start_sync_progress, set_sync_stage, add_sync_progress
+from .enrichment import classify_tracks
+from .language_detect import apply_detected_language, LANGUAGE_SOURCE_SCRIPT, LANGUAGE_SOURCE_MODEL
+from .artist_index import record_artist_genres, ENRICHMENT_SOURCE_MODEL
+from .spotify_artists import cache_spotify_artists
+from database.tracks_db import db_bulk_upsert_tracks, db_commit_track_enrichments
+from database.versions_db import db_bump_data_versions, playlists_scope, playlist_tracks_scope
+from database.playlist_db import (
+    db_update_playlists_details,
+    db_get_playlist_sync_state,
+    db_mark_playlist_tracks_synced,
+    db_get_liked_songs_sync_state,
+    db_set_liked_songs_sync_state,
+    db_inc_playlist_counters,
+    db_set_playlist_counters,
+    db_apply_enriched_deltas,
+    LIKED_SONGS_PLAYLIST_ID
+)
+from database.database import tracks_collection, playlists_collection
 
 SPOTIFY_LIKED_SONGS_ENDPOINT = "https://api.spotify.com/v1/me/tracks"
-LIKED_SONGS_PLAYLIST_ID = "liked_songs"  # Use a constant or generate a unique ID
+TRACKS_WRITE_BATCH_SIZE = 500
+
+def playlist_tracks_query(playlist_id: str, spotify_user_id: str):
+    query = {"playlist_spotify_id": playlist_id}
+    if playlist_id == LIKED_SONGS_PLAYLIST_ID:
+        # Liked-songs track documents are shared between users; only show this user's
+        query["users_with_track"] = spotify_user_id
+    return query
+
+async def get_playlist_track_count(playlist_id: str, spotify_user_id: str):
+    """Stored track count from the playlist row's materialized counter; rows never counted are counted once."""
+    playlist = await playlists_collection.find_one(
+        {"owner_spotify_id": spotify_user_id, "playlist_spotify_id": playlist_id},
+        {"tracks_total": 1}
+    )
+    if playlist and playlist.get("tracks_total") is not None:
+        return playlist["tracks_total"]
+    counters = await update_playlist_enriched_status(playlist_id, spotify_user_id)
+    return counters["tracks_total"]
+
+async def bump_playlist_versions(playlist_ids=(), liked_owner_ids=()):
+    """Revalidate cached responses built from these playlists' tracks and from their owners' playlist rows."""
+    playlist_ids = [playlist_id for playlist_id in playlist_ids if playlist_id != LIKED_SONGS_PLAYLIST_ID]
+    owners = await playlists_collection.distinct(
+        "owner_spotify_id", {"playlist_spotify_id": {"$in": playlist_ids}}
+    ) if playlist_ids else []
+    await db_bump_data_versions(
+        [playlist_tracks_scope(playlist_id) for playlist_id in playlist_ids]
+        + [playlist_tracks_scope(LIKED_SONGS_PLAYLIST_ID, owner_id) for owner_id in liked_owner_ids]
+        + [playlists_scope(owner_id) for owner_id in [*owners, *liked_owner_ids]]
+    )
+
+def _apply_classification(track_data, details):
+    """Pre-fill an ingested (still unenriched) track with a classification and where it came from."""
+    track_data["track_language"] = details["language"]
+    track_data["track_genre"] = [details["genre"] or "", details["subgenre"] or ""]
+    track_data["language_source"] = details.get("language_source", track_data.get("language_source") or LANGUAGE_SOURCE_MODEL)
+    track_data["enrichment_source"] = details.get("source", ENRICHMENT_SOURCE_MODEL)
+
+async def _copy_existing_enrichments(tracks_data):
+    """Mark ingested tracks already enriched in another playlist as enriched too (one query); returns those left."""
+    enriched_copies = await tracks_collection.find(
+        {"track_spotify_id": {"$in": [track_data["track_spotify_id"] for track_data in tracks_data]}, "is_enriched": True},
+        {"track_spotify_id": 1, "track_genre": 1, "track_language": 1, "language_source": 1, "enrichment_source": 1, "contributor": 1}
+    ).to_list(length=None)
+    enriched_by_id = {copy["track_spotify_id"]: copy for copy in enriched_copies}
+    for track_data in tracks_data:
+        enriched = enriched_by_id.get(track_data["track_spotify_id"])
+        if enriched:
+            track_data.update({
+                "track_genre": enriched.get("track_genre", []),
+                "track_language": enriched.get("track_language", ""),
+                "language_source": enriched.get("language_source"),
+                "contributor": enriched.get("contributor"),
+                "enrichment_source": enriched.get("enrichment_source"),
+                "is_enriched": True
+            })
+    return [track_data for track_data in tracks_data if not track_data["is_enriched"]]
+
+def _album_image(track):
+    images = (track.get("album") or {}).get("images") or [{}]
+    return images[0].get("url", "")
+
+def _shared_token_refresh(spotify_user_id, headers):
+    """Refresh helper shared by concurrent page requests, so one expiry triggers one refresh."""
+    async def refresh(stale_authorization):
+        refreshed = await refresh_user_access_token(spotify_user_id, stale_authorization.removeprefix("Bearer "))
+        if not refreshed["success"]:
+            raise Exception(f"details {refreshed.get('details')}")
+        headers["Authorization"] = f"Bearer {refreshed['details']['access_token']}"
+
+    return refresh
+
+async def fetch_spotify_page(endpoint, offset, limit, headers, spotify_user_id, refresh_access_token):
+    return await spotify_get_json(
+        endpoint, {"limit": limit, "offset": offset}, headers, spotify_user_id, refresh_access_token
+    )
 
 async def fetch_and_store_liked_songs_tracks(spotify_user_id):
     try:
-        user_cursor = await users_collection.find_one({"spotify_user_id": spotify_user_id})
-        if not user_cursor:
-            raise Exception("User not found")
-        encrypted_access_token = user_cursor["access_token"]
-        fernet_key = Fernet(FERNET_SECRET_KEY)
-        access_token = fernet_key.decrypt(encrypted_access_token).decode()
+        access_token = await get_user_access_token(spotify_user_id)
         headers = {
             "Authorization": f"Bearer {access_token}"
         }
         limit = 50
-        offset = 0
         track_errors = []
-        all_tracks = []
+        seen_track_ids = []
+        # Items without track data and each page's library total, to tell whether a full pass saw everything
+        skipped_items = []
+        page_totals = []
         playlist_data = {
             "owner_spotify_id": spotify_user_id,
             "playlist_name": "Liked Songs",
@@ -40,87 +128,205 @@ async def fetch_and_store_liked_songs_tracks(spotify_user_id):
             "playlist_description": "Your liked songs on Spotify",
             "is_enriched": False
         }
-        # Save the Liked Songs playlist to DB
-        response = await db_update_playlists_details(playlist_data)
-        
-        while True:
-            try:
-                params = {"limit": limit, "offset": offset}
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(SPOTIFY_LIKED_SONGS_ENDPOINT, headers=headers, params=params)  
-                if response.status_code != 200:
-                    raise Exception(f"Spotify API error: {response.status_code} {response.text}")
-                data = response.json()
-                items = data.get("items", [])
-                if not items:
-                    break
-                for item in items:
-                    track = item.get("track")
-                    if not track:
-                        track_errors.append(f"Missing track data in item: {item}")
-                        continue
-                    track_spotify_id = track.get("id")
-                    existing_track = await tracks_collection.find_one({"track_spotify_id": track_spotify_id})
-
-                    if existing_track and existing_track.get("is_enriched", True):
-                        # Track is already enriched, just add user to users_with_track if not present
-                        users_with_track = existing_track.get("users_with_track", [])
-                        if spotify_user_id not in users_with_track:
-                            users_with_track.append(spotify_user_id)
-                            await tracks_collection.update_one(
-                                {"track_spotify_id": track_spotify_id},
-                                {"$set": {"users_with_track": users_with_track}}
-                            )
-                        continue  # Skip adding new track
-                    
-                    # Track not present, add basic details without enrichment
-                    track_data = {
-                        "spotify_user_id": spotify_user_id,
-                        "playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID,
-                        "track_spotify_id": track.get("id"),
-                        "track_name": track.get("name"),
-                        "track_artists": [artist["name"] for artist in track.get("artists", [])],
-                        "track_album_name": track.get("album", {}).get("name"),
-                        "track_external_url": track.get("external_urls", {}).get("spotify"),
-                        "track_preview_url": track.get("preview_url"),
-                        "track_genre": [],  # Empty until enriched
-                        "track_language": "",  # Empty until enriched
-                        "track_duration_ms": track.get("duration_ms"),
-                        "is_enriched": False,
-                        "connected_ids": [],
-                        "users_with_track": [spotify_user_id]
-                    }
-                    # Save track to DB
-                    await db_update_track_details(track_data)
-                    all_tracks.append(track_data)
-                # Pagination
-                if data.get("next"):
-                    offset += limit
-                else:
+        # Liked songs come back newest-first, so everything after the stored watermark is already in the DB.
+        # Removals are only visible to a full pass, which runs when there is no watermark or it is due.
+        sync_state = await db_get_liked_songs_sync_state(spotify_user_id, LIKED_SONGS_PLAYLIST_ID)
+        watermark = sync_state["watermark"]
+        reconciled_at = sync_state["reconciled_at"]
+        full_sync = (
+            watermark is None
+            or reconciled_at is None
+            or datetime.utcnow() - reconciled_at >= timedelta(hours=LIKED_SONGS_RECONCILE_HOURS)
+        )
+
+        refresh_access_token = _shared_token_refresh(spotify_user_id, headers)
+
+        async def store_page(items):
+            errors_before = len(track_errors)
+            page_tracks = []
+            for item in items:
+                track = item.get("track")
+                # Removed or local tracks have no Spotify track to store; skip them like the playlist path does
+                if not track or not track.get("id"):
+                    skipped_items.append(item)
+                    continue
+                seen_track_ids.append(track["id"])
+                page_tracks.append({
+                    "spotify_user_id": spotify_user_id,
+                    "playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID,
+                    "track_spotify_id": track.get("id"),
+                    "track_name": track.get("name"),
+                    "track_artists": [artist["name"] for artist in track.get("artists", [])],
+                    "track_artist_ids": [artist["id"] for artist in track.get("artists", []) if artist.get("id")],
+                    "track_album_name": track.get("album", {}).get("name"),
+                    "track_album_img": _album_image(track),
+                    "track_external_url": track.get("external_urls", {}).get("spotify"),
+                    "track_preview_url": track.get("preview_url"),
+                    "track_genre": [],  # Empty until enriched
+                    "track_language": "",  # Empty until enriched
+                    "track_duration_ms": track.get("duration_ms"),
+                    "is_enriched": False,
+                    "connected_ids": [],
+                    "users_with_track": [spotify_user_id]
+                })
+                # Obvious languages (non-Latin scripts) are stored right away, no model call needed
+                apply_detected_language(page_tracks[-1])
+            if not page_tracks:
+                await add_sync_progress(
+                    spotify_user_id, LIKED_SONGS_PLAYLIST_ID, pages_fetched=1, errors=len(track_errors) - errors_before
+                )
+                return 0
+
+            # Tracks already enriched in another playlist start out enriched here too (one query per page);
+            # the rest are pre-filled from Spotify's artist genres and the artist index (no model call at ingest)
+            unenriched = await _copy_existing_enrichments(page_tracks)
+            await cache_spotify_artists(
+                [artist_id for track_data in unenriched for artist_id in track_data["track_artist_ids"]],
+                headers, spotify_user_id, refresh_access_token
+            )
+            for track_data, lang_result in zip(unenriched, await classify_tracks(unenriched, use_model=False)):
+                if lang_result["success"]:
+                    _apply_classification(track_data, lang_result["details"])
+
+            # One unordered bulk upsert per page; membership is merged with $addToSet
+            saved = await db_bulk_upsert_tracks(page_tracks)
+            track_errors.extend(
+                f"Failed to save track {failure['track_spotify_id']}: {failure['details']}"
+                for failure in saved["details"]["failed"]
+            )
+            stored = len(page_tracks) - len(saved["details"]["failed"])
+            await add_sync_progress(
+                spotify_user_id, LIKED_SONGS_PLAYLIST_ID,
+                last_error=track_errors[-1] if len(track_errors) > errors_before else None,
+                pages_fetched=1, tracks_stored=stored, errors=len(track_errors) - errors_before
+            )
+            return stored
+
+        async def fetch_and_store_page(offset):
+            page = await fetch_spotify_page(
+                SPOTIFY_LIKED_SONGS_ENDPOINT, offset, limit, headers, spotify_user_id, refresh_access_token
+            )
+            page_totals.append(page.get("total", 0))
+            return await store_page(page.get("items", []))
+
+        first_page = await fetch_spotify_page(
+            SPOTIFY_LIKED_SONGS_ENDPOINT, 0, limit, headers, spotify_user_id, refresh_access_token
+        )
+        first_items = first_page.get("items", [])
+        await start_sync_progress(
+            spotify_user_id, LIKED_SONGS_PLAYLIST_ID, "fetching",
+            full_sync=full_sync,
+            tracks_total=first_page.get("total", 0),
+            pages_total=-(-first_page.get("total", 0) // limit) if full_sync else None
+        )
+        new_watermark = first_items[0].get("added_at") if first_items else watermark
+
+        if full_sync:
+            # First page tells us the total, then the remaining pages are fetched and stored concurrently
+            saved_counts = [await store_page(first_items)]
+            saved_counts += await asyncio.gather(*(
+                fetch_and_store_page(offset)
+                for offset in range(limit, first_page.get("total", 0), limit)
+            ))
+        else:
+            # Page sequentially and stop at the first item older than the watermark (ISO timestamps sort as strings).
+            # Songs liked in the same second as the watermark are kept unless they are already stored.
+            saved_counts = []
+            page, offset = first_page, 0
+            while True:
+                items = page.get("items", [])
+                boundary_ids = [
+                    item["track"]["id"] for item in items
+                    if item.get("added_at") == watermark and (item.get("track") or {}).get("id")
+                ]
+                stored_ids = set(await tracks_collection.distinct("track_spotify_id", {
+                    "playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID,
+                    "users_with_track": spotify_user_id,
+                    "track_spotify_id": {"$in": boundary_ids}
+                })) if boundary_ids else set()
+                new_items = [
+                    item for item in items
+                    if (item.get("added_at") or "") > watermark
+                    or (item.get("added_at") == watermark and (item.get("track") or {}).get("id") not in stored_ids)
+                ]
+                saved_counts.append(await store_page(new_items))
+                if any((item.get("added_at") or "") < watermark for item in items) or not page.get("next"):
                     break
-            except Exception as e:
-                raise Exception(f"Exception: {str(e)}")
+                offset += limit
+                page = await fetch_spotify_page(
+                    SPOTIFY_LIKED_SONGS_ENDPOINT, offset, limit, headers, spotify_user_id, refresh_access_token
+                )
 
-        # Update playlist track count
-        playlist_data["playlist_tracks_count"] = len(all_tracks)
+        # A like or unlike during the pass shifts the offsets, so a still-liked track may have been missed;
+        # only prune when every page agreed on the total and the pass accounted for all of it
+        library_total = first_page.get("total", 0)
+        reconciled = (
+            full_sync
+            and not track_errors
+            and all(total == library_total for total in page_totals)
+            and len(set(seen_track_ids)) + len(skipped_items) >= library_total
+        )
+        if full_sync and not reconciled and not track_errors:
+            print(f"Liked songs changed during the full sync for {spotify_user_id}; skipping the reconcile")
+
+        unliked_count = 0
+        if reconciled:
+            # Tracks the user no longer likes drop out of their liked songs
+            unliked = await tracks_collection.update_many(
+                {
+                    "playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID,
+                    "users_with_track": spotify_user_id,
+                    "track_spotify_id": {"$nin": seen_track_ids}
+                },
+                {"$pull": {"users_with_track": spotify_user_id}}
+            )
+            unliked_count = unliked.modified_count
+
+        # Spotify's total is the library size, whether or not this run had to page through all of it
+        playlist_data["playlist_tracks_count"] = first_page.get("total", sum(saved_counts))
         await db_update_playlists_details(playlist_data)
+        # Only move the watermark once everything newer than it is stored, so a failed page is retried next time
+        if not track_errors:
+            await db_set_liked_songs_sync_state(
+                spotify_user_id, new_watermark, reconciled, LIKED_SONGS_PLAYLIST_ID
+            )
 
+        # Membership changes on shared documents don't map to per-page deltas; one recount per sync
+        await update_playlist_enriched_status(LIKED_SONGS_PLAYLIST_ID, spotify_user_id)
+        if sum(saved_counts) or unliked_count:
+            await bump_playlist_versions(liked_owner_ids=[spotify_user_id])
+        await set_sync_stage(spotify_user_id, LIKED_SONGS_PLAYLIST_ID, "done")
         return {
             "success": True,
-            "tracks_saved": len(all_tracks),
+            "tracks_saved": sum(saved_counts),
+            "full_sync": full_sync,
             "details": track_errors
         }
     except Exception as e:
+        await set_sync_stage(spotify_user_id, LIKED_SONGS_PLAYLIST_ID, "failed", last_error=str(e))
         return {
             "success": False,
             "message": "Failed to fetch and store liked songs tracks",
             "details": str(e)
         }
 
-async def spotify_tracks_workflow(spotify_user_id, playlist_id, access_token):
+async def spotify_tracks_workflow(spotify_user_id, playlist_id):
     try:
-        fernet_key = Fernet(FERNET_SECRET_KEY)
-        access_token = fernet_key.decrypt(access_token).decode()
+        # Skip the whole download when the stored tracks already match Spotify's snapshot
+        sync_state = await db_get_playlist_sync_state(spotify_user_id, playlist_id)
+        if sync_state["is_current"]:
+            await set_sync_stage(spotify_user_id, playlist_id, "done", skipped=True)
+            return {
+                "success": True,
+                "message": "Playlist unchanged since the last track sync",
+                "details": {
+                    "tracks_saved": 0,
+                    "failed": [],
+                    "skipped": True
+                }
+            }
+
+        access_token = await get_user_access_token(spotify_user_id)
         # GET endpoint to get all the tracks using the playlist id
         tracks_endpoint = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks?market='IN'"
         
@@ -130,297 +336,348 @@ async def spotify_tracks_workflow(spotify_user_id, playlist_id, access_token):
         }
 
         limit=100
-        offset=0
         all_tracks=[]
 
-        async with httpx.AsyncClient() as client:
-            while True:
-                params = {"limit": limit, "offset": offset}
-                response = await client.get(tracks_endpoint, headers=headers, params=params) 
-
-                # Handle expired token - get new access token
-                if response.status_code == 401:
-                    print("Access token expired. Refreshing ...")
-                    refreshed = await spotify_token_access_using_refresh()
-                    if "access_token" in refreshed.get("details",{}):
-                        access_token = refreshed["details"]["access_token"]
-                        headers["Authorization"] = f"Bearer {access_token}"
-                        continue
-                    else:
-                        raise Exception(f"details {refreshed.get("details")}")
-
-                # Return if faced with any error
-                if response.status_code!=200:
-                    raise Exception(f"details {response.text}")
-            
-                data = response.json()
-                items = data.get("items",[])
-                for item in items:
-                    track = item.get("track", {})
-                    if not track:
-                        continue
-                    # Detect language
-                    try:
-                        lang_result = await detect_song_language_genre_subgenre(
-                            track.get("name"),
-                            [artist["name"] for artist in track.get("artists", [])],
-                            (track.get("album") or {}).get("name", "")
-                        )
-                        if lang_result["success"]:
-                            track_language = lang_result["details"]["language"]
-                            track_genre = lang_result["details"]["genre"] if lang_result["details"]["genre"] else ""
-                            track_subgenre = lang_result["details"]["subgenre"] if lang_result["details"]["subgenre"] else ""
-                        else:
-                            track_language = []
-                            track_genre = ""
-                            track_subgenre = "" 
-                    except Exception:
-                        track_language = []
-                    track_data = {
-                        "spotify_user_id": spotify_user_id,
-                        "playlist_spotify_id": playlist_id,
-                        "track_spotify_id": track.get("id"),
-                        "track_name": track.get("name"),
-                        "track_artists": [artist["name"] for artist in track.get("artists", [])],
-                        "track_album_name": (track.get("album") or {}).get("name", ""),
-                        "track_album_img": (track.get("album") or {}).get("images", [{}])[0].get("url", ""),
-                        "track_external_url": track.get("external_urls",{}).get("spotify"),
-                        "track_preview_url": track.get("preview_url"),
-                        "track_genre": [track_genre, track_subgenre],
-                        "track_language": track_language,
-                        "track_duration_ms": track.get("duration_ms"),
-                        "is_enriched": False
-                    }
-                    all_tracks.append(track_data)
-                if len(items)<limit:
-                    break
-                offset+=limit
-        # Save tracks to DB
-        for track_data in all_tracks:
-            response = await db_update_track_details(track_data)
-            if response["success"]==False:
-                raise Exception(response["details"])
-        await update_playlist_enriched_status(playlist_id)
-        return {
-            "success": True,
-            "message": "Added all the tracks to the database",
-            "details": str(response)
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "message": "Failed to work on track details",
-            "details": str(e)
-        }
-    
-async def detect_song_language_genre_subgenre(track_name, track_artists, track_album_name):
-    try:
-        # Input validation
-        if not track_name or not track_artists or not track_album_name:
-            raise ValueError("track_name, track_artists, and track_album_name must all be provided.")
-
-        artists = ", ".join(track_artists)
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-
-        # Step 1: Get initial classification without constraints (shorter prompt)
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",  # Cheaper model
-            max_tokens=80,
-            temperature=0.1,
-            system="You are a music expert. Detect the language, main genre, and specific subgenre of songs.",
-            messages=[
-                {"role": "user", "content": f"For the song '{track_name}' by {artists} from '{track_album_name}', return JSON with: language (full English name), genre (main category like Pop, Rock, Hip Hop, etc.), subgenre (specific style). Format: {{\"language\": \"...\", \"genre\": \"...\", \"subgenre\": \"...\"}}"}
-            ]
+        refresh_access_token = _shared_token_refresh(spotify_user_id, headers)
+
+        async def fetch_page(offset):
+            page = await fetch_spotify_page(
+                tracks_endpoint, offset, limit, headers, spotify_user_id, refresh_access_token
+            )
+            await add_sync_progress(spotify_user_id, playlist_id, pages_fetched=1)
+            return page
+
+        # First page tells us the total, then every remaining offset is fetched in parallel
+        first_page = await fetch_spotify_page(
+            tracks_endpoint, 0, limit, headers, spotify_user_id, refresh_access_token
+        )
+        total_tracks = first_page.get("total", 0)
+        await start_sync_progress(
+            spotify_user_id, playlist_id, "fetching",
+            skipped=False, tracks_total=total_tracks, pages_total=max(1, -(-total_tracks // limit)), pages_fetched=1
         )
+        other_pages = await asyncio.gather(*(
+            fetch_page(offset)
+            for offset in range(limit, total_tracks, limit)
+        ))
 
-        # Parse response
-        raw_result = None
-        if hasattr(response, "content") and response.content:
-            for block in response.content:
-                if hasattr(block, "text"):
-                    json_str = block.text.strip()
-                    if json_str.startswith('```'):
-                        match = re.search(r"```json\n(.*?)\n```", json_str, re.DOTALL)
-                        json_str = match.group(1).strip() if match else json_str
-                    
-                    try:
-                        raw_result = json.loads(json_str)
-                        break
-                    except:
-                        continue
-
-        if not raw_result:
-            raise ValueError("Could not parse API response")
-
-        # Step 2: Map to your allowed genres/subgenres
-        detected_genre = raw_result.get("genre", "").strip()
-        detected_subgenre = raw_result.get("subgenre", "").strip()
-        
-        # Map to closest allowed genre
-        mapped_genre = map_to_allowed_genre(detected_genre)
-        mapped_subgenre = map_to_allowed_subgenre(mapped_genre, detected_subgenre)
+        for page_index, page in enumerate([first_page, *other_pages]):
+            for item_index, item in enumerate(page.get("items", [])):
+                track = item.get("track", {})
+                # Local files and unavailable items have no Spotify id
+                if not track or not track.get("id"):
+                    continue
+                track_data = {
+                    "spotify_user_id": spotify_user_id,
+                    "playlist_spotify_id": playlist_id,
+                    "track_spotify_id": track.get("id"),
+                    "track_name": track.get("name"),
+                    "track_artists": [artist["name"] for artist in track.get("artists", [])],
+                    "track_artist_ids": [artist["id"] for artist in track.get("artists", []) if artist.get("id")],
+                    "track_album_name": (track.get("album") or {}).get("name", ""),
+                    "track_album_img": _album_image(track),
+                    "track_external_url": track.get("external_urls",{}).get("spotify"),
+                    "track_preview_url": track.get("preview_url"),
+                    "track_genre": ["", ""],
+                    "track_language": "",
+                    "track_duration_ms": track.get("duration_ms"),
+                    "track_position": page_index * limit + item_index,
+                    "is_enriched": False
+                }
+                apply_detected_language(track_data)
+                all_tracks.append(track_data)
+
+        await set_sync_stage(spotify_user_id, playlist_id, "classifying", tracks_total=len(all_tracks))
+        # Tracks already enriched in another playlist start out enriched here too, like liked songs
+        unenriched = await _copy_existing_enrichments(all_tracks)
+        # Spotify's artist genres are the primary genre source: 50 artists per request, cached across syncs
+        await cache_spotify_artists(
+            [artist_id for track_data in unenriched for artist_id in track_data["track_artist_ids"]],
+            headers, spotify_user_id, refresh_access_token
+        )
+        # Detect language/genre/subgenre concurrently; tracks whose script gave the language away never go to
+        # the model and only take a genre from Spotify or the artist index
+        ambiguous_tracks = [track_data for track_data in unenriched if track_data.get("language_source") != LANGUAGE_SOURCE_SCRIPT]
+        script_tracks = [track_data for track_data in unenriched if track_data.get("language_source") == LANGUAGE_SOURCE_SCRIPT]
+        lang_results = await classify_tracks(ambiguous_tracks) + await classify_tracks(script_tracks, use_model=False)
+        for track_data, lang_result in zip(ambiguous_tracks + script_tracks, lang_results):
+            if lang_result["success"]:
+                _apply_classification(track_data, lang_result["details"])
 
+        await set_sync_stage(spotify_user_id, playlist_id, "storing")
+        # Save tracks to DB with bulk upserts, collecting per-track failures
+        failed = []
+        changed_count = 0
+        for start in range(0, len(all_tracks), TRACKS_WRITE_BATCH_SIZE):
+            batch = all_tracks[start:start + TRACKS_WRITE_BATCH_SIZE]
+            response = await db_bulk_upsert_tracks(batch)
+            failed.extend(response["details"]["failed"])
+            # New documents start unenriched unless another playlist's copy was already enriched
+            enriched_ids = {track_data["track_spotify_id"] for track_data in batch if track_data["is_enriched"]}
+            await db_inc_playlist_counters(
+                playlist_id,
+                tracks_total=response["details"]["upserted_count"],
+                tracks_enriched=sum(1 for track_id in response["details"]["upserted_track_ids"] if track_id in enriched_ids)
+            )
+            changed_count += response["details"]["upserted_count"] + response["details"]["modified_count"]
+            batch_failed = response["details"]["failed"]
+            await add_sync_progress(
+                spotify_user_id, playlist_id,
+                last_error=batch_failed[-1]["details"] if batch_failed else None,
+                tracks_stored=len(batch) - len(batch_failed), errors=len(batch_failed)
+            )
+        if failed:
+            print(f"Failed to save {len(failed)} tracks for playlist {playlist_id}: {failed[:5]}")
+        else:
+            # Drop tracks that were removed from the playlist, then remember the snapshot we're at
+            removed_query = {
+                "playlist_spotify_id": playlist_id,
+                "track_spotify_id": {"$nin": [track["track_spotify_id"] for track in all_tracks]}
+            }
+            removed_enriched = await tracks_collection.count_documents({**removed_query, "is_enriched": True})
+            removed = await tracks_collection.delete_many(removed_query)
+            await db_inc_playlist_counters(
+                playlist_id, tracks_total=-removed.deleted_count, tracks_enriched=-min(removed_enriched, removed.deleted_count)
+            )
+            changed_count += removed.deleted_count
+            if sync_state["snapshot_id"]:
+                await db_mark_playlist_tracks_synced(playlist_id, sync_state["snapshot_id"])
+        # Rows that were never counted (first sync, new followers) can't take deltas; count them once
+        if await playlists_collection.find_one({"playlist_spotify_id": playlist_id, "tracks_total": None}, {"_id": 1}):
+            await update_playlist_enriched_status(playlist_id)
+        if changed_count:
+            await bump_playlist_versions([playlist_id])
+        await set_sync_stage(spotify_user_id, playlist_id, "done")
         return {
             "success": True,
-            "message": "Song language, genre, and subgenre detected successfully",
+            "message": "Added all the tracks to the database",
             "details": {
-                "language": raw_result.get("language", ""),
-                "genre": mapped_genre,
-                "subgenre": mapped_subgenre
+                "tracks_saved": len(all_tracks) - len(failed),
+                "failed": failed
             }
         }
     except Exception as e:
+        await set_sync_stage(spotify_user_id, playlist_id, "failed", last_error=str(e))
         return {
             "success": False,
-            "message": "Failed to work on song language/genre detection",
+            "message": "Failed to work on track details",
             "details": str(e)
         }
-
-def map_to_allowed_genre(detected_genre):
-    detected_lower = detected_genre.lower()
     
-    # Direct matches
-    for genre in GENRES:
-        if detected_lower == genre.lower():
-            return genre
-    
-    # Fuzzy matching
-    genre_mappings = {
-        "pop": "Pop", "rock": "Rock", "hip hop": "Hip Hop", "rap": "Hip Hop",
-        "r&b": "R&B", "rnb": "R&B", "country": "Country", "electronic": "Electronic",
-        "edm": "Electronic", "classical": "Classical", "jazz": "Jazz",
-        "reggae": "Reggae", "blues": "Blues", "latin": "Latin", "folk": "Folk",
-        "metal": "Metal", "punk": "Punk", "gospel": "Gospel", "world": "World",
-        "kpop": "K-Pop", "k-pop": "K-Pop", "afrobeat": "Afrobeats", 
-        "indie": "Indie", "alternative": "Alternative", "alt": "Alternative"
+async def update_playlist_enriched_status(playlist_spotify_id, spotify_user_id: str = None):
+    """Recount a playlist's materialized counters from the tracks (the owner's row only for liked songs).
+
+    Sync and enrichment keep the counters current with $inc; this is the repair path.
+    """
+    query = {"playlist_spotify_id": playlist_spotify_id}
+    owner_id = None
+    if playlist_spotify_id == LIKED_SONGS_PLAYLIST_ID:
+        query = playlist_tracks_query(playlist_spotify_id, spotify_user_id)
+        owner_id = spotify_user_id
+    total_tracks = await tracks_collection.count_documents(query)
+    enriched_tracks = await tracks_collection.count_documents({**query, "is_enriched": True})
+    await db_set_playlist_counters(playlist_spotify_id, total_tracks, enriched_tracks, owner_id)
+    return {"tracks_total": total_tracks, "tracks_enriched": enriched_tracks}
+
+async def repair_playlist_counters(spotify_user_id: str = None):
+    """Recompute tracks_total/tracks_enriched for every playlist row (or one user's) with two aggregations."""
+    enriched = {"$sum": {"$cond": [{"$eq": ["$is_enriched", True]}, 1, 0]}}
+    playlist_match = {"playlist_spotify_id": {"$ne": LIKED_SONGS_PLAYLIST_ID}}
+    if spotify_user_id:
+        owned = await playlists_collection.distinct("playlist_spotify_id", {"owner_spotify_id": spotify_user_id})
+        playlist_match = {"playlist_spotify_id": {"$in": [pid for pid in owned if pid != LIKED_SONGS_PLAYLIST_ID]}}
+    by_playlist = {
+        row["_id"]: row
+        for row in await tracks_collection.aggregate([
+            {"$match": playlist_match},
+            {"$group": {"_id": "$playlist_spotify_id", "total": {"$sum": 1}, "enriched": enriched}}
+        ]).to_list(length=None)
     }
-    
-    for key, value in genre_mappings.items():
-        if key in detected_lower:
-            return value
-    
-    return "Pop"  # Default fallback
 
-def map_to_allowed_subgenre(genre, detected_subgenre):
-    if genre not in SUBGENRES:
-        return ""
-    
-    allowed_subgenres = SUBGENRES[genre]
-    detected_lower = detected_subgenre.lower()
-    
-    # Direct match
-    for subgenre in allowed_subgenres:
-        if detected_lower == subgenre.lower():
-            return subgenre
-    
-    # Partial match
-    for subgenre in allowed_subgenres:
-        if any(word in detected_lower for word in subgenre.lower().split()):
-            return subgenre
-    
-    return ""  # No match found
-
-async def update_playlist_enriched_status(playlist_spotify_id, track_count):
-    # Count total tracks in playlist
-    total_tracks = await tracks_collection.count_documents({"playlist_spotify_id": playlist_spotify_id})
-    # Count enriched tracks in playlist
-    enriched_tracks = await tracks_collection.count_documents({
-        "playlist_spotify_id": playlist_spotify_id,
+    liked_match = {"playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID}
+    if spotify_user_id:
+        liked_match["users_with_track"] = spotify_user_id
+    liked_pipeline = [{"$match": liked_match}, {"$unwind": "$users_with_track"}]
+    if spotify_user_id:
+        liked_pipeline.append({"$match": {"users_with_track": spotify_user_id}})
+    liked_pipeline.append({"$group": {"_id": "$users_with_track", "total": {"$sum": 1}, "enriched": enriched}})
+    by_liked_owner = {
+        row["_id"]: row
+        for row in await tracks_collection.aggregate(liked_pipeline).to_list(length=None)
+    }
+
+    operations = []
+    rows = playlists_collection.find(
+        {"owner_spotify_id": spotify_user_id} if spotify_user_id else {},
+        {"owner_spotify_id": 1, "playlist_spotify_id": 1}
+    )
+    async for row in rows:
+        if row["playlist_spotify_id"] == LIKED_SONGS_PLAYLIST_ID:
+            counts = by_liked_owner.get(row["owner_spotify_id"], {})
+        else:
+            counts = by_playlist.get(row["playlist_spotify_id"], {})
+        total, enriched_count = counts.get("total", 0), counts.get("enriched", 0)
+        operations.append(UpdateOne({"_id": row["_id"]}, {"$set": {
+            "tracks_total": total,
+            "tracks_enriched": enriched_count,
+            "is_enriched": total > 0 and enriched_count >= total
+        }}))
+
+    for start in range(0, len(operations), TRACKS_WRITE_BATCH_SIZE):
+        await playlists_collection.bulk_write(operations[start:start + TRACKS_WRITE_BATCH_SIZE], ordered=False)
+
+    return {
+        "success": True,
+        "message": "Playlist counters recomputed",
+        "details": {"playlists_updated": len(operations)}
+    }
+
+def _enrichment_update(track, lang_result, contributor_id):
+    # A language read off the track's script at ingest is kept over the model's answer
+    script_language = track.get("track_language") if track.get("language_source") == LANGUAGE_SOURCE_SCRIPT else None
+    update_data = {
+        "track_language": script_language or lang_result["details"]["language"],
+        "language_source": LANGUAGE_SOURCE_SCRIPT if script_language else lang_result["details"].get("language_source", LANGUAGE_SOURCE_MODEL),
+        # "spotify" or "artist_index" when the genre didn't come from the model, so they can be audited
+        "enrichment_source": lang_result["details"].get("source", ENRICHMENT_SOURCE_MODEL),
+        "track_genre": [
+            lang_result["details"]["genre"] if lang_result["details"]["genre"] else "",
+            lang_result["details"]["subgenre"] if lang_result["details"]["subgenre"] else ""
+        ],
         "is_enriched": True
-    })
-    # If all tracks are enriched, set playlist is_enriched to True
-    if total_tracks > 0 and total_tracks == enriched_tracks:
-        await playlists_collection.update_one(
-            {"playlist_spotify_id": playlist_spotify_id},
-            {"$set": {"is_enriched": True}}
-        )
-    else:
-        await playlists_collection.update_one(
-            {"playlist_spotify_id": playlist_spotify_id},
-            {"$set": {"is_enriched": False}}
-        )
+    }
+    if contributor_id:
+        update_data["contributor"] = contributor_id
+    return update_data
+
+async def store_track_enrichments(tracks, lang_results, contributor_id: str = None):
+    """Commit a batch of classifications to every copy of each track, then bump the affected playlists' counters."""
+    results = []
+    enrichments = {}
+    for track, lang_result in zip(tracks, lang_results):
+        if not lang_result["success"]:
+            results.append({
+                "success": False,
+                "message": "Failed to enrich track",
+                "details": f"Language detection failed: {lang_result['details']}"
+            })
+            continue
+        update_data = _enrichment_update(track, lang_result, contributor_id)
+        enrichments[track["track_spotify_id"]] = update_data
+        results.append({
+            "success": True,
+            "message": "Track enriched successfully",
+            "details": {**track, **update_data}
+        })
+
+    track_ids = list(enrichments)
+    for start in range(0, len(track_ids), TRACKS_WRITE_BATCH_SIZE):
+        batch = {track_id: enrichments[track_id] for track_id in track_ids[start:start + TRACKS_WRITE_BATCH_SIZE]}
+        try:
+            committed = await db_commit_track_enrichments(batch)
+            if committed["modified_count"] == committed["expected_count"]:
+                await db_apply_enriched_deltas(committed["playlist_deltas"], committed["liked_deltas"])
+            else:
+                # A concurrent enrichment flipped some of the same copies; recount the affected rows instead
+                for playlist_id in committed["playlist_deltas"]:
+                    await update_playlist_enriched_status(playlist_id)
+                for owner_id in committed["liked_deltas"]:
+                    await update_playlist_enriched_status(LIKED_SONGS_PLAYLIST_ID, owner_id)
+            await bump_playlist_versions(committed["playlist_deltas"], committed["liked_deltas"])
+            await record_artist_genres([track for track in tracks if track["track_spotify_id"] in batch], batch)
+        except Exception as e:
+            for index, (track, result) in enumerate(zip(tracks, results)):
+                if result["success"] and track["track_spotify_id"] in batch:
+                    results[index] = {
+                        "success": False,
+                        "message": "Failed to enrich track",
+                        "details": str(e)
+                    }
+
+    return results
 
-async def enrich_track(track_spotify_id: str, contributor_id: str = None):
+async def enrich_track(track_spotify_id: str, contributor_id: str = None, playlist_id: str = None):
+    results = await enrich_tracks([track_spotify_id], contributor_id, playlist_id)
+    return results[0]
+
+async def enrich_tracks(track_ids, contributor_id: str = None, playlist_id: str = None):
+    """Enrich many tracks at once: batched classification prompts sent through the worker pool.
+
+    With a contributor and playlist_id, progress is reported on the contributor's row for that playlist.
+    """
     try:
-        # Get track from database
-        track = await tracks_collection.find_one({"track_spotify_id": track_spotify_id})
+        # Get tracks from database, without the membership lists that grow with popularity
+        tracks = await tracks_collection.find(
+            {"track_spotify_id": {"$in": list(set(track_ids))}},
+            {"users_with_track": 0, "connected_ids": 0}
+        ).to_list(length=None)
+    except Exception as e:
+        return [{
+            "success": False,
+            "message": "Failed to enrich track",
+            "details": str(e)
+        } for _ in track_ids]
+
+    # A track stays pending while any copy is unenriched, so pick that copy over an enriched one
+    tracks_by_id = {}
+    for track in tracks:
+        current = tracks_by_id.get(track["track_spotify_id"])
+        if current is None or (current.get("is_enriched") and not track.get("is_enriched")):
+            tracks_by_id[track["track_spotify_id"]] = track
+
+    results = {}
+    pending = []
+    for track_id in dict.fromkeys(track_ids):
+        track = tracks_by_id.get(track_id)
         if not track:
-            raise Exception("Track not found in database")
-        
-        if track.get("is_enriched", False):
-            return {
+            results[track_id] = {
+                "success": False,
+                "message": "Failed to enrich track",
+                "details": "Track not found in database"
+            }
+        elif track.get("is_enriched", False):
+            results[track_id] = {
                 "success": True,
                 "message": "Track already enriched",
                 "details": track
             }
+        else:
+            pending.append(track)
 
-        # Detect language and genre
-        lang_result = await detect_song_language_genre_subgenre(
-            track["track_name"],
-            track["track_artists"],
-            track["track_album_name"]
-        )
-
-        if lang_result["success"]:
-            # Update track with enriched data
-            update_data = {
-                "track_language": lang_result["details"]["language"],
-                "track_genre": [
-                    lang_result["details"]["genre"] if lang_result["details"]["genre"] else "",
-                    lang_result["details"]["subgenre"] if lang_result["details"]["subgenre"] else ""
-                ],
-                "is_enriched": True
-            }
-            
-            if contributor_id:
-                update_data["contributor"] = contributor_id
-
-            # Update track in database
-            await tracks_collection.update_one(
-                {"track_spotify_id": track_spotify_id},
-                {"$set": update_data}
-            )
+    report_progress = bool(contributor_id and playlist_id and pending)
+    if report_progress:
+        await set_sync_stage(contributor_id, playlist_id, "enriching", tracks_to_enrich=len(pending), tracks_enriched=0)
 
-            # Update playlist enrichment status
-            playlists = await tracks_collection.distinct(
-                "playlist_spotify_id",
-                {"track_spotify_id": track_spotify_id}
-            )
-            for playlist_id in playlists:
-                await update_playlist_enriched_status(playlist_id)
+    # Detect language and genre, then write every copy of the batch at once
+    lang_results = await classify_tracks(pending)
+    stored = await store_track_enrichments(pending, lang_results, contributor_id)
+    failures = [result for result in stored if not result["success"]]
+    for track, result in zip(pending, stored):
+        results[track["track_spotify_id"]] = result
 
-            return {
-                "success": True,
-                "message": "Track enriched successfully",
-                "details": {**track, **update_data}
-            }
-        else:
-            raise Exception(f"Language detection failed: {lang_result['details']}")
+    if report_progress:
+        await add_sync_progress(
+            contributor_id, playlist_id,
+            last_error=failures[-1]["details"] if failures else None,
+            tracks_enriched=len(stored) - len(failures),
+            errors=len(failures)
+        )
 
-    except Exception as e:
-        return {
-            "success": False,
-            "message": "Failed to enrich track",
-            "details": str(e)
-        }
+    if report_progress:
+        await set_sync_stage(contributor_id, playlist_id, "done")
+    return [results[track_id] for track_id in track_ids]
 
 async def check_and_create_liked_songs_playlist(spotify_user_id):
     """Quickly check if user has any liked songs and create a playlist entry."""
     try:
-        user_cursor = await users_collection.find_one({"spotify_user_id": spotify_user_id})
-        if not user_cursor:
-            raise Exception("User not found")
-        encrypted_access_token = user_cursor["access_token"]
-        fernet_key = Fernet(FERNET_SECRET_KEY)
-        access_token = fernet_key.decrypt(encrypted_access_token).decode()
+        access_token = await get_user_access_token(spotify_user_id)
         headers = {
             "Authorization": f"Bearer {access_token}"
         }
         
         # Just fetch one song to check if there are any liked songs
         params = {"limit": 1, "offset": 0}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(SPOTIFY_LIKED_SONGS_ENDPOINT, headers=headers, params=params)
+        response = await spotify_request("GET", SPOTIFY_LIKED_SONGS_ENDPOINT, spotify_user_id, headers=headers, params=params)
             
         if response.status_code != 200:
             raise Exception(f"Spotify API error: {response.status_code} {response.text}")
@@ -441,12 +698,13 @@ async def check_and_create_liked_songs_playlist(spotify_user_id):
                 "playlist_description": "Your liked songs on Spotify",
                 "is_enriched": False
             }
-            await db_update_playlists_details(playlist_data)
+            saved = await db_update_playlists_details(playlist_data)
             
             return {
                 "success": True,
                 "has_liked_songs": True,
-                "total_tracks": total_tracks
+                "total_tracks": total_tracks,
+                "changed": saved.get("details", {}).get("changed", False)
             }
         
         return {
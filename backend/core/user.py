@@ -2,9 +2,13 @@ from config import FERNET_SECRET_KEY
 from database.user_db import db_update_user_details
 
 from cryptography.fernet import Fernet
-import httpx
+from datetime import datetime, timedelta
+from .spotify_scheduler import spotify_request
+from .tokens import cache_access_token
+from .profiles import forget_public_profile
+from database.versions_db import db_bump_data_versions, user_scope
 
-async def spotify_users_workflow(access_token, refresh_token):
+async def spotify_users_workflow(access_token, refresh_token, expires_in=3600):
     try:
         # Current user's profile api endpoint
         profile_endpoint = "https://api.spotify.com/v1/me"
@@ -15,26 +19,25 @@ async def spotify_users_workflow(access_token, refresh_token):
         }
 
         # Sending a GET request to get the username
-        async with httpx.AsyncClient() as client:
-            response = await client.get(profile_endpoint, headers=headers)
+        response = await spotify_request("GET", profile_endpoint, headers=headers)
 
-            # Return if faced with any error
-            if response.status_code != 200:
-                return {
-                    "success": False,
-                    "message": "Failed to get user profile from Spotify",
-                    "details": response.text
-                }
-            
-            # Storing the user details
-            data = response.json()
-            
-            if not data.get("id"):
-                return {
-                    "success": False,
-                    "message": "Missing user ID in Spotify response",
-                    "details": "Spotify API did not return a user ID"
-                }
+        # Return if faced with any error
+        if response.status_code != 200:
+            return {
+                "success": False,
+                "message": "Failed to get user profile from Spotify",
+                "details": response.text
+            }
+        
+        # Storing the user details
+        data = response.json()
+        
+        if not data.get("id"):
+            return {
+                "success": False,
+                "message": "Missing user ID in Spotify response",
+                "details": "Spotify API did not return a user ID"
+            }
         
         try:
             fernet = Fernet(FERNET_SECRET_KEY)
@@ -48,7 +51,12 @@ async def spotify_users_workflow(access_token, refresh_token):
             }
 
         # Add user details to the database
-        db_response = await db_update_user_details(data, access_token_encrypted, refresh_token_encrypted)
+        db_response = await db_update_user_details(
+            data,
+            access_token_encrypted,
+            refresh_token_encrypted,
+            datetime.utcnow() + timedelta(seconds=expires_in)
+        )
         
         if not db_response.get("success", False):
             return {
@@ -57,6 +65,12 @@ async def spotify_users_workflow(access_token, refresh_token):
                 "details": db_response.get("details", "Unknown database error")
             }
 
+        # Keep the fresh token in memory so the first syncs don't decrypt it again
+        cache_access_token(data.get("id"), access_token, expires_in)
+        # A login may change the name or picture shown on this user's contributions
+        forget_public_profile(data.get("id"))
+        await db_bump_data_versions([user_scope(data.get("id"))])
+
         return {
             "success": True,
             "message": "User details saved successfully",
@@ -0,0 +1,76 @@
+import re
+from datetime import datetime
+
+from pymongo import ReplaceOne, UpdateOne
+
+from .database import artist_genres_collection
+
+# One document per artist (keyed by normalized name) counting what its enriched tracks were classified as:
+# {"tracks": n, "genres": {genre: n}, "subgenres": {"genre|subgenre": n}, "languages": {language: n}}
+
+def artist_key(artist_name):
+    return re.sub(r"\s+", " ", str(artist_name or "")).strip().casefold()
+
+def _count_key(value):
+    # Counts are stored as field names, which can't contain dots or start with "$"
+    return str(value or "").strip().replace(".", " ").lstrip("$")
+
+def _count_observations(observations):
+    """({artist key: {count field: n}}, {artist key: artist name}) for (artist_name, genre, subgenre, language) tuples."""
+    increments = {}
+    names = {}
+    for artist_name, genre, subgenre, language in observations:
+        key = artist_key(artist_name)
+        if not key or not genre:
+            continue
+        names[key] = artist_name
+        inc = increments.setdefault(key, {"tracks": 0})
+        inc["tracks"] += 1
+        fields = [f"genres.{_count_key(genre)}"]
+        if subgenre:
+            fields.append(f"subgenres.{_count_key(genre)}|{_count_key(subgenre)}")
+        if _count_key(language):
+            fields.append(f"languages.{_count_key(language)}")
+        for field in fields:
+            inc[field] = inc.get(field, 0) + 1
+    return increments, names
+
+async def db_add_artist_observations(observations):
+    """Count (artist_name, genre, subgenre, language) observations with one $inc upsert per artist."""
+    increments, names = _count_observations(observations)
+    if not increments:
+        return 0
+    now = datetime.utcnow()
+    result = await artist_genres_collection.bulk_write([
+        UpdateOne({"_id": key}, {"$inc": inc, "$set": {"artist_name": names[key], "updated_at": now}}, upsert=True)
+        for key, inc in increments.items()
+    ], ordered=False)
+    return result.upserted_count + result.modified_count
+
+async def db_replace_artist_distributions(observations, batch_size=500):
+    """Rebuild the whole index from these observations; artists without any are removed. Returns artists written."""
+    increments, names = _count_observations(observations)
+    now = datetime.utcnow()
+    operations = []
+    for key, inc in increments.items():
+        document = {"artist_name": names[key], "updated_at": now, "genres": {}, "subgenres": {}, "languages": {}}
+        for field, count in inc.items():
+            group, _, value = field.partition(".")
+            if value:
+                document[group][value] = count
+            else:
+                document[field] = count
+        operations.append(ReplaceOne({"_id": key}, document, upsert=True))
+    for start in range(0, len(operations), batch_size):
+        await artist_genres_collection.bulk_write(operations[start:start + batch_size], ordered=False)
+    # Anything not rewritten (and not counted since the rebuild started) has no observations left
+    await artist_genres_collection.delete_many({"updated_at": {"$lt": now}})
+    return len(operations)
+
+async def db_get_artist_distributions(artist_names):
+    """{artist key: distribution document} for the artists that have one, in one query."""
+    keys = list({artist_key(name) for name in artist_names if artist_key(name)})
+    if not keys:
+        return {}
+    documents = await artist_genres_collection.find({"_id": {"$in": keys}}).to_list(length=None)
+    return {document["_id"]: document for document in documents}
@@ -12,4 +12,10 @@ database = MONGODB_CLIENT.spotify_playlists_db
 
 users_collection = database.users
 playlists_collection = database.playlists
-tracks_collection = database.tracks
\ No newline at end of file
+tracks_collection = database.tracks
+enrichment_cache_collection = database.enrichment_cache
+jobs_collection = database.jobs
+sync_progress_collection = database.sync_progress
+data_versions_collection = database.data_versions
+artist_genres_collection = database.artist_genres
+spotify_artists_collection = database.spotify_artists
@@ -0,0 +1,241 @@
+"""Index declarations for the Mongo collections.
+
+ensure_indexes() runs at app startup and is idempotent: create_indexes() is a
+no-op for indexes that already exist with the same spec. Each index is created
+on its own, so a unique index blocked by duplicates left in an old database
+doesn't keep the others from being built; the duplicate keys are reported.
+Run `python -m database.indexes --dedupe` to merge those duplicates (then
+`python worker.py --repair-counters`), and `python -m database.indexes --check`
+to fail when a required index is missing or a hot query falls back to a
+collection scan.
+"""
+import argparse
+import asyncio
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from config import JOB_RETENTION_HOURS
+from .database import users_collection, playlists_collection, tracks_collection, jobs_collection, sync_progress_collection
+
+REQUIRED_INDEXES = [
+    (users_collection, [
+        IndexModel([("spotify_user_id", ASCENDING)], name="spotify_user_id_unique", unique=True),
+    ]),
+    (playlists_collection, [
+        # One row per (owner, playlist); its prefix serves the per-owner listing
+        IndexModel(
+            [("owner_spotify_id", ASCENDING), ("playlist_spotify_id", ASCENDING)],
+            name="owner_playlist_unique",
+            unique=True
+        ),
+        IndexModel([("playlist_spotify_id", ASCENDING)], name="playlist_spotify_id"),
+    ]),
+    (tracks_collection, [
+        # One document per (track, playlist); its prefix also serves lookups by track_spotify_id alone
+        IndexModel(
+            [("track_spotify_id", ASCENDING), ("playlist_spotify_id", ASCENDING)],
+            name="track_playlist_unique",
+            unique=True
+        ),
+        # Playlist listing plus the enriched/total counts per playlist
+        IndexModel([("playlist_spotify_id", ASCENDING), ("is_enriched", ASCENDING)], name="playlist_enriched"),
+        # Liked songs are one shared document per track, filtered by member and paged by _id descending (stored order)
+        IndexModel(
+            [("playlist_spotify_id", ASCENDING), ("users_with_track", ASCENDING), ("_id", DESCENDING)],
+            name="playlist_members_order"
+        ),
+        # Playlist pages in Spotify order (keyset pagination on position, then _id)
+        IndexModel(
+            [("playlist_spotify_id", ASCENDING), ("track_position", ASCENDING), ("_id", ASCENDING)],
+            name="playlist_position_order"
+        ),
+    ]),
+    (jobs_collection, [
+        # At most one queued/running job per dedup key; finished jobs drop the field
+        IndexModel(
+            [("active_dedup_key", ASCENDING)],
+            name="active_dedup_key_unique",
+            unique=True,
+            partialFilterExpression={"active_dedup_key": {"$exists": True}}
+        ),
+        # Claiming: most urgent due job, and expired leases
+        IndexModel(
+            [("status", ASCENDING), ("job_type", ASCENDING), ("priority", DESCENDING), ("run_after", ASCENDING)],
+            name="claim_order"
+        ),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="expired_leases"),
+        # Freshness check for sync triggers
+        IndexModel([("dedup_key", ASCENDING), ("status", ASCENDING), ("finished_at", DESCENDING)], name="recent_by_dedup_key"),
+        # Finished jobs are removed after the retention period (queued/running jobs have no finished_at date)
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=JOB_RETENTION_HOURS * 3600),
+    ]),
+    (sync_progress_collection, [
+        # One row per (user, playlist); its prefix serves the stream's per-user reads
+        IndexModel(
+            [("spotify_user_id", ASCENDING), ("playlist_spotify_id", ASCENDING)],
+            name="user_playlist_unique",
+            unique=True
+        ),
+        IndexModel([("spotify_user_id", ASCENDING), ("updated_at", ASCENDING)], name="user_updated_at"),
+    ]),
+]
+
+# (collection, filter, description) for every query on a hot path
+HOT_QUERIES = [
+    (users_collection, {"spotify_user_id": "__plan_check__"}, "users by spotify_user_id"),
+    (playlists_collection, {"owner_spotify_id": "__plan_check__"}, "playlists by owner"),
+    (playlists_collection, {"playlist_spotify_id": "__plan_check__"}, "playlists by playlist id"),
+    (tracks_collection, {"playlist_spotify_id": "__plan_check__"}, "tracks by playlist"),
+    (tracks_collection, {"playlist_spotify_id": "__plan_check__", "is_enriched": True}, "enriched tracks by playlist"),
+    (tracks_collection, {"track_spotify_id": "__plan_check__"}, "tracks by track id"),
+    (
+        tracks_collection,
+        {"playlist_spotify_id": "liked_songs", "users_with_track": "__plan_check__"},
+        "liked songs by member"
+    ),
+    (
+        tracks_collection,
+        {"track_spotify_id": "__plan_check__", "playlist_spotify_id": "__plan_check__"},
+        "tracks by (track id, playlist id)"
+    ),
+    (
+        jobs_collection,
+        {"dedup_key": "__plan_check__", "status": "succeeded", "finished_at": {"$gte": 0}},
+        "recent jobs by dedup key"
+    ),
+    (
+        sync_progress_collection,
+        {"spotify_user_id": "__plan_check__", "updated_at": {"$gte": 0}},
+        "sync progress by user since"
+    ),
+]
+
+def _index_name(collection, index):
+    return f"{collection.name}.{index.document['name']}"
+
+async def find_duplicate_keys(collection, index, limit=None):
+    """Groups of documents sharing the key of a unique index: [{"_id": key, "ids": [...], "count": n}]."""
+    pipeline = [
+        {"$match": index.document.get("partialFilterExpression", {})},
+        {"$group": {
+            "_id": {field: f"${field}" for field in index.document["key"]},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+async def remove_duplicate_keys(collection, index):
+    """Keep one document per unique key (enriched first, then the newest) and delete the rest.
+
+    Liked-songs members (users_with_track) of the removed copies are merged into the kept one.
+    """
+    removed = 0
+    for group in await find_duplicate_keys(collection, index):
+        documents = await collection.find({"_id": {"$in": group["ids"]}}).to_list(length=None)
+        documents.sort(key=lambda document: (document.get("is_enriched") is True, document["_id"]), reverse=True)
+        kept, duplicates = documents[0], documents[1:]
+        members = [member for document in duplicates for member in document.get("users_with_track") or []]
+        if members:
+            await collection.update_one({"_id": kept["_id"]}, {"$addToSet": {"users_with_track": {"$each": members}}})
+        result = await collection.delete_many({"_id": {"$in": [document["_id"] for document in duplicates]}})
+        removed += result.deleted_count
+    return removed
+
+async def ensure_indexes():
+    created = []
+    errors = {}
+    for collection, indexes in REQUIRED_INDEXES:
+        # One call per index: a failing index must not keep the others from being built
+        for index in indexes:
+            try:
+                created.extend(await collection.create_indexes([index]))
+            except Exception as e:
+                # e.g. duplicates left over in an old database block a unique index; keep serving
+                errors[_index_name(collection, index)] = str(e)
+                print(f"Failed to create index {_index_name(collection, index)}: {str(e)}")
+                if index.document.get("unique"):
+                    try:
+                        duplicates = await find_duplicate_keys(collection, index, limit=5)
+                    except Exception as lookup_error:
+                        duplicates = []
+                        print(f"Failed to look up duplicate keys: {str(lookup_error)}")
+                    if duplicates:
+                        print(f"Duplicate keys blocking {_index_name(collection, index)} (run `python -m database.indexes --dedupe`):")
+                        for group in duplicates:
+                            print(f"  {group['_id']} x{group['count']}")
+
+    return {
+        "success": not errors,
+        "message": "Indexes are in place" if not errors else "Some indexes could not be created",
+        "details": {
+            "created": created,
+            "errors": errors
+        }
+    }
+
+async def missing_indexes():
+    """Names of the required indexes that don't exist on their collection."""
+    missing = []
+    for collection, indexes in REQUIRED_INDEXES:
+        existing = {index["name"] async for index in collection.list_indexes()}
+        missing.extend(_index_name(collection, index) for index in indexes if index.document["name"] not in existing)
+    return missing
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def check_query_plans():
+    collection_scans = []
+    for collection, query, description in HOT_QUERIES:
+        explained = await collection.find(query).explain()
+        winning_plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_plan_stages(winning_plan)):
+            collection_scans.append(f"{collection.name}: {description}")
+
+    return {
+        "success": not collection_scans,
+        "message": "All hot queries use an index" if not collection_scans else "Hot queries fall back to a collection scan",
+        "details": collection_scans
+    }
+
+async def _main(check, dedupe):
+    if dedupe:
+        for collection, indexes in REQUIRED_INDEXES:
+            for index in indexes:
+                if index.document.get("unique"):
+                    removed = await remove_duplicate_keys(collection, index)
+                    print(f"Removed {removed} duplicate documents for {_index_name(collection, index)}")
+        print("Recount the playlist counters with `python worker.py --repair-counters`")
+    result = await ensure_indexes()
+    print(result["message"])
+    if check:
+        missing = await missing_indexes()
+        for name in missing:
+            print(f"  MISSING - {name}")
+        plans = await check_query_plans()
+        print(plans["message"])
+        for scan in plans["details"]:
+            print(f"  COLLSCAN - {scan}")
+        return result["success"] and not missing and plans["success"]
+    return result["success"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the required Mongo indexes")
+    parser.add_argument("--check", action="store_true", help="fail on missing indexes and on hot queries that scan the collection")
+    parser.add_argument("--dedupe", action="store_true", help="remove documents that block a unique index before creating it")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(_main(args.check, args.dedupe)) else 1)
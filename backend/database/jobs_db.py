@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .database import jobs_collection
+
+# queued -> running -> succeeded | failed; a failed attempt with retries left goes back to queued
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+def job_summary(job):
+    return {
+        "job_id": str(job["_id"]),
+        "job_type": job.get("job_type"),
+        "status": job.get("status"),
+        "priority": job.get("priority", 0),
+        "attempts": job.get("attempts", 0),
+        "max_attempts": job.get("max_attempts"),
+        "progress": job.get("progress", {}),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "finished_at": job.get("finished_at")
+    }
+
+async def db_enqueue_job(job_type: str, payload: dict, dedup_key: str = None, priority: int = 0, max_attempts: int = 3):
+    """Insert a queued job; while a job with the same dedup_key is queued or running, return that one instead."""
+    now = datetime.utcnow()
+    job = {
+        "job_type": job_type,
+        "payload": payload,
+        "status": JOB_QUEUED,
+        "priority": priority,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_after": now,
+        "lease_until": None,
+        "worker_id": None,
+        "progress": {},
+        "result": None,
+        "error": None,
+        "dedup_key": dedup_key,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None
+    }
+    if dedup_key:
+        # Unique (partial) index: only one active job per key
+        job["active_dedup_key"] = dedup_key
+
+    try:
+        result = await jobs_collection.insert_one(job)
+        return {
+            "success": True,
+            "message": "Job queued",
+            "details": {"job_id": str(result.inserted_id), "created": True}
+        }
+    except DuplicateKeyError:
+        existing = await jobs_collection.find_one_and_update(
+            {"active_dedup_key": dedup_key},
+            # A more urgent trigger raises the queued job's priority
+            {"$max": {"priority": priority}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not existing:
+            # The active job finished between the insert and the lookup
+            return await db_enqueue_job(job_type, payload, dedup_key, priority, max_attempts)
+        return {
+            "success": True,
+            "message": "Job already queued",
+            "details": {"job_id": str(existing["_id"]), "created": False}
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": "Unable to queue the job",
+            "details": str(e)
+        }
+
+async def db_get_recent_job(dedup_key: str, status: str, since: datetime):
+    return await jobs_collection.find_one(
+        {"dedup_key": dedup_key, "status": status, "finished_at": {"$gte": since}},
+        {"_id": 1}
+    )
+
+async def db_get_job(job_id: str):
+    try:
+        return await jobs_collection.find_one({"_id": ObjectId(job_id)})
+    except InvalidId:
+        return None
+
+async def db_claim_job(worker_id: str, job_types, lease_seconds: int):
+    """Lease the most urgent runnable job: queued and due, or running with an expired lease (its worker died)."""
+    now = datetime.utcnow()
+    return await jobs_collection.find_one_and_update(
+        {
+            "job_type": {"$in": list(job_types)},
+            "$or": [
+                {"status": JOB_QUEUED, "run_after": {"$lte": now}},
+                {"status": JOB_RUNNING, "lease_until": {"$lt": now}}
+            ]
+        },
+        {
+            "$set": {
+                "status": JOB_RUNNING,
+                "worker_id": worker_id,
+                "lease_until": now + timedelta(seconds=lease_seconds),
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("priority", -1), ("run_after", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def db_extend_job_lease(job_id, worker_id: str, lease_seconds: int):
+    """Returns False when the lease was lost to another worker."""
+    now = datetime.utcnow()
+    result = await jobs_collection.update_one(
+        {"_id": job_id, "status": JOB_RUNNING, "worker_id": worker_id},
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now}}
+    )
+    return result.matched_count == 1
+
+async def db_update_job_progress(job_id, progress: dict):
+    await jobs_collection.update_one(
+        {"_id": job_id},
+        {"$set": {
+            **{f"progress.{key}": value for key, value in progress.items()},
+            "updated_at": datetime.utcnow()
+        }}
+    )
+
+async def db_finish_job(job_id, worker_id: str, succeeded: bool, result=None, error: str = None):
+    now = datetime.utcnow()
+    await jobs_collection.update_one(
+        {"_id": job_id, "worker_id": worker_id},
+        {
+            "$set": {
+                "status": JOB_SUCCEEDED if succeeded else JOB_FAILED,
+                "result": result,
+                "error": error,
+                "lease_until": None,
+                "finished_at": now,
+                "updated_at": now
+            },
+            # Frees the dedup key for the next trigger
+            "$unset": {"active_dedup_key": ""}
+        }
+    )
+
+async def db_retry_job(job_id, worker_id: str, error: str, run_after: datetime):
+    await jobs_collection.update_one(
+        {"_id": job_id, "worker_id": worker_id},
+        {"$set": {
+            "status": JOB_QUEUED,
+            "error": error,
+            "lease_until": None,
+            "worker_id": None,
+            "run_after": run_after,
+            "updated_at": datetime.utcnow()
+        }}
+    )
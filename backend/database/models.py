@@ -12,6 +12,7 @@ class SpotifyUserDetails(BaseModel):
     created_at: datetime
     access_token: str
     refresh_token: str
+    access_token_expires_at: Optional[datetime] = None
     credits: int = 0
     signup_enriched: bool = False
     is_enriched: bool = False
@@ -27,6 +28,11 @@ class SpotifyUserPlaylistDetails(BaseModel):
     is_public: bool
     playlist_description: str
     is_enriched: bool = False
+    snapshot_id: Optional[str] = None  # Spotify's version id for the playlist contents
+    tracks_synced_snapshot_id: Optional[str] = None  # snapshot the stored tracks were fetched at
+    tracks_synced_at: Optional[datetime] = None
+    tracks_total: Optional[int] = None  # stored tracks (per owner for liked songs), maintained with $inc
+    tracks_enriched: Optional[int] = None
 
 class SpotifyTrackDetails(BaseModel):
     spotify_user_id: str
@@ -34,13 +40,17 @@ class SpotifyTrackDetails(BaseModel):
     track_spotify_id: str
     track_name: str
     track_artists: list[str]
+    track_artist_ids: list[str] = []  # Spotify artist ids, same order as track_artists
     track_album_name: str
     track_album_img: str
     track_external_url: str
     track_preview_url: Optional[str]
     track_genre: list[str]
     track_language: str
+    language_source: Optional[str] = None  # "script" (detected offline at ingest), "artist_index" or "model"
+    enrichment_source: Optional[str] = None  # where the genre came from: "spotify", "artist_index" or "model"
     track_duration_ms: int
+    track_position: Optional[int] = None  # Position in the Spotify playlist at the last sync
     is_enriched: bool = False
     connected_ids: list[str] = []
     contributor: str | None = None  # Spotify user ID who enriched this track
@@ -1,13 +1,28 @@
+from datetime import datetime
+
+from pymongo import UpdateMany
+
 from .models import SpotifyUserPlaylistDetails
 from .database import playlists_collection
 
+LIKED_SONGS_PLAYLIST_ID = "liked_songs"
+
+def playlist_upsert_update(playlist_model):
+    """$set the listing fields we were given; enrichment, sync state and track counters are never reset by a listing refresh."""
+    document = playlist_model.dict(exclude_unset=True)
+    for field in ("tracks_synced_snapshot_id", "tracks_synced_at", "tracks_total", "tracks_enriched"):
+        document.pop(field, None)
+    on_insert = {"is_enriched": document.pop("is_enriched", False)}
+    return {"$set": document, "$setOnInsert": on_insert}
+
 async def db_update_playlists_details(data):
     playlist_model = SpotifyUserPlaylistDetails(**data)
 
     try:
-        await playlists_collection.update_one(
-            {"playlist_spotify_id": playlist_model.playlist_spotify_id},
-            {"$set": playlist_model.dict()},
+        # Playlists are stored per owner: followed playlists and "liked_songs" share ids across users
+        result = await playlists_collection.update_one(
+            {"owner_spotify_id": playlist_model.owner_spotify_id, "playlist_spotify_id": playlist_model.playlist_spotify_id},
+            playlist_upsert_update(playlist_model),
             upsert=True
         )
 
@@ -15,7 +30,8 @@ async def db_update_playlists_details(data):
             "message": "Playlist details saved successfully",
             "details": {
                 "playlist name": playlist_model.playlist_name,
-                "playlists track count": playlist_model.playlist_tracks_count
+                "playlists track count": playlist_model.playlist_tracks_count,
+                "changed": bool(result.modified_count or result.upserted_id)
             }
         }
     
@@ -25,11 +41,33 @@ async def db_update_playlists_details(data):
             "details": str(e)
         }
 
-async def db_get_user_playlists(spotify_user_id: str):
+# Fields of a playlist row shown to its owner; sync bookkeeping stays in the database
+PLAYLIST_LIST_PROJECTION = {
+    "_id": 0,
+    "playlist_spotify_id": 1,
+    "playlist_name": 1,
+    "playlist_description": 1,
+    "playlist_dp": 1,
+    "playlist_tracks_count": 1,
+    "external_url_playlist": 1,
+    "owner_spotify_id": 1,
+    "is_enriched": 1
+}
+PLAYLIST_DETAILS_PROJECTION = {
+    **PLAYLIST_LIST_PROJECTION,
+    "_id": 1,
+    "is_public": 1,
+    "snapshot_id": 1,
+    "tracks_total": 1,
+    "tracks_enriched": 1
+}
+
+async def db_get_user_playlists(spotify_user_id: str, projection=None):
     """Get all playlists for a user from the database."""
     try:
         playlists = await playlists_collection.find(
-            {"owner_spotify_id": spotify_user_id}
+            {"owner_spotify_id": spotify_user_id},
+            projection
         ).to_list(length=None)
         
         return {
@@ -42,4 +80,104 @@ async def db_get_user_playlists(spotify_user_id: str):
             "success": False,
             "message": "Failed to get playlists from database",
             "details": str(e)
-        }
\ No newline at end of file
+        }
+
+async def db_get_playlist_sync_state(spotify_user_id: str, playlist_spotify_id: str):
+    """Snapshot the user's playlist row is at, and whether any row already has tracks synced at it."""
+    playlist = await playlists_collection.find_one(
+        {"owner_spotify_id": spotify_user_id, "playlist_spotify_id": playlist_spotify_id},
+        {"snapshot_id": 1, "tracks_synced_snapshot_id": 1}
+    )
+    snapshot_id = (playlist or {}).get("snapshot_id")
+    if not snapshot_id:
+        return {"snapshot_id": None, "is_current": False}
+    if playlist.get("tracks_synced_snapshot_id") == snapshot_id:
+        return {"snapshot_id": snapshot_id, "is_current": True}
+
+    # Tracks are stored per playlist, so another follower's sync of the same snapshot counts too
+    synced_elsewhere = await playlists_collection.find_one(
+        {"playlist_spotify_id": playlist_spotify_id, "tracks_synced_snapshot_id": snapshot_id},
+        {"_id": 1}
+    )
+    return {"snapshot_id": snapshot_id, "is_current": synced_elsewhere is not None}
+
+async def db_mark_playlist_tracks_synced(playlist_spotify_id: str, snapshot_id: str):
+    """Record a successful track sync on every row for the playlist currently at this snapshot."""
+    await playlists_collection.update_many(
+        {"playlist_spotify_id": playlist_spotify_id, "snapshot_id": snapshot_id},
+        {"$set": {"tracks_synced_snapshot_id": snapshot_id, "tracks_synced_at": datetime.utcnow()}}
+    )
+
+async def db_get_liked_songs_sync_state(spotify_user_id: str, playlist_spotify_id: str = LIKED_SONGS_PLAYLIST_ID):
+    """High-water mark (newest `added_at` stored) and last full reconcile of the user's liked songs."""
+    playlist = await playlists_collection.find_one(
+        {"owner_spotify_id": spotify_user_id, "playlist_spotify_id": playlist_spotify_id},
+        {"liked_songs_watermark": 1, "liked_songs_reconciled_at": 1}
+    )
+    return {
+        "watermark": (playlist or {}).get("liked_songs_watermark"),
+        "reconciled_at": (playlist or {}).get("liked_songs_reconciled_at")
+    }
+
+async def db_set_liked_songs_sync_state(spotify_user_id: str, watermark: str, reconciled: bool, playlist_spotify_id: str = LIKED_SONGS_PLAYLIST_ID):
+    update = {"liked_songs_watermark": watermark}
+    if reconciled:
+        update["liked_songs_reconciled_at"] = datetime.utcnow()
+    await playlists_collection.update_one(
+        {"owner_spotify_id": spotify_user_id, "playlist_spotify_id": playlist_spotify_id},
+        {"$set": update}
+    )
+
+def _enriched_flag():
+    return {"$and": [{"$gt": ["$tracks_total", 0]}, {"$gte": ["$tracks_enriched", "$tracks_total"]}]}
+
+def _counters_update(tracks_total, tracks_enriched):
+    # Pipeline update: adjust both counters, then derive is_enriched from them in the same write
+    return [
+        {"$set": {
+            "tracks_total": {"$add": ["$tracks_total", tracks_total]},
+            "tracks_enriched": {"$add": ["$tracks_enriched", tracks_enriched]}
+        }},
+        {"$set": {"is_enriched": _enriched_flag()}}
+    ]
+
+async def db_inc_playlist_counters(playlist_spotify_id: str, tracks_total: int = 0, tracks_enriched: int = 0, owner_ids=None):
+    """Atomically adjust the materialized track counters (and is_enriched) on every row of a playlist,
+    or only the given owners' rows. Rows that were never counted are left for a recount."""
+    if not tracks_total and not tracks_enriched:
+        return
+    query = {"playlist_spotify_id": playlist_spotify_id, "tracks_total": {"$exists": True}}
+    if owner_ids is not None:
+        query["owner_spotify_id"] = {"$in": list(owner_ids)}
+    await playlists_collection.update_many(query, _counters_update(tracks_total, tracks_enriched))
+
+async def db_apply_enriched_deltas(playlist_deltas: dict, liked_deltas: dict):
+    """Add newly enriched copies to many playlists in one bulk write.
+
+    playlist_deltas is {playlist id: copies}, liked_deltas {owner id: copies} for liked-songs rows.
+    """
+    operations = [
+        UpdateMany(
+            {"playlist_spotify_id": playlist_id, "tracks_total": {"$exists": True}},
+            _counters_update(0, delta)
+        )
+        for playlist_id, delta in playlist_deltas.items()
+    ] + [
+        UpdateMany(
+            {"playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID, "owner_spotify_id": owner_id, "tracks_total": {"$exists": True}},
+            _counters_update(0, delta)
+        )
+        for owner_id, delta in liked_deltas.items()
+    ]
+    if operations:
+        await playlists_collection.bulk_write(operations, ordered=False)
+
+async def db_set_playlist_counters(playlist_spotify_id: str, tracks_total: int, tracks_enriched: int, owner_id: str = None):
+    query = {"playlist_spotify_id": playlist_spotify_id}
+    if owner_id is not None:
+        query["owner_spotify_id"] = owner_id
+    await playlists_collection.update_many(query, {"$set": {
+        "tracks_total": tracks_total,
+        "tracks_enriched": tracks_enriched,
+        "is_enriched": tracks_total > 0 and tracks_enriched >= tracks_total
+    }})
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from .database import sync_progress_collection
+
+# Counters reset when a sync starts; tracks_enriched is reset by each enrichment run instead
+PROGRESS_COUNTERS = ("pages_fetched", "tracks_stored", "errors")
+
+def progress_summary(progress):
+    return {
+        "playlist_spotify_id": progress.get("playlist_spotify_id"),
+        "stage": progress.get("stage"),
+        "skipped": progress.get("skipped", False),
+        "pages_fetched": progress.get("pages_fetched", 0),
+        "pages_total": progress.get("pages_total"),
+        "tracks_total": progress.get("tracks_total"),
+        "tracks_stored": progress.get("tracks_stored", 0),
+        "tracks_to_enrich": progress.get("tracks_to_enrich"),
+        "tracks_enriched": progress.get("tracks_enriched", 0),
+        "errors": progress.get("errors", 0),
+        "last_error": progress.get("last_error"),
+        "updated_at": progress.get("updated_at")
+    }
+
+async def db_update_sync_progress(spotify_user_id: str, playlist_spotify_id: str, fields: dict = None, increments: dict = None, reset: bool = False):
+    """Upsert the (user, playlist) progress row: $set fields, $inc counters, bump its version."""
+    now = datetime.utcnow()
+    set_fields = {}
+    if reset:
+        set_fields.update({counter: 0 for counter in PROGRESS_COUNTERS})
+        set_fields.update({"last_error": None, "started_at": now})
+    set_fields.update({**(fields or {}), "updated_at": now})
+    update = {"$set": set_fields, "$inc": {"version": 1}}
+    for counter, amount in (increments or {}).items():
+        if counter in set_fields:
+            set_fields[counter] += amount
+        else:
+            update["$inc"][counter] = amount
+
+    return await sync_progress_collection.find_one_and_update(
+        {"spotify_user_id": spotify_user_id, "playlist_spotify_id": playlist_spotify_id},
+        update,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+async def db_get_sync_progress_since(spotify_user_id: str, since: datetime = None):
+    query = {"spotify_user_id": spotify_user_id}
+    if since:
+        query["updated_at"] = {"$gte": since}
+    return await sync_progress_collection.find(query).sort("updated_at", 1).to_list(length=None)
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from config import SPOTIFY_ARTIST_CACHE_DAYS
+from .database import spotify_artists_collection
+
+# One document per Spotify artist id: {"name", "genres": [Spotify genre strings], "fetched_at"}
+
+async def db_get_spotify_artists(artist_ids, fresh_only=False):
+    """{artist_id: cached artist document} in one query; fresh_only skips entries due for a refetch."""
+    artist_ids = list(dict.fromkeys(artist_id for artist_id in artist_ids if artist_id))
+    if not artist_ids:
+        return {}
+    query = {"_id": {"$in": artist_ids}}
+    if fresh_only:
+        query["fetched_at"] = {"$gte": datetime.utcnow() - timedelta(days=SPOTIFY_ARTIST_CACHE_DAYS)}
+    documents = await spotify_artists_collection.find(query, {"genres": 1, "name": 1}).to_list(length=None)
+    return {document["_id"]: document for document in documents}
+
+async def db_store_spotify_artists(artists):
+    """Upsert artist objects as returned by Spotify's /v1/artists."""
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"_id": artist["id"]},
+            {"$set": {"name": artist.get("name"), "genres": artist.get("genres") or [], "fetched_at": now}},
+            upsert=True
+        )
+        for artist in artists
+        if artist and artist.get("id")
+    ]
+    if operations:
+        await spotify_artists_collection.bulk_write(operations, ordered=False)
@@ -1,30 +1,205 @@
+import base64
+import json
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
 from .database import tracks_collection
 from .models import SpotifyTrackDetails
+from .playlist_db import LIKED_SONGS_PLAYLIST_ID
 
-async def db_update_track_details(track_data):
-    track_model = SpotifyTrackDetails(**track_data)
-    try:
-        existing = await tracks_collection.find_one({"track_spotify_id": track_model.track_spotify_id, "playlist_spotify_id": track_model.playlist_spotify_id})
-        if not existing:
-            result=await tracks_collection.insert_one(track_model.dict())
-        else:
-            result=await tracks_collection.update_one(
-                {"track_spotify_id": track_model.track_spotify_id, "playlist_spotify_id": track_model.playlist_spotify_id},
-                {"$set": track_model.dict()}
-            )
-        return {
-                "success": True,
-                "message": "User details saved successfully",
+# Fields owned by the enrichment path; a re-sync must never overwrite them on an existing track
+ENRICHMENT_FIELDS = (
+    "track_genre", "track_language", "language_source", "enrichment_source", "is_enriched", "contributor", "connected_ids"
+)
+
+def _track_upsert_operation(track_model):
+    document = track_model.dict()
+    users_with_track = document.pop("users_with_track")
+    on_insert = {field: document.pop(field) for field in ENRICHMENT_FIELDS}
+    update = {"$set": document, "$setOnInsert": on_insert}
+    if users_with_track:
+        # Membership is merged atomically so concurrent syncs from different users never drop each other
+        update["$addToSet"] = {"users_with_track": {"$each": users_with_track}}
+    else:
+        on_insert["users_with_track"] = []
+    return UpdateOne(
+        {"track_spotify_id": track_model.track_spotify_id, "playlist_spotify_id": track_model.playlist_spotify_id},
+        update,
+        upsert=True
+    )
+
+async def db_bulk_upsert_tracks(tracks_data):
+    """Validate a page of tracks and upsert them with a single unordered bulk_write.
+
+    Invalid items and items rejected by Mongo are reported in details["failed"]
+    instead of aborting the rest of the page.
+    """
+    failed = []
+    operations = []
+    operation_track_ids = []
+    for track_data in tracks_data:
+        try:
+            track_model = SpotifyTrackDetails(**track_data)
+        except Exception as ex:
+            failed.append({"track_spotify_id": track_data.get("track_spotify_id"), "details": str(ex)})
+            continue
+        operations.append(_track_upsert_operation(track_model))
+        operation_track_ids.append(track_model.track_spotify_id)
+
+    upserted_count = 0
+    modified_count = 0
+    upserted_track_ids = []
+    if operations:
+        try:
+            result = await tracks_collection.bulk_write(operations, ordered=False)
+            upserted_count = result.upserted_count
+            modified_count = result.modified_count
+            upserted_track_ids = [operation_track_ids[index] for index in result.upserted_ids]
+        except BulkWriteError as bwe:
+            upserted_count = bwe.details.get("nUpserted", 0)
+            modified_count = bwe.details.get("nModified", 0)
+            upserted_track_ids = [operation_track_ids[upserted["index"]] for upserted in bwe.details.get("upserted", [])]
+            for error in bwe.details.get("writeErrors", []):
+                failed.append({
+                    "track_spotify_id": operation_track_ids[error["index"]],
+                    "details": error.get("errmsg", "Unknown write error")
+                })
+        except Exception as ex:
+            return {
+                "success": False,
+                "message": "Unable to save/update the tracks' data to the database",
                 "details": {
-                    "spotify_user_id": track_model.spotify_user_id,
-                    "track_name": track_model.track_name,
-                    "track_album_name": track_model.track_album_name
+                    "upserted_count": 0,
+                    "modified_count": 0,
+                    "upserted_track_ids": [],
+                    "failed": failed + [{"track_spotify_id": track_id, "details": str(ex)} for track_id in operation_track_ids]
                 }
             }
-    
-    except Exception as ex:
-        return {
-            "success": False,
-            "message": "Unable to save/update the track's data to the database",
-            "details": str(ex)
+
+    return {
+        "success": True,
+        "message": "Tracks saved successfully",
+        "details": {
+            "upserted_count": upserted_count,
+            "modified_count": modified_count,
+            "upserted_track_ids": upserted_track_ids,
+            "failed": failed
         }
+    }
+
+# Fields the track list renders (plus the cursor keys); membership lists grow with a track's popularity
+TRACK_LIST_PROJECTION = {
+    "_id": 1,
+    "track_position": 1,
+    "track_spotify_id": 1,
+    "track_name": 1,
+    "track_artists": 1,
+    "track_album_name": 1,
+    "track_album_img": 1,
+    "track_external_url": 1,
+    "track_preview_url": 1,
+    "track_genre": 1,
+    "track_language": 1,
+    "track_duration_ms": 1,
+    "is_enriched": 1,
+    "contributor": 1
+}
+
+def _tracks_sort(by_position):
+    # Playlists follow Spotify's order. Liked songs are shared documents with no per-user liked date, so they are
+    # paged by _id (most recently stored document first); this is stable but not the user's liked order.
+    return [("track_position", ASCENDING), ("_id", ASCENDING)] if by_position else [("_id", DESCENDING)]
+
+def encode_tracks_cursor(track, by_position):
+    position = {"p": track.get("track_position")} if by_position else {}
+    payload = json.dumps({**position, "id": str(track["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def _cursor_filter(cursor, by_position):
+    """Filter selecting the tracks after the cursor in _tracks_sort order; ValueError when it can't be decoded."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_id = ObjectId(payload["id"])
+        position = payload.get("p")
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+    if not by_position:
+        return {"_id": {"$lt": last_id}}
+    if position is None:
+        # Tracks stored before positions were recorded sort first (null < numbers)
+        return {"$or": [
+            {"track_position": None, "_id": {"$gt": last_id}},
+            {"track_position": {"$type": "number"}}
+        ]}
+    return {"$or": [
+        {"track_position": {"$gt": position}},
+        {"track_position": position, "_id": {"$gt": last_id}}
+    ]}
+
+async def db_get_playlist_tracks_page(query, limit, cursor=None, offset=0, by_position=True, projection=TRACK_LIST_PROJECTION):
+    """One page of tracks in a stable order. With a cursor the page starts right after it; offset is
+    only used without one (kept for older clients, it still scans the skipped documents)."""
+    if cursor:
+        query = {"$and": [query, _cursor_filter(cursor, by_position)]}
+
+    find = tracks_collection.find(query, projection).sort(_tracks_sort(by_position))
+    if not cursor and offset:
+        find = find.skip(offset)
+    # One extra document tells us whether there is a next page without counting
+    tracks = await find.limit(limit + 1).to_list(length=None)
+    has_more = len(tracks) > limit
+    tracks = tracks[:limit]
+
+    return {
+        "tracks": tracks,
+        "has_more": has_more,
+        "next_cursor": encode_tracks_cursor(tracks[-1], by_position) if has_more and tracks else None
+    }
+
+async def db_commit_track_enrichments(enrichments: dict):
+    """Write {track_spotify_id: enrichment fields} to every unenriched copy of each track.
+
+    One aggregation counts the copies about to flip per playlist (per member for
+    liked songs), then one bulk write of UpdateMany operations flips them, however
+    many playlists share a track. expected_count != modified_count means another
+    writer enriched some copies in between, so the deltas are no longer exact.
+    """
+    unenriched = {"track_spotify_id": {"$in": list(enrichments)}, "is_enriched": {"$ne": True}}
+    counted = await tracks_collection.aggregate([
+        {"$match": unenriched},
+        {"$facet": {
+            "playlists": [
+                {"$match": {"playlist_spotify_id": {"$ne": LIKED_SONGS_PLAYLIST_ID}}},
+                {"$group": {"_id": "$playlist_spotify_id", "copies": {"$sum": 1}}}
+            ],
+            "liked_members": [
+                {"$match": {"playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID}},
+                {"$unwind": "$users_with_track"},
+                {"$group": {"_id": "$users_with_track", "copies": {"$sum": 1}}}
+            ],
+            "liked_copies": [
+                {"$match": {"playlist_spotify_id": LIKED_SONGS_PLAYLIST_ID}},
+                {"$count": "copies"}
+            ]
+        }}
+    ]).to_list(length=None)
+    facets = counted[0] if counted else {}
+    playlist_deltas = {row["_id"]: row["copies"] for row in facets.get("playlists", [])}
+    liked_deltas = {row["_id"]: row["copies"] for row in facets.get("liked_members", [])}
+    liked_copies = facets.get("liked_copies") or [{"copies": 0}]
+    expected_count = sum(playlist_deltas.values()) + liked_copies[0]["copies"]
+
+    result = await tracks_collection.bulk_write([
+        UpdateMany({"track_spotify_id": track_spotify_id, "is_enriched": {"$ne": True}}, {"$set": fields})
+        for track_spotify_id, fields in enrichments.items()
+    ], ordered=False)
+
+    return {
+        "modified_count": result.modified_count,
+        "expected_count": expected_count,
+        "playlist_deltas": playlist_deltas,
+        "liked_deltas": liked_deltas
+    }
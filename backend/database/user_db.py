@@ -2,7 +2,7 @@ from .models import SpotifyUserDetails # user details schema format needed for d
 from datetime import datetime # datetime needed to store the creation time
 from .database import users_collection # users collection stored in the mongodb database
 
-async def db_update_user_details(data, access_token_encrypted, refresh_token_encrypted):
+async def db_update_user_details(data, access_token_encrypted, refresh_token_encrypted, access_token_expires_at=None):
     try:
         # Saving the details to the database in SpotifyUserDetails format
         user_data = {
@@ -16,6 +16,7 @@ async def db_update_user_details(data, access_token_encrypted, refresh_token_enc
             "is_enriched": False,
             "access_token": access_token_encrypted,
             "refresh_token": refresh_token_encrypted,
+            "access_token_expires_at": access_token_expires_at,
             "credits": 0,
             "signup_enriched": False
         }
@@ -55,6 +56,29 @@ async def db_update_user_details(data, access_token_encrypted, refresh_token_enc
             "details": str(ex)
         }
     
-async def db_get_user_details(spotify_user_id):
-    user = await users_collection.find_one({"spotify_user_id": spotify_user_id})
+# Everything /me returns; the encrypted tokens are never read for it
+USER_DETAILS_PROJECTION = {
+    "_id": 0,
+    "spotify_user_id": 1,
+    "username": 1,
+    "email": 1,
+    "country": 1,
+    "profile_picture": 1,
+    "created_at": 1,
+    "credits": 1,
+    "is_enriched": 1
+}
+
+async def db_set_playlists_synced_at(spotify_user_id, synced_at):
+    await users_collection.update_one(
+        {"spotify_user_id": spotify_user_id},
+        {"$set": {"playlists_synced_at": synced_at}}
+    )
+
+async def db_get_playlists_synced_at(spotify_user_id):
+    user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"playlists_synced_at": 1})
+    return (user or {}).get("playlists_synced_at")
+
+async def db_get_user_details(spotify_user_id, projection=USER_DETAILS_PROJECTION):
+    user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, projection)
     return user
\ No newline at end of file
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from .database import data_versions_collection
+from .playlist_db import LIKED_SONGS_PLAYLIST_ID
+
+# Data version scopes: a read endpoint's ETag is derived from the versions of the scopes it reads
+def user_scope(spotify_user_id):
+    return f"user:{spotify_user_id}"
+
+def playlists_scope(spotify_user_id):
+    """The user's playlist rows (listing, counters, enrichment flags)."""
+    return f"playlists:{spotify_user_id}"
+
+def playlist_tracks_scope(playlist_spotify_id, spotify_user_id=None):
+    """Stored tracks of a playlist; liked songs are versioned per user."""
+    if playlist_spotify_id == LIKED_SONGS_PLAYLIST_ID:
+        return f"liked:{spotify_user_id}"
+    return f"playlist:{playlist_spotify_id}"
+
+async def db_bump_data_versions(scopes):
+    """Invalidate every ETag derived from these scopes. Best effort: a failed bump only delays revalidation."""
+    scopes = list(dict.fromkeys(scope for scope in scopes if scope))
+    if not scopes:
+        return
+    now = datetime.utcnow()
+    try:
+        await data_versions_collection.bulk_write([
+            UpdateOne({"_id": scope}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+            for scope in scopes
+        ], ordered=False)
+    except Exception as e:
+        print(f"Failed to bump data versions {scopes}: {str(e)}")
+
+async def db_get_data_versions(scopes):
+    """{scope: version} for the given scopes in one query; never-written scopes are version 0."""
+    found = await data_versions_collection.find({"_id": {"$in": list(scopes)}}, {"version": 1}).to_list(length=None)
+    versions = {row["_id"]: row.get("version", 0) for row in found}
+    return {scope: versions.get(scope, 0) for scope in scopes}
@@ -1,10 +1,17 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import ASGIApp
 
-from config import FRONTEND_ORIGINS
+from config import FRONTEND_ORIGINS, JOB_WORKER_IN_PROCESS
 from routes import router
+from core.spotify_client import start_spotify_client, close_spotify_client
+from core.enrichment import close_llm_client
+from core.jobs import run_workers
+from database.indexes import ensure_indexes
 
 class DevToolsFilterMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -13,12 +20,29 @@ class DevToolsFilterMiddleware(BaseHTTPMiddleware):
             return await call_next(request)
         return await call_next(request)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    # Shared, pooled clients live for the whole app lifetime
+    await start_spotify_client()
+    # Without a separate `python worker.py`, the API process runs the job workers itself
+    stop_workers = asyncio.Event()
+    workers = asyncio.create_task(run_workers(stop_workers)) if JOB_WORKER_IN_PROCESS else None
+    yield
+    stop_workers.set()
+    if workers:
+        await workers
+    await close_spotify_client()
+    await close_llm_client()
+
 app = FastAPI(
     title="Spotify Playlist App API",
     description="API for managing Spotify playlists with enhanced features",
     version="1.0.0",
     docs_url="/docs",  # Enable Swagger UI at /docs
-    redoc_url="/redoc"  # Enable ReDoc at /redoc
+    redoc_url="/redoc",  # Enable ReDoc at /redoc
+    default_response_class=ORJSONResponse,  # orjson renders large track pages faster than the stdlib encoder
+    lifespan=lifespan
 )
 
 # Configure CORS
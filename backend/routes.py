@@ -1,14 +1,30 @@
-from core.auth import spotify_user_login, spotify_callback_code, spotify_fetch_and_store_user_playlists
-from database.user_db import db_get_user_details
-from core.tracks import fetch_and_store_liked_songs_tracks, enrich_track, update_playlist_enriched_status
-from core.playlist import fetch_playlist_tracks_background
+from core.auth import spotify_user_login, spotify_callback_code
+from database.user_db import db_get_user_details, db_get_playlists_synced_at
+from database.playlist_db import PLAYLIST_LIST_PROJECTION, PLAYLIST_DETAILS_PROJECTION
+from core.tracks import (
+    enrich_tracks,
+    playlist_tracks_query,
+    get_playlist_track_count,
+    LIKED_SONGS_PLAYLIST_ID
+)
+from database.tracks_db import db_get_playlist_tracks_page
 from config import FRONTEND_URL
-from core.tokens import spotify_token_access_using_refresh
-from database.database import users_collection, playlists_collection, tracks_collection
+from core.tokens import refresh_user_access_token
+from core.enrichment_cache import enrichment_cache_stats
+from core.spotify_scheduler import spotify_scheduler_stats
+from core.artist_index import artist_index_stats
+from core.spotify_artists import spotify_artists_stats
+from core.sync import schedule_sync, run_sync, PLAYLISTS_SYNC_TARGET, SYNC_PRIORITY_INTERACTIVE, SYNC_PRIORITY_BULK
+from core.progress import sync_progress_events
+from core.profiles import get_public_profiles, get_public_profile
+from core.http_cache import cached_json_response, http_cache_stats
+from database.jobs_db import db_get_job, job_summary
+from database.versions_db import db_bump_data_versions, user_scope, playlists_scope, playlist_tracks_scope
+from database.database import users_collection, playlists_collection
 
-from fastapi import APIRouter, Request, BackgroundTasks
-from fastapi.responses import RedirectResponse
-from typing import List
+from fastapi import APIRouter, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -50,44 +66,47 @@ async def spotify_login_callback(code: str):
 
 # Fetching the user details and adding it to database
 @router.get("/me", summary="Get user's Spotify user details", tags=["User"])
-async def spotify_user_details(spotify_user_id: str):
-    try:
-        # Fetch user data from the database
-        user_data = await db_get_user_details(spotify_user_id)
+async def spotify_user_details(request: Request, spotify_user_id: str):
+    async def build():
+        try:
+            # Fetch user data from the database
+            user_data = await db_get_user_details(spotify_user_id)
+        
+            # If no user found, return an error message
+            if not user_data:
+                print("No user data found")
+                return {
+                    "success": False,
+                    "message": "User data not found."
+                }
+        
+            # Convert MongoDB document to dict and include all relevant fields
+            user_dict = {
+                "spotify_user_id": str(user_data.get("spotify_user_id")),
+                "username": user_data.get("username"),
+                "email": user_data.get("email"),
+                "country": user_data.get("country"),
+                "profile_picture": user_data.get("profile_picture"),
+                "created_at": user_data.get("created_at"),
+                "credits": user_data.get("credits", 0),
+                "is_enriched": user_data.get("is_enriched", False)
+            }
         
-        # If no user found, return an error message
-        if not user_data:
-            print("No user data found")
+            return {
+                "success": True,
+                "user_data": user_dict
+            }
+
+        except Exception as e:
+            print(f"Error in /me endpoint: {str(e)}")
             return {
                 "success": False,
-                "message": "User data not found."
+                "message": "An error occurred while fetching user data",
+                "error": str(e)
             }
-        
-        # Convert MongoDB document to dict and include all relevant fields
-        user_dict = {
-            "spotify_user_id": str(user_data.get("spotify_user_id")),
-            "username": user_data.get("username"),
-            "email": user_data.get("email"),
-            "country": user_data.get("country"),
-            "profile_picture": user_data.get("profile_picture"),
-            "created_at": user_data.get("created_at"),
-            "credits": user_data.get("credits", 0),
-            "is_enriched": user_data.get("is_enriched", False)
-        }
-        
-        return {
-            "success": True,
-            "user_data": user_dict
-        }
 
-    except Exception as e:
-        print(f"Error in /me endpoint: {str(e)}")
-        return {
-            "success": False,
-            "message": "An error occurred while fetching user data",
-            "error": str(e)
-        }
-    
+    return await cached_json_response(request, [user_scope(spotify_user_id)], build)
+
 @router.get("/auth/me", summary="Check if user is authenticated", tags=["Authentication"])
 async def get_user_from_cookie(request: Request):
     token = request.cookies.get("access_token")
@@ -107,7 +126,7 @@ async def refresh_access_token(request: Request):
                 "message": "spotify_user_id is required"
             }
             
-        refresh_result = await spotify_token_access_using_refresh(spotify_user_id)
+        refresh_result = await refresh_user_access_token(spotify_user_id)
         
         if refresh_result["success"]:
             return {
@@ -131,53 +150,10 @@ async def refresh_access_token(request: Request):
 
 # Fetching the user's playlist and storing it in the database
 @router.get("/me/playlists", summary="Get user's Spotify playlists", tags=["Playlists"])
-async def spotify_user_playlist_details(spotify_user_id: str, background_tasks: BackgroundTasks):
+async def spotify_user_playlist_details(request: Request, spotify_user_id: str):
     try:
-        # First, get cached playlists from database
-        cached_playlists = await playlists_collection.find({
-            "owner_spotify_id": spotify_user_id
-        }).to_list(length=None)
-
-        # Check if any playlist has zero tracks
-        has_zero_tracks = any(
-            int(playlist.get("playlist_tracks_count", 0)) == 0 
-            for playlist in cached_playlists
-        )
-
-        # If any playlist has zero tracks, force an immediate update
-        if has_zero_tracks:
-            # This will update all playlists including the ones with zero tracks
-            await spotify_fetch_and_store_user_playlists(spotify_user_id)
-            # Get the updated playlists
-            cached_playlists = await playlists_collection.find({
-                "owner_spotify_id": spotify_user_id
-            }).to_list(length=None)
-        else:
-            # Start background task to update playlists if no immediate update needed
-            background_tasks.add_task(spotify_fetch_and_store_user_playlists, spotify_user_id)
-
-        # Convert MongoDB documents to clean dicts with consistent field names
-        playlists_data = []
-        for playlist in cached_playlists:
-            playlists_data.append({
-                "playlist_spotify_id": playlist.get("playlist_spotify_id"),
-                "playlist_name": playlist.get("playlist_name"),
-                "playlist_description": playlist.get("playlist_description"),
-                "playlist_dp": playlist.get("playlist_dp"),
-                "playlist_tracks_count": int(playlist.get("playlist_tracks_count", 0)),
-                "playlist_external_url": playlist.get("external_url_playlist"),
-                "owner_spotify_id": playlist.get("owner_spotify_id"),
-                "is_enriched": bool(playlist.get("is_enriched", False))
-            })
-        
-        # Return data
-        return {
-            "success": True,
-            "message": "Returning playlists data",
-            "details": playlists_data,
-            "is_background_refreshing": not has_zero_tracks  # Only true if we didn't do an immediate update
-        }
-    
+        # Start background update if the last one isn't fresh; the ETag covers the sync state it reports
+        sync = await schedule_sync(spotify_user_id, PLAYLISTS_SYNC_TARGET)
     except Exception as e:
         print(f"Error in playlists endpoint: {str(e)}")
         return {
@@ -186,16 +162,77 @@ async def spotify_user_playlist_details(spotify_user_id: str, background_tasks:
             "details": str(e)
         }
 
+    async def build():
+        try:
+            result = sync
+            # First, get cached playlists from database
+            cached_playlists = await playlists_collection.find(
+                {"owner_spotify_id": spotify_user_id},
+                PLAYLIST_LIST_PROJECTION
+            ).to_list(length=None)
+
+            synced_at = await db_get_playlists_synced_at(spotify_user_id)
+
+            # Stale-while-revalidate: cached rows are served as they are while the scheduled refresh runs.
+            # Only a brand-new user, with nothing cached and no sync yet, waits for the first one.
+            if not cached_playlists and synced_at is None:
+                # Joins the sync scheduled above
+                result = await run_sync(spotify_user_id, PLAYLISTS_SYNC_TARGET)
+                cached_playlists = await playlists_collection.find(
+                    {"owner_spotify_id": spotify_user_id},
+                    PLAYLIST_LIST_PROJECTION
+                ).to_list(length=None)
+                synced_at = await db_get_playlists_synced_at(spotify_user_id)
+
+            # Convert MongoDB documents to clean dicts with consistent field names
+            playlists_data = []
+            for playlist in cached_playlists:
+                playlists_data.append({
+                    "playlist_spotify_id": playlist.get("playlist_spotify_id"),
+                    "playlist_name": playlist.get("playlist_name"),
+                    "playlist_description": playlist.get("playlist_description"),
+                    "playlist_dp": playlist.get("playlist_dp"),
+                    "playlist_tracks_count": int(playlist.get("playlist_tracks_count", 0)),
+                    "playlist_external_url": playlist.get("external_url_playlist"),
+                    "owner_spotify_id": playlist.get("owner_spotify_id"),
+                    "is_enriched": bool(playlist.get("is_enriched", False))
+                })
+        
+            # Return data
+            return {
+                "success": True,
+                "message": "Returning playlists data",
+                "details": playlists_data,
+                "is_background_refreshing": result["status"] in ("started", "joined", "running"),  # Only true if a refresh is queued or running
+                "job_id": result["job_id"],
+                "synced_at": synced_at  # When the rows were last refreshed from Spotify (None: never)
+            }
+    
+        except Exception as e:
+            print(f"Error in playlists endpoint: {str(e)}")
+            return {
+                "success": False,
+                "message": "An error occurred while fetching user playlists",
+                "details": str(e)
+            }
+
+    return await cached_json_response(
+        request, [playlists_scope(spotify_user_id)], build, vary=(sync["status"], sync["job_id"])
+    )
+
 @router.post("/me/liked-songs/fetch", tags=["Tracks"])
-async def fetch_liked_songs_background(background_tasks: BackgroundTasks, spotify_user_id: str):
+async def fetch_liked_songs_background(spotify_user_id: str):
     """Endpoint to trigger background fetching of liked songs."""
     try:
-        # Add the fetch_and_store_liked_songs_tracks function to background tasks
-        background_tasks.add_task(fetch_and_store_liked_songs_tracks, spotify_user_id)
+        # Explicit request: skip the freshness check but join a sync that is already running
+        sync = await schedule_sync(
+            spotify_user_id, LIKED_SONGS_PLAYLIST_ID, force=True, priority=SYNC_PRIORITY_INTERACTIVE
+        )
         
         return {
             "success": True,
-            "message": "Started fetching liked songs in the background"
+            "message": "Started fetching liked songs in the background" if sync["status"] == "started" else "Liked songs are already being fetched",
+            "job_id": sync["job_id"]
         }
     except Exception as e:
         return {
@@ -206,30 +243,25 @@ async def fetch_liked_songs_background(background_tasks: BackgroundTasks, spotif
 
 @router.post("/me/playlists/{playlist_id}/fetch-tracks", tags=["Tracks"])
 async def fetch_playlist_tracks_background_endpoint(
-    background_tasks: BackgroundTasks, 
     spotify_user_id: str, 
     playlist_id: str
 ):
     try:
-        # Get user's access token
-        user = await users_collection.find_one({"spotify_user_id": spotify_user_id})
+        # The user must exist; nothing else on the document is needed
+        user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"_id": 1})
         if not user:
             return {
                 "success": False,
                 "message": "User not found"
             }
         
-        # Add the fetch_playlist_tracks_background function to background tasks
-        background_tasks.add_task(
-            fetch_playlist_tracks_background,
-            spotify_user_id,
-            playlist_id,
-            user["access_token"]
-        )
+        # Explicit request: skip the freshness check but join a sync that is already running
+        sync = await schedule_sync(spotify_user_id, playlist_id, force=True, priority=SYNC_PRIORITY_INTERACTIVE)
         
         return {
             "success": True,
-            "message": f"Started fetching tracks for playlist {playlist_id} in the background"
+            "message": f"Started fetching tracks for playlist {playlist_id} in the background" if sync["status"] == "started" else f"Tracks for playlist {playlist_id} are already being fetched",
+            "job_id": sync["job_id"]
         }
     except Exception as e:
         return {
@@ -240,12 +272,11 @@ async def fetch_playlist_tracks_background_endpoint(
 
 @router.post("/me/playlists/fetch-all-tracks", tags=["Tracks"])
 async def fetch_all_playlists_tracks_background(
-    background_tasks: BackgroundTasks, 
     spotify_user_id: str
 ):
     try:
-        # Get user's access token
-        user = await users_collection.find_one({"spotify_user_id": spotify_user_id})
+        # The user must exist; nothing else on the document is needed
+        user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"_id": 1})
         if not user:
             return {
                 "success": False,
@@ -254,22 +285,24 @@ async def fetch_all_playlists_tracks_background(
 
         # Get all playlists for the user
         playlists = await playlists_collection.find(
-            {"owner_spotify_id": spotify_user_id}
+            {"owner_spotify_id": spotify_user_id},
+            {"playlist_spotify_id": 1}
         ).to_list(length=None)
 
-        # Add background tasks for each playlist
+        # Start a background sync for each playlist that isn't already running or fresh
+        started = 0
+        job_ids = {}
         for playlist in playlists:
-            playlist_id = playlist["playlist_spotify_id"]
-            background_tasks.add_task(
-                fetch_playlist_tracks_background,
-                spotify_user_id,
-                playlist_id,
-                user["access_token"]
-            )
+            sync = await schedule_sync(spotify_user_id, playlist["playlist_spotify_id"], priority=SYNC_PRIORITY_BULK)
+            if sync["status"] == "started":
+                started += 1
+            if sync["status"] != "fresh":
+                job_ids[playlist["playlist_spotify_id"]] = sync["job_id"]
 
         return {
             "success": True,
-            "message": f"Started fetching tracks for {len(playlists)} playlists in the background"
+            "message": f"Started fetching tracks for {started} of {len(playlists)} playlists in the background",
+            "job_ids": job_ids
         }
     except Exception as e:
         return {
@@ -280,126 +313,150 @@ async def fetch_all_playlists_tracks_background(
 
 @router.get("/me/playlists/{playlist_id}/tracks/details", tags=["Tracks"])
 async def get_playlist_tracks_details(
+    request: Request,
     playlist_id: str, 
     spotify_user_id: str,
-    background_tasks: BackgroundTasks,
     offset: int = 0, 
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
-    """Get detailed track information for a playlist, including enhancement status."""
+    """Get detailed track information for a playlist, including enhancement status.
+
+    Pass the previous page's next_cursor as `cursor` to page in a stable order; offset is still accepted.
+    """
     try:
-        # Get user's credits and access token
-        user = await users_collection.find_one({"spotify_user_id": spotify_user_id})
-        if not user:
-            return {
-                "success": False,
-                "message": "User not found"
-            }
+        # Start background refresh of tracks, at most once per freshness TTL; the ETag covers the sync state it reports
+        sync = await schedule_sync(spotify_user_id, playlist_id)
+    except Exception as e:
+        return {
+            "success": False,
+            "message": "Failed to fetch playlist tracks",
+            "details": str(e)
+        }
+
+    async def build():
+        try:
+            # Get user's credits
+            user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"credits": 1})
+            if not user:
+                return {
+                    "success": False,
+                    "message": "User not found"
+                }
+        
+            user_credits = user.get("credits", 0)
         
-        user_credits = user.get("credits", 0)
+            # Get total count first (cached counter, not a count per page)
+            total_tracks = await get_playlist_track_count(playlist_id, spotify_user_id)
+        
+            # If no tracks found, trigger the background fetch (or join the one already running)
+            if total_tracks == 0:
+                # Nothing stored yet: the user is waiting on this sync
+                fetching = await schedule_sync(spotify_user_id, playlist_id, priority=SYNC_PRIORITY_INTERACTIVE)
+            
+                return {
+                    "success": True,
+                    "data": {
+                        "tracks": [],
+                        "user_credits": user_credits,
+                        "is_playlist_enriched": False,
+                        "total_tracks": 0,
+                        "offset": offset,
+                        "limit": limit,
+                        "has_more": False,
+                        "next_cursor": None,
+                        "is_fetching": True,  # New flag to indicate tracks are being fetched
+                        "job_id": fetching["job_id"]
+                    }
+                }
         
-        # Get total count first
-        total_tracks = await tracks_collection.count_documents({
-            "playlist_spotify_id": playlist_id
-        })
+            # Get paginated tracks for the playlist in Spotify order (liked songs: most recently stored document first,
+            # which is not the user's own liked order since the documents are shared)
+            try:
+                page = await db_get_playlist_tracks_page(
+                    playlist_tracks_query(playlist_id, spotify_user_id),
+                    limit,
+                    cursor=cursor,
+                    offset=offset,
+                    by_position=playlist_id != LIKED_SONGS_PLAYLIST_ID
+                )
+            except ValueError as e:
+                return {
+                    "success": False,
+                    "message": str(e)
+                }
+            tracks = page["tracks"]
         
-        # If no tracks found, trigger the background fetch
-        if total_tracks == 0:
-            # Add the fetch_playlist_tracks_background function to background tasks
-            background_tasks.add_task(
-                fetch_playlist_tracks_background,
-                spotify_user_id,
-                playlist_id,
-                user["access_token"]
+            # Get playlist details
+            playlist = await playlists_collection.find_one({
+                "playlist_spotify_id": playlist_id,
+                "owner_spotify_id": spotify_user_id
+            }, {"is_enriched": 1})
+        
+            if not playlist:
+                return {
+                    "success": False,
+                    "message": "Playlist not found"
+                }
+        
+            # Resolve every contributor on the page at once (cached public profiles, one query for the rest)
+            contributors = await get_public_profiles(
+                track["contributor"] for track in tracks if track.get("contributor")
             )
+
+            # Transform tracks data
+            tracks_data = []
+            for track in tracks:
+                contributor_data = contributors.get(track.get("contributor")) if track.get("contributor") else None
             
+                tracks_data.append({
+                    "track_id": track["track_spotify_id"],
+                    "name": track["track_name"],
+                    "artists": track["track_artists"],
+                    "album_name": track["track_album_name"],
+                    "album_image": track["track_album_img"],
+                    "external_url": track["track_external_url"],
+                    "preview_url": track["track_preview_url"],
+                    "genre": track["track_genre"] if track.get("is_enriched") else [],
+                    "language": track["track_language"] if track.get("is_enriched") else "",
+                    "duration_ms": track["track_duration_ms"],
+                    "is_enriched": track.get("is_enriched", False),
+                    "contributor": contributor_data
+                })
+        
             return {
                 "success": True,
                 "data": {
-                    "tracks": [],
+                    "tracks": tracks_data,
                     "user_credits": user_credits,
-                    "is_playlist_enriched": False,
-                    "total_tracks": 0,
+                    "is_playlist_enriched": playlist.get("is_enriched", False),
+                    "total_tracks": total_tracks,
                     "offset": offset,
                     "limit": limit,
-                    "has_more": False,
-                    "is_fetching": True  # New flag to indicate tracks are being fetched
+                    "has_more": page["has_more"],
+                    "next_cursor": page["next_cursor"],
+                    "is_fetching": False,
+                    "is_background_refreshing": sync["status"] != "fresh",
+                    "job_id": sync["job_id"]
                 }
             }
-        
-        # Get paginated tracks for the playlist
-        tracks = await tracks_collection.find({
-            "playlist_spotify_id": playlist_id
-        }).skip(offset).limit(limit).to_list(length=None)
-        
-        # Get playlist details
-        playlist = await playlists_collection.find_one({
-            "playlist_spotify_id": playlist_id
-        })
-        
-        if not playlist:
+        except Exception as e:
             return {
                 "success": False,
-                "message": "Playlist not found"
-            }
-        
-        # Transform tracks data and fetch contributor details
-        tracks_data = []
-        for track in tracks:
-            contributor_data = None
-            if track.get("contributor"):
-                contributor = await users_collection.find_one({"spotify_user_id": track["contributor"]})
-                if contributor:
-                    contributor_data = {
-                        "spotify_user_id": contributor["spotify_user_id"],
-                        "username": contributor.get("username"),
-                        "profile_picture": contributor.get("profile_picture"),
-                        "external_url": contributor.get("external_url")
-                    }
-            
-            tracks_data.append({
-                "track_id": track["track_spotify_id"],
-                "name": track["track_name"],
-                "artists": track["track_artists"],
-                "album_name": track["track_album_name"],
-                "album_image": track["track_album_img"],
-                "external_url": track["track_external_url"],
-                "preview_url": track["track_preview_url"],
-                "genre": track["track_genre"] if track.get("is_enriched") else [],
-                "language": track["track_language"] if track.get("is_enriched") else "",
-                "duration_ms": track["track_duration_ms"],
-                "is_enriched": track.get("is_enriched", False),
-                "contributor": contributor_data
-            })
-        
-        # Start background refresh of tracks
-        background_tasks.add_task(
-            fetch_playlist_tracks_background,
-            spotify_user_id,
-            playlist_id,
-            user["access_token"]
-        )
-        
-        return {
-            "success": True,
-            "data": {
-                "tracks": tracks_data,
-                "user_credits": user_credits,
-                "is_playlist_enriched": playlist.get("is_enriched", False),
-                "total_tracks": total_tracks,
-                "offset": offset,
-                "limit": limit,
-                "has_more": offset + limit < total_tracks,
-                "is_fetching": False,
-                "is_background_refreshing": True
+                "message": "Failed to fetch playlist tracks",
+                "details": str(e)
             }
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "message": "Failed to fetch playlist tracks",
-            "details": str(e)
-        }
+
+    return await cached_json_response(
+        request,
+        [
+            user_scope(spotify_user_id),
+            playlists_scope(spotify_user_id),
+            playlist_tracks_scope(playlist_id, spotify_user_id)
+        ],
+        build,
+        vary=(sync["status"], sync["job_id"])
+    )
 
 @router.post("/me/playlists/{playlist_id}/enhance", tags=["Enhancement"])
 async def enhance_playlist_tracks(
@@ -409,7 +466,7 @@ async def enhance_playlist_tracks(
 ):
     try:
         # Get user's credits
-        user = await users_collection.find_one({"spotify_user_id": spotify_user_id})
+        user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"credits": 1})
         if not user:
             return {
                 "success": False,
@@ -426,11 +483,11 @@ async def enhance_playlist_tracks(
                 "message": f"Not enough credits. Need {credits_needed} credits but have {user.get('credits', 0)}"
             }
         
-        # Enhance tracks
+        # Enhance tracks concurrently through the enrichment worker pool
         enriched_count = 0
         errors = []
-        for track_id in track_ids:
-            result = await enrich_track(track_id, spotify_user_id)
+        results = await enrich_tracks(track_ids, spotify_user_id, playlist_id)
+        for track_id, result in zip(track_ids, results):
             if result["success"]:
                 enriched_count += 1
             else:
@@ -445,9 +502,7 @@ async def enhance_playlist_tracks(
                 {"spotify_user_id": spotify_user_id},
                 {"$inc": {"credits": -credits_needed}}
             )
-            
-            # Update playlist enrichment status
-            await update_playlist_enriched_status(playlist_id)
+            await db_bump_data_versions([user_scope(spotify_user_id)])
         
         return {
             "success": True,
@@ -466,61 +521,109 @@ async def enhance_playlist_tracks(
         }
 
 @router.get("/me/playlists/{playlist_id}", tags=["Playlists"])
-async def get_playlist_details(playlist_id: str, spotify_user_id: str):
+async def get_playlist_details(request: Request, playlist_id: str, spotify_user_id: str):
     """Get details for a single playlist."""
-    try:
-        playlist = await playlists_collection.find_one({
-            "playlist_spotify_id": playlist_id,
-            "owner_spotify_id": spotify_user_id
-        })
+    async def build():
+        try:
+            playlist = await playlists_collection.find_one({
+                "playlist_spotify_id": playlist_id,
+                "owner_spotify_id": spotify_user_id
+            }, PLAYLIST_DETAILS_PROJECTION)
+        
+            if not playlist:
+                return {
+                    "success": False,
+                    "message": "Playlist not found"
+                }
+        
+            # Convert MongoDB ObjectId to string
+            playlist["_id"] = str(playlist["_id"])
         
-        if not playlist:
+            return {
+                "success": True,
+                "data": playlist
+            }
+        except Exception as e:
             return {
                 "success": False,
-                "message": "Playlist not found"
+                "message": "Failed to fetch playlist details",
+                "details": str(e)
+            }
+
+    return await cached_json_response(request, [playlists_scope(spotify_user_id)], build)
+
+@router.get("/users/{spotify_user_id}/profile", tags=["User"])
+async def get_user_profile(spotify_user_id: str):
+    """Get user profile information for display in the contributor section."""
+    try:
+        profile_data = await get_public_profile(spotify_user_id)
+        if not profile_data:
+            return {
+                "success": False,
+                "message": "User not found"
             }
-        
-        # Convert MongoDB ObjectId to string
-        playlist["_id"] = str(playlist["_id"])
         
         return {
             "success": True,
-            "data": playlist
+            "data": profile_data
         }
     except Exception as e:
+        print(f"Error in get_user_profile endpoint: {str(e)}")
         return {
             "success": False,
-            "message": "Failed to fetch playlist details",
+            "message": "Failed to fetch user profile",
             "details": str(e)
         }
 
-@router.get("/users/{spotify_user_id}/profile", tags=["User"])
-async def get_user_profile(spotify_user_id: str):
-    """Get user profile information for display in the contributor section."""
+@router.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_job_status(job_id: str, spotify_user_id: str):
+    """Status, attempts and progress of a background job started for this user."""
     try:
-        user = await users_collection.find_one({"spotify_user_id": spotify_user_id})
-        if not user:
+        job = await db_get_job(job_id)
+        if not job or job.get("payload", {}).get("spotify_user_id") != spotify_user_id:
             return {
                 "success": False,
-                "message": "User not found"
+                "message": "Job not found"
             }
-        
-        # Convert MongoDB document to a clean dict with only needed fields
-        profile_data = {
-            "username": user.get("username"),
-            "profile_picture": user.get("profile_picture"),
-            "external_url": user.get("user_external_url"),
-            "country": user.get("country")
-        }
-        
+
         return {
             "success": True,
-            "data": profile_data
+            "message": "Returning job status",
+            "details": job_summary(job)
         }
     except Exception as e:
-        print(f"Error in get_user_profile endpoint: {str(e)}")
         return {
             "success": False,
-            "message": "Failed to fetch user profile",
+            "message": "Failed to get job status",
             "details": str(e)
         }
+
+@router.get("/me/sync-progress/stream", tags=["Jobs"])
+async def stream_sync_progress(request: Request, spotify_user_id: str):
+    """Server-Sent Events: a `progress` event per playlist whenever its sync or enrichment progresses."""
+    user = await users_collection.find_one({"spotify_user_id": spotify_user_id}, {"_id": 1})
+    if not user:
+        return {
+            "success": False,
+            "message": "User not found"
+        }
+
+    return StreamingResponse(
+        sync_progress_events(spotify_user_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/metrics", tags=["Metrics"])
+async def get_metrics():
+    """Internal counters for the caches and schedulers running in this process."""
+    return {
+        "success": True,
+        "data": {
+            "enrichment_cache": enrichment_cache_stats(),
+            "spotify_scheduler": spotify_scheduler_stats(),
+            "http_cache": http_cache_stats(),
+            "artist_index": artist_index_stats(),
+            "spotify_artists": spotify_artists_stats()
+        }
+    }
@@ -0,0 +1,68 @@
+"""Compare the track list read with and without TRACK_LIST_PROJECTION, and the stdlib
+JSON path (jsonable_encoder + json.dumps) with orjson, on the largest stored playlists.
+
+    cd backend && python -m scripts.benchmark_reads --playlists 5 --repeat 10
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import bson
+from fastapi.encoders import jsonable_encoder
+
+from database.database import playlists_collection, tracks_collection
+from database.tracks_db import TRACK_LIST_PROJECTION
+from core.http_cache import dumps
+
+async def _largest_playlists(count):
+    return await playlists_collection.find(
+        {"playlist_spotify_id": {"$ne": "liked_songs"}, "tracks_total": {"$gt": 0}},
+        {"_id": 0, "playlist_spotify_id": 1, "playlist_name": 1, "tracks_total": 1}
+    ).sort("tracks_total", -1).limit(count).to_list(length=None)
+
+async def _timed_read(playlist_id, projection, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        tracks = await tracks_collection.find({"playlist_spotify_id": playlist_id}, projection).to_list(length=None)
+    elapsed = (time.perf_counter() - started) / repeat
+    return tracks, elapsed, sum(len(bson.encode(track)) for track in tracks)
+
+def _timed(serialize, payload, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = serialize(payload)
+    return (time.perf_counter() - started) / repeat, len(body)
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f}ms"
+
+async def _main(playlists, repeat):
+    rows = await _largest_playlists(playlists)
+    if not rows:
+        print("No synced playlists to benchmark")
+        return False
+
+    for row in rows:
+        playlist_id = row["playlist_spotify_id"]
+        full, full_time, full_bytes = await _timed_read(playlist_id, None, repeat)
+        projected, projected_time, projected_bytes = await _timed_read(playlist_id, TRACK_LIST_PROJECTION, repeat)
+        payload = {"success": True, "data": {"tracks": projected}}
+        stdlib_time, stdlib_size = _timed(lambda p: json.dumps(jsonable_encoder(p, custom_encoder={bson.ObjectId: str})).encode(), payload, repeat)
+        orjson_time, orjson_size = _timed(dumps, payload, repeat)
+
+        print(f"{row.get('playlist_name')} ({playlist_id}, {len(full)} tracks)")
+        print(f"  read       full {full_bytes / 1024:.0f}KiB in {_ms(full_time)}"
+              f" -> projected {projected_bytes / 1024:.0f}KiB in {_ms(projected_time)}"
+              f" ({100 - 100 * projected_bytes / max(full_bytes, 1):.0f}% fewer bytes)")
+        print(f"  serialize  stdlib {_ms(stdlib_time)} ({stdlib_size / 1024:.0f}KiB)"
+              f" -> orjson {_ms(orjson_time)} ({orjson_size / 1024:.0f}KiB)"
+              f" ({stdlib_time / max(orjson_time, 1e-9):.1f}x faster)")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark projected track reads and orjson serialization")
+    parser.add_argument("--playlists", type=int, default=5, help="benchmark the N playlists with the most stored tracks")
+    parser.add_argument("--repeat", type=int, default=10, help="runs averaged per measurement")
+    args = parser.parse_args()
+    asyncio.run(_main(args.playlists, args.repeat))
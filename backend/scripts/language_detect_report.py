@@ -0,0 +1,73 @@
+"""Check the offline script-based language detector against tracks the model already enriched.
+
+Reports, per script, how often the detector is confident enough to skip the model
+(the share of language calls avoided at ingest) and how often it agrees with the
+model's stored language.
+
+    cd backend && python -m scripts.language_detect_report --limit 50000
+"""
+import argparse
+import asyncio
+
+from config import LANGUAGE_DETECT_MIN_CONFIDENCE
+from database.database import tracks_collection
+from core.language_detect import detect_language, detect_track_language, same_language, LANGUAGE_SOURCE_SCRIPT
+
+async def _main(limit, min_confidence, samples):
+    query = {"is_enriched": True, "track_language": {"$nin": [None, ""]}, "language_source": {"$ne": LANGUAGE_SOURCE_SCRIPT}}
+    projection = {"_id": 0, "track_spotify_id": 1, "track_name": 1, "track_album_name": 1, "track_language": 1}
+    cursor = tracks_collection.find(query, projection)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    seen = set()
+    total = 0
+    by_script = {}  # script -> {"tracks", "confident", "correct"}
+    mismatches = []
+    async for track in cursor:
+        # Every copy of a track carries the same enrichment; count each track once
+        if track["track_spotify_id"] in seen:
+            continue
+        seen.add(track["track_spotify_id"])
+        total += 1
+
+        detected = detect_language(track.get("track_name"), track.get("track_album_name"))
+        script = detected["script"] if detected else "Latin/none"
+        stats = by_script.setdefault(script, {"tracks": 0, "confident": 0, "correct": 0})
+        stats["tracks"] += 1
+        if not detect_track_language(track, min_confidence):
+            continue
+        stats["confident"] += 1
+        if same_language(detected["language"], track["track_language"]):
+            stats["correct"] += 1
+        elif len(mismatches) < samples:
+            mismatches.append((track.get("track_name"), detected["language"], track["track_language"]))
+
+    if not total:
+        print("No model-enriched tracks to compare against")
+        return
+
+    confident = sum(stats["confident"] for stats in by_script.values())
+    correct = sum(stats["correct"] for stats in by_script.values())
+    print(f"{total} enriched tracks, confidence threshold {min_confidence}")
+    print(f"Model calls avoided: {confident} ({100 * confident / total:.1f}%)")
+    print(f"Accuracy when confident: {correct}/{confident} ({100 * correct / max(confident, 1):.1f}%)")
+    print()
+    print(f"{'script':<12} {'tracks':>8} {'confident':>10} {'accuracy':>9}")
+    for script, stats in sorted(by_script.items(), key=lambda item: -item[1]["tracks"]):
+        accuracy = f"{100 * stats['correct'] / stats['confident']:.1f}%" if stats["confident"] else "-"
+        print(f"{script:<12} {stats['tracks']:>8} {stats['confident']:>10} {accuracy:>9}")
+
+    if mismatches:
+        print()
+        print("Disagreements (track, detected, model):")
+        for track_name, detected_language, model_language in mismatches:
+            print(f"  {track_name!r}: {detected_language} vs {model_language}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy and coverage of script-based language detection")
+    parser.add_argument("--limit", type=int, default=0, help="enriched track documents to scan (0: all)")
+    parser.add_argument("--min-confidence", type=float, default=LANGUAGE_DETECT_MIN_CONFIDENCE, help="confidence needed to skip the model")
+    parser.add_argument("--samples", type=int, default=20, help="disagreements to print")
+    args = parser.parse_args()
+    asyncio.run(_main(args.limit, args.min_confidence, args.samples))
@@ -0,0 +1,60 @@
+"""Background job worker: python worker.py [--concurrency N]
+
+Runs the sync jobs queued by the API. Any number of worker processes can share
+the queue; SIGINT/SIGTERM stop claiming new jobs and let running ones finish.
+`python worker.py --repair-counters [--user ID]` queues a recount of the
+playlist track counters and exits; `--rebuild-artist-index` queues a rebuild of
+the artist genre index from the enriched tracks.
+"""
+import argparse
+import asyncio
+import signal
+
+from config import JOB_WORKER_CONCURRENCY
+from core.jobs import run_workers, enqueue_job
+from core.job_handlers import REPAIR_PLAYLIST_COUNTERS_JOB, REBUILD_ARTIST_INDEX_JOB
+from core.spotify_client import start_spotify_client, close_spotify_client
+from core.enrichment import close_llm_client
+from database.indexes import ensure_indexes
+
+async def main(concurrency):
+    await ensure_indexes()
+    await start_spotify_client()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(f"Worker running {concurrency} concurrent jobs")
+    try:
+        await run_workers(stop, concurrency)
+    finally:
+        await close_spotify_client()
+        await close_llm_client()
+
+async def queue_counter_repair(spotify_user_id):
+    queued = await enqueue_job(
+        REPAIR_PLAYLIST_COUNTERS_JOB,
+        {"spotify_user_id": spotify_user_id},
+        dedup_key=f"{REPAIR_PLAYLIST_COUNTERS_JOB}:{spotify_user_id or '*'}"
+    )
+    print(queued["message"], queued["details"])
+
+async def queue_artist_index_rebuild():
+    queued = await enqueue_job(REBUILD_ARTIST_INDEX_JOB, {}, dedup_key=REBUILD_ARTIST_INDEX_JOB)
+    print(queued["message"], queued["details"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background sync jobs")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY, help="jobs run at the same time")
+    parser.add_argument("--repair-counters", action="store_true", help="queue a playlist counter recount and exit")
+    parser.add_argument("--user", default=None, help="limit --repair-counters to one spotify_user_id")
+    parser.add_argument("--rebuild-artist-index", action="store_true", help="queue an artist genre index rebuild and exit")
+    args = parser.parse_args()
+    if args.repair_counters:
+        asyncio.run(queue_counter_repair(args.user))
+    elif args.rebuild_artist_index:
+        asyncio.run(queue_artist_index_rebuild())
+    else:
+        asyncio.run(main(args.concurrency))
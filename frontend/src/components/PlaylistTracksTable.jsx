@@ -13,7 +13,7 @@ const PlaylistTracksTable = ({ playlistId, onEnhanceClick }) => {
   const [selectedTracks, setSelectedTracks] = useState([]);
   const [userCredits, setUserCredits] = useState(0);
   const [hasMore, setHasMore] = useState(true);
-  const [offset, setOffset] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isFetching, setIsFetching] = useState(false);
   const [contributorProfiles, setContributorProfiles] = useState({});
   const { user } = useAuth();
@@ -77,32 +77,40 @@ const PlaylistTracksTable = ({ playlistId, onEnhanceClick }) => {
   );
 
   const fetchTracks = useCallback(
-    async (currentOffset = 0, append = false) => {
+    async (cursor = null, append = false) => {
       try {
         const loadingState = append ? setLoadingMore : setLoading;
         loadingState(true);
 
         const response = await api.get(
-          `/me/playlists/${playlistId}/tracks/details?spotify_user_id=${user.spotify_user_id}&offset=${currentOffset}&limit=${TRACKS_PER_PAGE}`
+          `/me/playlists/${playlistId}/tracks/details?spotify_user_id=${user.spotify_user_id}&limit=${TRACKS_PER_PAGE}` +
+            (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "")
         );
 
         if (response.data.success) {
-          const newTracks = response.data.data.tracks;
+          // Contributor profiles come embedded in the page; keep the id on the track and seed the profile map
+          const embeddedProfiles = {};
+          const newTracks = response.data.data.tracks.map((track) => {
+            if (track.contributor?.spotify_user_id) {
+              embeddedProfiles[track.contributor.spotify_user_id] = track.contributor;
+              return { ...track, contributor: track.contributor.spotify_user_id };
+            }
+            return track;
+          });
+          setContributorProfiles((prev) => ({ ...prev, ...embeddedProfiles }));
           setTracks((prev) => (append ? [...prev, ...newTracks] : newTracks));
           setUserCredits(response.data.data.user_credits);
           setHasMore(response.data.data.has_more);
-          setOffset(currentOffset + TRACKS_PER_PAGE);
+          setNextCursor(response.data.data.next_cursor);
 
-          // Fetch missing contributor profiles
-          fetchMissingContributorProfiles(newTracks);
+          // Fetch profiles the page didn't embed (e.g. contributors that no longer exist)
+          fetchMissingContributorProfiles(
+            newTracks.filter((track) => !embeddedProfiles[track.contributor])
+          );
 
-          // If tracks are being fetched in the background, start polling
+          // If tracks are being fetched in the background, wait for the progress stream to report it done
           if (response.data.data.is_fetching) {
             setIsFetching(true);
-            // Poll every 3 seconds until we get some tracks
-            setTimeout(() => {
-              fetchTracks(0, false);
-            }, 3000);
           } else {
             setIsFetching(false);
           }
@@ -121,13 +129,37 @@ const PlaylistTracksTable = ({ playlistId, onEnhanceClick }) => {
 
   useEffect(() => {
     if (user?.spotify_user_id && playlistId) {
-      fetchTracks(0, false);
+      fetchTracks(null, false);
     }
   }, [playlistId, user, fetchTracks]);
 
+  // Reload once the background fetch for this playlist finishes, instead of polling
+  useEffect(() => {
+    if (!isFetching || !user?.spotify_user_id) {
+      return undefined;
+    }
+
+    const source = new EventSource(
+      `${import.meta.env.VITE_BACKEND_URL}/me/sync-progress/stream?spotify_user_id=${user.spotify_user_id}`,
+      { withCredentials: true }
+    );
+    source.addEventListener("progress", (event) => {
+      const progress = JSON.parse(event.data);
+      if (
+        progress.playlist_spotify_id === playlistId &&
+        (progress.stage === "done" || progress.stage === "failed")
+      ) {
+        source.close();
+        fetchTracks(null, false);
+      }
+    });
+
+    return () => source.close();
+  }, [isFetching, playlistId, user, fetchTracks]);
+
   const handleLoadMore = () => {
     if (!loadingMore && hasMore) {
-      fetchTracks(offset, true);
+      fetchTracks(nextCursor, true);
     }
   };
 
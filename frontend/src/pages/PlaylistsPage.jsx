@@ -10,10 +10,23 @@ const pageVariants = {
   exit: { opacity: 0, y: -20 },
 };
 
+// synced_at is a naive UTC timestamp from the backend
+const formatSyncedAt = (syncedAt) => {
+  const minutes = Math.floor(
+    (Date.now() - new Date(`${syncedAt}Z`).getTime()) / 60000
+  );
+  if (minutes < 1) return "just now";
+  if (minutes < 60) return `${minutes} min ago`;
+  const hours = Math.floor(minutes / 60);
+  if (hours < 24) return `${hours} h ago`;
+  return `${Math.floor(hours / 24)} d ago`;
+};
+
 export default function PlaylistsPage() {
   const [playlists, setPlaylists] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [syncedAt, setSyncedAt] = useState(null);
   const { user } = useAuth();
 
   useEffect(() => {
@@ -45,6 +58,7 @@ export default function PlaylistsPage() {
 
           const transformedPlaylists = response.data.details; // Data is already transformed by backend
           setPlaylists(transformedPlaylists);
+          setSyncedAt(response.data.synced_at);
         } else {
           console.error(
             "PlaylistsPage: Error in response:",
@@ -151,6 +165,11 @@ export default function PlaylistsPage() {
             <p className="text-[var(--text-secondary)] text-lg">
               Discover and manage your music collection
             </p>
+            {syncedAt && (
+              <p className="text-[var(--text-secondary)] text-sm mt-[var(--spacing-sm)]">
+                Last synced with Spotify {formatSyncedAt(syncedAt)}
+              </p>
+            )}
           </motion.div>
         </div>
       </div>